@@ -1,4 +1,5 @@
-from datagenerator.requestgenerator import overpass_handler
+from datagenerator.requestgenerator import overpass_handler, seed_builder
+from datagenerator.emitter import benchmark, exporter
 import sys
 import argparse
 
@@ -6,32 +7,114 @@ if __name__ == "__main__":
     # Define an argument parser and the options it takes
     # Including the help options that will be printed when using <-h>
     arguments = sys.argv[1:]
-    parser = argparse.ArgumentParser()
+    if arguments[:1] == ['seeds']:
+        seed_builder.main(arguments[1:])
+        sys.exit()
+    if arguments[:1] == ['bench']:
+        benchmark.main(arguments[1:])
+        sys.exit()
+    if arguments[:1] == ['export']:
+        exporter.main(arguments[1:])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(epilog='Build seed files for other areas with: seeds build -h, export requests '
+                                            'to files with: export -h, benchmark the generator with: bench -h')
     parser.add_argument('-i', '--ifile', help='specify file to load coordinate-seeds from')
-    parser.add_argument('-b', '--broker', help='specify ip address of the broker')
-    parser.add_argument('-t', '--topic', help='set the topic to which the travel requests are published')
+    parser.add_argument('-b', '--broker', help='specify ip address of the broker, or a comma separated list of '
+                                               'host[:port] to spread the requests over several brokers')
+    parser.add_argument('-t', '--topic', help='set the topic to which the travel requests are published. It may '
+                                              'contain {cell}, {transportation}, {purpose} and {device}')
+    parser.add_argument('--shard_by', choices=['topic', 'cell', 'transportation', 'purpose', 'device'],
+                        help='field that selects the broker of a request when there are several. Default=topic')
+    parser.add_argument('--cell_size', metavar='DEGREES', type=float,
+                        help='edge length of the grid cells used for {cell} in the topic. Default=0.05 degrees')
     parser.add_argument('-c', '--client', help='set a name for the mqtt client')
     parser.add_argument('-d', '--device', help='set the device ID for this data generator [int]', type=int)
     parser.add_argument('-p', '--print', help='print all produced json-messages', action='store_true')
+    parser.add_argument('-P', '--pretty', help='publish and log indented json instead of compact json',
+                        action='store_true')
     parser.add_argument('-s', '--sleep', help='set the time (in seconds) the emitter sleeps between publishing '
                                               'two consecutive requests[float]', type=float)
+    parser.add_argument('--rate', metavar='PROFILE',
+                        help='publish at a target rate instead of sleeping between messages: messages per second '
+                             '(e.g. 100), step:10@0,50@60 (rate@seconds), ramp:10:200:300 (from:to:seconds) '
+                             'or sine:100:80[:86400] (mean:amplitude:period, lowest at 3 am)')
+    parser.add_argument('--simulate', metavar='TIME',
+                        help='issue the requests on a simulated clock starting at TIME (epoch seconds or '
+                             '"YYYY-MM-DD HH:MM:SS") as fast as possible, advancing by SLEEP or following RATE')
+    parser.add_argument('--until', metavar='TIME',
+                        help='end of the simulated period. Default=now')
+    parser.add_argument('--metrics', metavar='[HOST:]PORT',
+                        help='serve counters, latency histograms and rates in the Prometheus text format on '
+                             'http://HOST:PORT/metrics (HOST defaults to 127.0.0.1, workers use PORT+N)')
+    parser.add_argument('--stats_interval', metavar='SECONDS', type=float,
+                        help='print a line with the metrics every SECONDS. Default=10 if METRICS is given')
+    parser.add_argument('--workers', metavar='N', type=int,
+                        help='create and publish requests from N processes with separate clients, logfiles '
+                             'and striped request ids [int]')
+    parser.add_argument('--seed', type=int,
+                        help='draw every request from random numbers keyed on SEED, the device and its id, to make '
+                             'the generated requests reproducible [int]')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='create batches of requests in a background thread while asyncio tasks publish them')
+    parser.add_argument('--batch', metavar='N', type=int,
+                        help='number of requests created at once in asynchronous mode. Default=100')
+    parser.add_argument('--publishers', metavar='N', type=int,
+                        help='number of asyncio tasks publishing the created batches. Default=2')
+    parser.add_argument('--qos', type=int, choices=[0, 1, 2], help='MQTT quality of service level. Default=0')
+    parser.add_argument('--max_inflight', metavar='N', type=int,
+                        help='number of QoS 1/2 messages that may wait for their acknowledgement. Default=20')
+    parser.add_argument('--max_pending', metavar='N', type=int,
+                        help='number of messages that may wait to be sent before publishing blocks. Default=1000')
+    parser.add_argument('--shed', action='store_true',
+                        help='drop new messages instead of blocking while MAX_PENDING messages are waiting')
     parser.add_argument('-o', '--offset', help='set the uncertainty of coordinate seeds in meters [float]', type=float)
     parser.add_argument('-l', '--limit', help='limit the number of coordinate seeds used by this data generator',
                         type=int)
+    parser.add_argument('--trip_length', metavar='DISTRIBUTION',
+                        help='pick destinations at a distance from the origin following uniform:MIN:MAX, exp:MEAN '
+                             'or lognormal:MEDIAN[:SIGMA] (meters) instead of independently of the origin')
+    parser.add_argument('--weights', metavar='RULE', action='append',
+                        help='pick busy seeds more often, weighted by density:RADIUS (seeds within RADIUS meters), '
+                             'property:KEY[:count|:VALUE=WEIGHT,...] or csv:FILE[:DEFAULT] (rows of name or ref '
+                             'and weight). Several rules are multiplied')
     parser.add_argument('-f', '--filename', help='specify filename to save logs of the published messages to')
     parser.add_argument('-O', '--days_offset',
                         help='set the number of days a request can be off the current date. Default=7 days',
                         type=float)
-    parser.add_argument('-r', '--resend',
-                        help='Open a logfile and resend the requests stored in it instead of creating new ones',
+    parser.add_argument('--flush_interval', metavar='SECONDS',
+                        help='write buffered log lines at least every SECONDS seconds. Default=1 second', type=float)
+    parser.add_argument('--rotate_size', metavar='MB',
+                        help='start a new logfile once the current one reaches MB megabytes', type=float)
+    parser.add_argument('--rotate_interval', metavar='SECONDS',
+                        help='start a new logfile every SECONDS seconds', type=float)
+    parser.add_argument('--log_thread', help='flush the logfile periodically from a background thread',
                         action='store_true')
+    parser.add_argument('--log_format', choices=['text', 'zlib', 'zstd'],
+                        help='log text lines (FILENAME.log) or the fields of the requests in compressed blocks '
+                             '(FILENAME.dglog), zstd needs the zstandard package. Default=text')
+    parser.add_argument('-r', '--resend', metavar='LOGFILE', nargs='?', const='',
+                        help='resend the requests stored in LOGFILE instead of creating new ones. '
+                             'Without LOGFILE a file dialog is opened')
+    parser.add_argument('--from', dest='from_id', metavar='ID', type=int,
+                        help='first request id to resend (inclusive). Default=first id in the logfile')
+    parser.add_argument('--to', dest='to_id', metavar='ID', type=int,
+                        help='last request id to resend (inclusive). Default=last id in the logfile')
+    parser.add_argument('--from_time', metavar='TIME',
+                        help='only resend requests issued at or after TIME (epoch seconds or "YYYY-MM-DD HH:MM:SS")')
+    parser.add_argument('--to_time', metavar='TIME',
+                        help='only resend requests issued at or before TIME (epoch seconds or "YYYY-MM-DD HH:MM:SS")')
+    parser.add_argument('--gui', help='select the logfile to resend in a file dialog', action='store_true')
+    parser.add_argument('--speed', metavar='FACTOR',
+                        help='resend with the original timing of the logged requests, FACTOR times faster '
+                             '(0 for as fast as possible) instead of sleeping between them [float]', type=float)
     parser.add_argument('-D', '--shift_date', metavar='DAYS',
                         help='shift the date of the produced travel requests into the past '
                              '(negative numbers for shift into the future)', type=float)
 
-    parser.parse_args()
+    parsed = parser.parse_args()
 
-    if ('-r' in arguments) or ('--resend' in arguments):
+    if parsed.resend is not None:
         overpass_handler.resend_from_logfile(arguments)
     else:
         overpass_handler.run(arguments)
@@ -0,0 +1,291 @@
+"""
+Asynchronous publishing pipeline: batches are generated in a worker thread while publisher tasks send them.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+from datagenerator.emitter.publisher import DEFAULT_QOS, DEFAULT_MAX_PENDING
+from datagenerator.emitter.router import Router
+
+DEFAULT_BATCH_SIZE = 100  # requests created at once
+DEFAULT_QUEUE_SIZE = 8  # batches waiting to be published
+DEFAULT_PUBLISHERS = 2  # tasks draining the queue
+MIN_RECONNECT_DELAY = 1.0  # seconds before the first attempt to reconnect after losing the broker
+MAX_RECONNECT_DELAY = 30.0  # the delay doubles with every failed attempt up to this
+
+
+class AsyncPublisher:
+    """Drives a paho client from the asyncio event loop through its socket callbacks, no network thread needed.
+
+    Like Publisher it keeps at most <max_pending> messages unacknowledged; publish() waits for a free slot.
+    A lost connection is reestablished like paho's network thread does it, waiting <min_reconnect_delay> seconds
+    and doubling that after every failed attempt up to <max_reconnect_delay>."""
+
+    def __init__(self, client, qos=DEFAULT_QOS, max_pending=DEFAULT_MAX_PENDING,
+                 min_reconnect_delay=MIN_RECONNECT_DELAY, max_reconnect_delay=MAX_RECONNECT_DELAY):
+        self.client = client
+        self.qos = qos
+        self.max_pending = max_pending
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+
+        self._loop = None
+        self._misc_task = None
+        self._reconnect_task = None
+        self._disconnecting = False
+        self._slots = None
+        self._connected = None
+        self._idle = None
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        client.on_publish = self._on_publish
+        self._user_on_connect = client.on_connect
+        client.on_connect = self._on_connect
+
+    async def connect(self, broker_address, port=1883):
+        """Connect to the broker and wait for its CONNACK."""
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._connected = self._loop.create_future()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.client.connect(broker_address, port)
+        await self._connected
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if self._user_on_connect is not None:
+            self._user_on_connect(client, userdata, flags, rc)
+        if not self._connected.done():
+            if rc == 0:
+                self._connected.set_result(rc)
+            else:
+                self._connected.set_exception(ConnectionError("Broker refused the connection ({0}).".format(rc)))
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.add_reader(sock, client.loop_read)
+        self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+        if not self._disconnecting and self._reconnect_task is None:
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.min_reconnect_delay
+        try:
+            while not self._disconnecting:
+                await asyncio.sleep(delay)
+                if self._disconnecting:
+                    break
+                try:
+                    # QoS 1 and 2 messages kept by paho are sent again after the CONNACK
+                    self.client.reconnect()
+                    break
+                except OSError:
+                    delay = min(2 * delay, self.max_reconnect_delay)
+        finally:
+            self._reconnect_task = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # keep-alive pings and retries, paho's own network loop would do this
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def _release(self):
+        self._slots.release()
+        if self.published == self.acked + self.failed:
+            self._idle.set()
+
+    def _on_publish(self, client, userdata, mid):
+        self.acked += 1
+        self._release()
+
+    async def publish(self, topic, payload):
+        """Publish once fewer than max_pending messages are unacknowledged. Returns False if paho rejected it."""
+        await self._slots.acquire()
+        self.published += 1
+        self._idle.clear()
+        info = self.client.publish(topic, payload, self.qos)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS or (info.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0):
+            return True
+        self.failed += 1
+        self._release()
+        return False
+
+    async def flush(self):
+        """Wait until every published message is acknowledged."""
+        await self._idle.wait()
+
+    def disconnect(self):
+        """Disconnect from the broker on purpose, without reconnecting."""
+        self._disconnecting = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self.client.disconnect()
+
+    async def close(self):
+        await self.flush()
+        self.disconnect()
+
+
+class OrderedBatchLog:
+    """Writes the published lines of batches to a log in the order the batches were created.
+
+    Publisher tasks finish their batches in any order, but the log index needs ascending request ids, so the lines
+    of a batch are kept until all earlier batches are written."""
+
+    def __init__(self, log_writer):
+        self.log_writer = log_writer
+        self.next_batch = 0
+        self._finished = {}
+
+    def add(self, batch_number, batch, rows, lines=None, payloads=None):
+        """Add the requests at the indices <rows> of <batch>, published from batch <batch_number>, with their log
+        <lines> if already created and their published json <payloads>."""
+        self._finished[batch_number] = (batch, rows, lines, payloads)
+        while self.next_batch in self._finished:
+            self.log_writer.write_batch(*self._finished.pop(self.next_batch))
+            self.next_batch += 1
+
+    def drain(self):
+        """Write all batches still kept, in order, e.g. when the pipeline is stopped before earlier batches are
+        finished."""
+        for batch_number in sorted(self._finished):
+            self.log_writer.write_batch(*self._finished.pop(batch_number))
+            self.next_batch = batch_number + 1
+
+
+async def generate_batches(create_batch, queue, count=None, batch_size=DEFAULT_BATCH_SIZE, pretty=False,
+                           metrics=None, log_lines=True):
+    """Fill <queue> with (number, batch, payloads, log lines) created by create_batch(size) in a separate thread.
+
+    Creating and serializing a batch is CPU-bound, so it runs in an executor while the event loop keeps sending.
+    Stops after <count> requests if given, or once create_batch returns an empty batch (e.g. at the end of a
+    simulated period), and finally puts None into the queue. With <metrics> every request of a batch is timed
+    with the average of its batch. Without <log_lines> the log lines are None."""
+    loop = asyncio.get_running_loop()
+
+    def create(size):
+        if metrics is None:
+            batch = create_batch(size)
+            payloads = batch.to_json_list(pretty)
+            return batch, payloads, batch.to_numbered_lines(payloads) if log_lines else None
+
+        started = time.perf_counter()
+        batch = create_batch(size)
+        created = time.perf_counter()
+        payloads = batch.to_json_list(pretty)
+        lines = batch.to_numbered_lines(payloads) if log_lines else None
+        if len(batch):
+            metrics.generated.inc(len(batch))
+            metrics.generation.observe_many((created - started) / len(batch), len(batch))
+            metrics.serialization.observe_many((time.perf_counter() - created) / len(batch), len(batch))
+        return batch, payloads, lines
+
+    created = 0
+    batch_number = 0
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-generator') as executor:
+        while count is None or created < count:
+            size = batch_size if count is None else min(batch_size, count - created)
+            batch, payloads, lines = await loop.run_in_executor(executor, create, size)
+            if len(batch) == 0:
+                break
+            await queue.put((batch_number, batch, payloads, lines))
+            created += len(batch)
+            batch_number += 1
+    await queue.put(None)
+
+
+async def publish_batches(queue, publishers, router, batch_log=None, rate_scheduler=None, on_published=None,
+                          metrics=None):
+    """Publish all requests of the batches in <queue> until it yields None, which is put back for other tasks.
+
+    The <router> picks the topic and the index into <publishers> (one per broker) of every request. Only requests
+    handed to a publisher are added to the OrderedBatchLog <batch_log>. With a <rate_scheduler> every request
+    waits for its slot, and on_published(batch, published) is called after each batch. With <metrics> the time
+    until a publisher accepts a request is observed."""
+    publish_time = None if metrics is None else metrics.publish
+    while True:
+        item = await queue.get()
+        if item is None:
+            await queue.put(None)
+            return
+
+        batch_number, batch, payloads, lines = item
+        rows = []
+        routes = router.route_batch(batch)
+        try:
+            for row, (payload, (broker, topic)) in enumerate(zip(payloads, routes)):
+                if rate_scheduler is not None:
+                    delay = rate_scheduler.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if publish_time is None:
+                    published = await publishers[broker].publish(topic, payload)
+                else:
+                    started = time.perf_counter()
+                    published = await publishers[broker].publish(topic, payload)
+                    publish_time.observe(time.perf_counter() - started)
+                if published:
+                    rows.append(row)
+        finally:
+            # also when the task is cancelled halfway, the rows published so far are at the broker
+            if batch_log is not None:
+                batch_log.add(batch_number, batch, rows, lines, payloads)
+        if on_published is not None:
+            on_published(batch, len(rows))
+
+
+async def run_pipeline(create_batch, publisher, topic, count=None, batch_size=DEFAULT_BATCH_SIZE,
+                       queue_size=DEFAULT_QUEUE_SIZE, publishers=DEFAULT_PUBLISHERS, pretty=False, log_writer=None,
+                       rate_scheduler=None, on_published=None, metrics=None):
+    """Run one generator and <publishers> publisher tasks connected by a bounded queue of batches.
+
+    <publisher> is an AsyncPublisher or a list with one per broker, and <topic> a fixed topic or a Router.
+    The bounded queue makes the generator wait when publishing is the bottleneck, so memory stays bounded.
+    Returns once <count> requests are published and acknowledged, or runs forever without a count.
+    The optional Metrics <metrics> follow the publishers, the log, the queue and the timing of the stages."""
+    pool = list(publisher) if isinstance(publisher, (list, tuple)) else [publisher]
+    router = Router(topic.replace('{', '{{').replace('}', '}}')) if isinstance(topic, str) else topic
+    queue = asyncio.Queue(maxsize=queue_size)
+    batch_log = None if log_writer is None else OrderedBatchLog(log_writer)
+    if metrics is not None:
+        metrics.watch_publishers(pool)
+        metrics.queue_depth.function = queue.qsize
+        if log_writer is not None:
+            metrics.watch_log(log_writer)
+        if rate_scheduler is not None:
+            metrics.watch_rate(rate_scheduler)
+    # a log that stores the fields instead of the lines (or no log at all) doesn't need the lines
+    log_lines = log_writer is not None and log_writer.uses_lines
+    tasks = [asyncio.ensure_future(generate_batches(create_batch, queue, count, batch_size, pretty, metrics,
+                                                    log_lines))]
+    tasks += [asyncio.ensure_future(publish_batches(queue, pool, router, batch_log, rate_scheduler,
+                                                    on_published, metrics))
+              for _ in range(publishers)]
+    try:
+        await asyncio.gather(*tasks)
+        for each in pool:
+            await each.flush()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # let cancelled publishers log what they have published, then write the batches kept back for order
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if batch_log is not None:
+            batch_log.drain()
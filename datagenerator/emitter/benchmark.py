@@ -0,0 +1,506 @@
+"""
+Offline benchmarks of every stage of the generator, stored as JSON baselines to catch performance regressions.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import paho.mqtt.client as mqtt
+from datagenerator.requestgenerator.overpass_handler import OverpassHandler, CoordinatePicker, RequestCreator, \
+    IdTracker, PurposePicker, TransportationTypePicker, save_request, BUS_FILE
+from datagenerator.requestgenerator.geometric_operations import shift_coordinate
+from datagenerator.requestgenerator.travel_request import Coordinate
+from datagenerator.requestgenerator.clock import SimulatedClock
+from datagenerator.emitter.publisher import Publisher
+from datagenerator.emitter.router import Router
+from datagenerator.emitter.log_writer import RequestLogWriter
+from datagenerator.emitter.log_index import LogReader
+from datagenerator.emitter.block_log import BlockLogWriter, BlockLogReader, BLOCK_LOG_EXTENSION
+from datagenerator.emitter.async_pipeline import run_pipeline, DEFAULT_BATCH_SIZE
+
+DEFAULT_REPEATS = 5  # timed runs per stage, the fastest one is compared with the baseline
+DEFAULT_SEED = 355
+DEFAULT_THRESHOLD = 0.10  # relative slowdown reported as a regression
+ALLOCATION_SLACK = 0.5  # blocks per operation that may be added before an allocation regression is reported
+TRACED_OPERATIONS = 2000  # operations run under tracemalloc, which is too slow for the full count
+SIMULATION_START = 1573426800  # 2019-11-11 00:00 in Gothenburg, so every run creates the same requests
+DEVICE = 42
+TOPIC = 'travel_requests'
+
+STAGES = {}  # name -> Stage, in the order they run
+
+
+class Stage:
+    """A benchmarked step of the pipeline. <prepare>(workload, count) returns a callable running <count> operations.
+
+    The callable returns what the operations produced, so its memory counts towards the allocations per
+    operation. Micro stages measure one function, macro stages a whole loop of the generator."""
+
+    def __init__(self, name, prepare, kind, count):
+        self.name = name
+        self.prepare = prepare
+        self.kind = kind
+        self.count = count
+        self.description = prepare.__doc__
+
+
+def stage(name, kind='micro', count=20000):
+    def register(prepare):
+        STAGES[name] = Stage(name, prepare, kind, count)
+        return prepare
+    return register
+
+
+class FakeInfo:
+
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class FakeClient:
+    """Offline stand-in for a paho client: accepts every message and acknowledges it right away."""
+
+    def __init__(self):
+        self.on_publish = None
+        self.messages = 0
+        self.bytes = 0
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        self.messages += 1
+        self.bytes += len(payload)
+        if self.on_publish is not None:
+            self.on_publish(self, None, self.messages)
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS, self.messages)
+
+
+class FakeAsyncPublisher:
+    """Stand-in for an AsyncPublisher whose FakeClient acknowledges every message right away."""
+
+    def __init__(self, client=None):
+        self.client = FakeClient() if client is None else client
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+
+    async def publish(self, topic, payload):
+        self.published += 1
+        self.client.publish(topic, payload)
+        self.acked += 1
+        return True
+
+    async def flush(self):
+        pass
+
+
+class Workload:
+    """The inputs of the stages: the seeds of <seeds_file> (the bundled bus stops of Gothenburg by default) and a
+    RequestCreator set up like run() does it, but on a simulated clock so every run creates the same requests.
+
+    Logfiles and the compiled seeds are written to <directory>, so a benchmark leaves no cache behind."""
+
+    def __init__(self, directory, seeds_file=BUS_FILE, seed=DEFAULT_SEED):
+        self.directory = directory
+        self.seeds_file = seeds_file
+        self.seed = seed
+        self.coordinates = OverpassHandler(seeds_file, cache_dir=os.path.join(directory, 'seeds')).get_coordinates()
+        self._logs = 0
+
+    def reset(self):
+        """Seed the random generators, so every repetition draws the same values."""
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+
+    def creator(self):
+        return RequestCreator(IdTracker(), [DEVICE], CoordinatePicker(self.coordinates), PurposePicker(p=[5, 3, 1, 1]),
+                              TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75]),
+                              clock=SimulatedClock(SIMULATION_START))
+
+    def requests(self, count):
+        creator = self.creator()
+        return [creator.create_random_request() for _ in range(count)]
+
+    def log_filename(self, extension='.log'):
+        self._logs += 1
+        return os.path.join(self.directory, 'benchmark{0}{1}'.format(self._logs, extension))
+
+
+@stage('shift_coordinate')
+def prepare_shift_coordinate(workload, count):
+    """geometric_operations.shift_coordinate of a seed by a random angle and distance."""
+    origin = Coordinate(57.70887, 11.97456)
+    angles = np.random.uniform(0, 2 * np.pi, count).tolist()
+    distances = np.random.uniform(0, 500, count).tolist()
+    return lambda: [shift_coordinate(origin, angle, distance) for angle, distance in zip(angles, distances)]
+
+
+@stage('pick_coordinate')
+def prepare_pick_coordinate(workload, count):
+    """CoordinatePicker.pick_randomly_with_circular_uncertainty over the seeds."""
+    picker = CoordinatePicker(workload.coordinates)
+    return lambda: [picker.pick_randomly_with_circular_uncertainty() for _ in range(count)]
+
+
+@stage('create_request')
+def prepare_create_request(workload, count):
+    """RequestCreator.create_random_request."""
+    creator = workload.creator()
+    return lambda: [creator.create_random_request() for _ in range(count)]
+
+
+@stage('to_json')
+def prepare_to_json(workload, count):
+    """TravelRequest.to_json of the compact payload."""
+    requests = workload.requests(count)
+    return lambda: [request.to_json() for request in requests]
+
+
+@stage('to_numbered_line')
+def prepare_to_numbered_line(workload, count):
+    """TravelRequest.to_numbered_line reusing the serialized payload, as every logged line does."""
+    requests = workload.requests(count)
+    payloads = [request.to_json() for request in requests]
+    return lambda: [request.to_numbered_line(payload) for request, payload in zip(requests, payloads)]
+
+
+@stage('save_request', count=2000)
+def prepare_save_request(workload, count):
+    """save_request, which opens the logfile for every request."""
+    requests = workload.requests(count)
+    payloads = [request.to_json() for request in requests]
+    filename = workload.log_filename()
+
+    def run():
+        for request, payload in zip(requests, payloads):
+            save_request(request, filename, payload)
+    return run
+
+
+@stage('log_request')
+def prepare_log_request(workload, count):
+    """RequestLogWriter.write_request with the buffered writer and its index."""
+    requests = workload.requests(count)
+    payloads = [request.to_json() for request in requests]
+    filename = workload.log_filename()
+
+    def run():
+        with RequestLogWriter(filename) as log_writer:
+            for request, payload in zip(requests, payloads):
+                log_writer.write_request(request, payload)
+    return run
+
+
+@stage('log_block')
+def prepare_log_block(workload, count):
+    """BlockLogWriter.write_request, storing the published json in compressed blocks."""
+    requests = workload.requests(count)
+    payloads = [request.to_json() for request in requests]
+    filename = workload.log_filename(BLOCK_LOG_EXTENSION)
+
+    def run():
+        with BlockLogWriter(filename) as log_writer:
+            for request, payload in zip(requests, payloads):
+                log_writer.write_request(request, payload)
+    return run
+
+
+@stage('read_log')
+def prepare_read_log(workload, count):
+    """LogReader.iter_range over a text log, as resend reads it."""
+    filename = workload.log_filename()
+    with RequestLogWriter(filename) as log_writer:
+        for request in workload.requests(count):
+            log_writer.write_request(request)
+    reader = LogReader(filename)
+    return lambda: list(reader.iter_range())
+
+
+@stage('read_block_log')
+def prepare_read_block_log(workload, count):
+    """BlockLogReader.iter_range over a block log, as resend reads it."""
+    filename = workload.log_filename(BLOCK_LOG_EXTENSION)
+    with BlockLogWriter(filename) as log_writer:
+        for request in workload.requests(count):
+            log_writer.write_request(request)
+    reader = BlockLogReader(filename)
+    return lambda: list(reader.iter_range())
+
+
+@stage('publish')
+def prepare_publish(workload, count):
+    """Publisher.publish to a fake client which acknowledges every message."""
+    payloads = [request.to_json() for request in workload.requests(min(count, 1000))]
+    publisher = Publisher(FakeClient())
+
+    def run():
+        publish = publisher.publish
+        for index in range(count):
+            publish(TOPIC, payloads[index % len(payloads)])
+    return run
+
+
+@stage('publish_loop', kind='macro')
+def prepare_publish_loop(workload, count):
+    """The loop of run(): create, serialize, route, publish and log every request."""
+    creator = workload.creator()
+    router = Router(TOPIC)
+    publishers = [Publisher(FakeClient())]
+    filename = workload.log_filename()
+
+    def run():
+        with RequestLogWriter(filename) as log_writer:
+            for _ in range(count):
+                request = creator.create_random_request()
+                payload = request.to_json()
+                broker, topic = router.route(request)
+                if publishers[broker].publish(topic, payload):
+                    log_writer.write_request(request, payload)
+    return run
+
+
+@stage('create_batch', kind='macro', count=100000)
+def prepare_create_batch(workload, count):
+    """RequestCreator.create_batch in batches of the default size, per request."""
+    creator = workload.creator()
+    return lambda: [creator.create_batch(DEFAULT_BATCH_SIZE) for _ in range(count // DEFAULT_BATCH_SIZE)]
+
+
+@stage('batch_to_json', kind='macro', count=100000)
+def prepare_batch_to_json(workload, count):
+    """RequestBatch.to_json_list and to_numbered_lines, per request."""
+    creator = workload.creator()
+    batches = [creator.create_batch(DEFAULT_BATCH_SIZE) for _ in range(count // DEFAULT_BATCH_SIZE)]
+
+    def run():
+        lines = []
+        for batch in batches:
+            lines += batch.to_numbered_lines(batch.to_json_list())
+        return lines
+    return run
+
+
+@stage('async_pipeline', kind='macro', count=100000)
+def prepare_async_pipeline(workload, count):
+    """The asynchronous pipeline from create_batch to a fake publisher and the log, per request."""
+    creator = workload.creator()
+    filename = workload.log_filename()
+
+    def run():
+        with RequestLogWriter(filename) as log_writer:
+            asyncio.run(run_pipeline(creator.create_batch, FakeAsyncPublisher(), Router(TOPIC), count,
+                                     log_writer=log_writer))
+    return run
+
+
+def measure_time(workload, stage, count, repeats):
+    """Run <stage> <repeats> times and return the nanoseconds per operation of every run.
+
+    The garbage collector is disabled while timing, like timeit does."""
+    times = []
+    for _ in range(repeats):
+        workload.reset()
+        run = stage.prepare(workload, count)
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            run()
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            if enabled:
+                gc.enable()
+        times.append(elapsed / count)
+    return times
+
+
+def measure_allocations(workload, stage, count):
+    """Return the memory blocks and bytes that <count> operations of <stage> leave allocated, their results
+    included, and the peak of the traced memory in bytes."""
+    workload.reset()
+    run = stage.prepare(workload, count)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before_bytes = tracemalloc.get_traced_memory()[0]
+        before = tracemalloc.take_snapshot()
+        result = run()
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1] - before_bytes
+    finally:
+        tracemalloc.stop()
+    del result
+    differences = after.compare_to(before, 'filename')
+    blocks = sum(difference.count_diff for difference in differences)
+    allocated = sum(difference.size_diff for difference in differences)
+    return blocks, allocated, peak
+
+
+def run_benchmarks(names=None, count=None, repeats=DEFAULT_REPEATS, seed=DEFAULT_SEED, seeds_file=BUS_FILE,
+                   allocations=True, report=None):
+    """Benchmark the stages <names> (all by default) and return the results as a dictionary ready for json.
+
+    <count> overrides the operations per run of every stage. report(name, result) is called after each stage."""
+    unknown = set(names or []) - set(STAGES)
+    if unknown:
+        raise ValueError("Unknown stages: {0}, use {1}.".format(", ".join(sorted(unknown)), ", ".join(STAGES)))
+    if repeats < 1 or (count is not None and count < 1):
+        raise ValueError("The count and the repeats must be positive.")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='datagenerator-benchmark-') as directory:
+        workload = Workload(directory, seeds_file, seed)
+        for name, stage in STAGES.items():
+            if names and name not in names:
+                continue
+            operations = stage.count if count is None else count
+            if stage.kind == 'macro':
+                operations = max(operations, DEFAULT_BATCH_SIZE)  # at least one full batch
+            times = measure_time(workload, stage, operations, repeats)
+            best = min(times)
+            result = {
+                'kind': stage.kind,
+                'operations': operations,
+                'ns_per_op': statistics.median(times),
+                'best_ns_per_op': best,
+                'ops_per_s': 1e9 / best,
+            }
+            if allocations:
+                traced = min(operations, TRACED_OPERATIONS)
+                if stage.kind == 'macro':
+                    traced = max(traced - traced % DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SIZE)
+                blocks, allocated, peak = measure_allocations(workload, stage, traced)
+                result.update(blocks_per_op=blocks / traced, bytes_per_op=allocated / traced, peak_bytes=peak)
+            results[name] = result
+            if report is not None:
+                report(name, result)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {'repeats': repeats, 'seed': seed, 'seeds_file': os.path.basename(str(seeds_file)),
+                     'seeds': len(workload.coordinates)},
+        'stages': results,
+    }
+
+
+def environment():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'system': platform.system()}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare <results> with a <baseline> of an earlier run and return a line for every regression.
+
+    A stage regressed if its fastest run is more than <threshold> (relative) slower than in the baseline, or if
+    it leaves more blocks allocated per operation beyond <threshold> and ALLOCATION_SLACK."""
+    regressions = []
+    for name, result in results['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before is None:
+            continue
+        ratio = result['best_ns_per_op'] / before['best_ns_per_op']
+        if ratio > 1 + threshold:
+            regressions.append("{0}: {1:.0f} ns/op instead of {2:.0f} ns/op ({3:+.0%}).".format(
+                name, result['best_ns_per_op'], before['best_ns_per_op'], ratio - 1))
+        if 'blocks_per_op' in result and 'blocks_per_op' in before:
+            limit = max(before['blocks_per_op'] * (1 + threshold), before['blocks_per_op'] + ALLOCATION_SLACK)
+            if result['blocks_per_op'] > limit:
+                regressions.append("{0}: {1:.1f} blocks/op instead of {2:.1f} blocks/op.".format(
+                    name, result['blocks_per_op'], before['blocks_per_op']))
+    return regressions
+
+
+def format_result(name, result):
+    line = "{0:<18} {1:<5} {2:>10.0f} ns/op {3:>12,.0f} ops/s".format(
+        name, result['kind'], result['best_ns_per_op'], result['ops_per_s'])
+    if 'blocks_per_op' in result:
+        line += " {0:>7.1f} blocks/op {1:>6.0f} B/op {2:>8.1f} KiB peak".format(
+            result['blocks_per_op'], result['bytes_per_op'], result['peak_bytes'] / 1024)
+    return line
+
+
+def save_results(results, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+def load_results(filename):
+    with open(filename, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv):
+    """Command line of the benchmarks, e.g. 'bench --save baseline.json' and later 'bench --compare baseline.json'."""
+    parser = argparse.ArgumentParser(prog='datagenerator bench',
+                                     description='Benchmark the stages of the generator offline, against a fake '
+                                                 'MQTT client and the seeds of Gothenburg.')
+    parser.add_argument('stages', nargs='*', metavar='STAGE',
+                        help='stages to run, all by default: {0}'.format(', '.join(STAGES)))
+    parser.add_argument('-n', '--count', type=int, help='operations per run of every stage instead of its default')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='runs per stage, the fastest is reported. Default={0}'.format(DEFAULT_REPEATS))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of the random generators')
+    parser.add_argument('-i', '--ifile', default=BUS_FILE, help='seed file of the workload')
+    parser.add_argument('--no_allocations', action='store_true', help="don't trace the allocations")
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE as json, e.g. as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with the baseline in FILE and exit '
+                                                          'with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown reported as a regression. Default={0}'.format(DEFAULT_THRESHOLD))
+    arguments = parser.parse_args(argv)
+
+    baseline = None
+    if arguments.compare is not None:
+        try:
+            baseline = load_results(arguments.compare)
+        except (OSError, ValueError) as e:
+            sys.exit("Can't read the baseline {0}: {1}".format(arguments.compare, e))
+    try:
+        results = run_benchmarks(arguments.stages, arguments.count, arguments.repeats, arguments.seed,
+                                 arguments.ifile, not arguments.no_allocations,
+                                 report=lambda name, result: print(format_result(name, result), flush=True))
+    except ValueError as e:
+        sys.exit("Invalid benchmark: {0}".format(e))
+
+    if arguments.save is not None:
+        save_results(results, arguments.save)
+        print("Results written to {0}.".format(arguments.save))
+    if baseline is not None:
+        if baseline.get('environment') != results['environment']:
+            print("The baseline was measured in another environment, the comparison may be off.")
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print("Regressions against {0}:".format(arguments.compare))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions against {0}.".format(arguments.compare))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,259 @@
+"""
+Compact request logs storing the published json of the logged requests in independently compressed blocks.
+
+A block log starts with a short header, followed by blocks of up to <block_size> requests. Every block has a
+fixed-width header with its codec, the number of its requests, the range of their ids and issuances and its size,
+so the block index is read by skipping from header to header without decompressing anything.
+A block holds the request ids and issuances as deltas, then the json of the requests exactly as it was published,
+separated by RECORD_SEPARATOR. Reading a block only decompresses it and splits the json apart, nothing is
+formatted again, so the requests are read about as fast as the lines of a text log are parsed. Storing the json
+costs size: a block log is about a sixth of a text log, hardly smaller than the text log compressed with gzip.
+"""
+import os
+import struct
+import time
+import zlib
+import numpy as np
+from datagenerator.emitter.log_index import LogReader, parse_numbered_line, read_issuance
+from datagenerator.emitter.log_writer import RequestLogWriter, DEFAULT_FLUSH_INTERVAL
+
+BLOCK_LOG_MAGIC = b'DGBLK2'  # 1 stored the fields in columns
+BLOCK_LOG_EXTENSION = '.dglog'
+LOG_EXTENSIONS = ('.log', BLOCK_LOG_EXTENSION)
+FILE_HEADER = struct.Struct('<6sxx')  # magic, padding
+# codec, flags, requests, stored bytes, raw bytes, first and last request id, first and last issuance
+BLOCK_HEADER = struct.Struct('<BBxxIIIqqqq')
+DEFAULT_BLOCK_SIZE = 4096  # requests per block
+CODECS = {'zlib': 0, 'zstd': 1}
+ZLIB_LEVEL = 4  # level 6 takes a quarter longer for a log only 4% smaller
+ZSTD_LEVEL = 3
+RECORD_SEPARATOR = '\x1e'  # never part of a json payload, control characters are escaped in json strings
+# columns of the block index
+OFFSET, CODEC, FLAGS, COUNT, STORED, RAW, FIRST_ID, LAST_ID, FIRST_ISSUANCE, LAST_ISSUANCE = range(10)
+
+
+def import_zstandard():
+    """Import the optional zstandard, raising a ValueError with install instructions if it is missing."""
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("The zstd log format needs zstandard, install it with: pip install zstandard")
+    return zstandard
+
+
+def compress(codec, data):
+    if codec == CODECS['zstd']:
+        return import_zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    # filtered: fewer short matches, the digits of the numbers are cheaper as plain huffman codes
+    compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS, 8, zlib.Z_FILTERED)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(codec, data, size):
+    if codec == CODECS['zstd']:
+        return import_zstandard().ZstdDecompressor().decompress(data, max_output_size=size)
+    if codec != CODECS['zlib']:
+        raise ValueError("Unknown codec {0} in the block log.".format(codec))
+    return zlib.decompress(data, bufsize=size)  # the raw size saves growing the buffer over and over
+
+
+def encode_block(request_ids, issuances, payloads):
+    """Turn the ids, issuances and published json of some requests into the raw bytes of a block."""
+    deltas = np.diff(np.asarray([request_ids, issuances], dtype='<i8'), axis=1, prepend=0)
+    return deltas.tobytes() + RECORD_SEPARATOR.join(payloads).encode('utf-8')
+
+
+def decode_block(raw, count):
+    """Inverse of encode_block, returns the request ids and issuances as arrays and the list of json payloads."""
+    request_ids, issuances = np.frombuffer(raw, dtype='<i8', count=2 * count).reshape(2, count).cumsum(axis=1)
+    payloads = str(memoryview(raw)[2 * count * 8:], 'utf-8').split(RECORD_SEPARATOR) if count else []
+    return request_ids, issuances, payloads
+
+
+class BlockLogWriter(RequestLogWriter):
+    """Writes the logged requests as a block log instead of text lines.
+
+    Requests are collected until <block_size> of them make a block, flushing and rotation work like for the
+    RequestLogWriter. <codec> is 'zlib' or 'zstd', which needs the zstandard package. Set <pretty> if the requests
+    are published as indented json, requests logged without their json are formatted like that."""
+
+    uses_lines = False
+
+    def __init__(self, filename, block_size=DEFAULT_BLOCK_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_bytes=None, rotate_interval=None, background=False, append=False, codec='zlib', pretty=False):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec '{0}', use {1}.".format(codec, ' or '.join(CODECS)))
+        if codec == 'zstd':
+            import_zstandard()
+        self.codec = CODECS[codec]
+        self.pretty = pretty
+        self._rows = []  # (request id, issuance, json) of every request
+        super().__init__(filename, block_size, flush_interval, max_bytes, rotate_interval, background, append,
+                         index_stride=None)
+
+    def _open_file(self, mode):
+        if mode == 'ab' and os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            with open(self.filename, 'rb') as f:
+                if f.read(len(BLOCK_LOG_MAGIC)) != BLOCK_LOG_MAGIC:
+                    raise ValueError("Can't append blocks to {0}, it isn't a block log.".format(self.filename))
+        super()._open_file(mode)
+        if self._file_bytes == 0:
+            self._file.write(FILE_HEADER.pack(BLOCK_LOG_MAGIC))
+            self._file_bytes = FILE_HEADER.size
+
+    def _added(self, count):
+        self.lines += count
+        if len(self._rows) >= self.buffer_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def write_request(self, request, payload=None):
+        """Log a TravelRequest with its published json <payload>, formatted from the request if not given."""
+        if payload is None:
+            payload = request.to_json(self.pretty)
+        with self._writing():
+            if self._closed:
+                raise ValueError("Can't write to a closed log writer.")
+            self._rows.append((request.request_id, request.issuance, payload))
+            self._added(1)
+
+    def write_batch(self, batch, rows, lines=None, payloads=None):
+        """Log the requests at the indices <rows> of a RequestBatch with their published json <payloads>, formatted
+        from the batch if not given. Log lines aren't needed."""
+        if payloads is None:
+            payloads = batch.to_json_list(self.pretty)
+        request_ids, issuances = batch.request_ids.tolist(), batch.issuance.tolist()
+        with self._writing():
+            if self._closed:
+                raise ValueError("Can't write to a closed log writer.")
+            self._rows.extend((request_ids[row], issuances[row], payloads[row]) for row in rows)
+            self._added(len(rows))
+
+    def write(self, line, request_id=None):
+        """Log a text log line '<requestId>::<json>'."""
+        request_id, payload = parse_numbered_line(line)
+        issuance = read_issuance(payload)
+        with self._writing():
+            if self._closed:
+                raise ValueError("Can't write to a closed log writer.")
+            self._rows.append((request_id, issuance, payload))
+            self._added(1)
+
+    def _write_buffer(self):
+        if not self._rows:
+            return
+        request_ids, issuances, payloads = zip(*self._rows)
+        raw = encode_block(request_ids, issuances, payloads)
+        stored = compress(self.codec, raw)
+        header = BLOCK_HEADER.pack(self.codec, 0, len(request_ids), len(stored), len(raw),
+                                   min(request_ids), max(request_ids), min(issuances), max(issuances))
+        self._file.write(header + stored)
+        self._file.flush()
+        self._file_bytes += len(header) + len(stored)
+        self._rows = []  # only now, a failed write keeps the requests
+
+
+def is_block_log(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(BLOCK_LOG_MAGIC)) == BLOCK_LOG_MAGIC
+
+
+def read_block_index(filename):
+    """Read the headers of all blocks of a block log into an array with the columns OFFSET to LAST_ISSUANCE.
+
+    A block cut off at the end of the file, e.g. by a crash while it was written, is left out."""
+    size = os.path.getsize(filename)
+    entries = []
+    with open(filename, 'rb') as f:
+        magic, = FILE_HEADER.unpack(f.read(FILE_HEADER.size).ljust(FILE_HEADER.size, b'\0'))
+        if magic != BLOCK_LOG_MAGIC:
+            raise ValueError("{0} is not a block log.".format(filename))
+        offset = FILE_HEADER.size
+        while offset + BLOCK_HEADER.size <= size:
+            f.seek(offset)
+            header = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            if offset + BLOCK_HEADER.size + header[3] > size:
+                break
+            entries.append((offset,) + header)
+            offset += BLOCK_HEADER.size + header[3]
+    return np.asarray(entries, dtype=np.int64).reshape(-1, 10)
+
+
+class BlockLogReader:
+    """Streams the requests of a block log, decompressing only the blocks of the wanted range.
+
+    Offers the methods of the LogReader of text logs, so a resend doesn't care about the format."""
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self.blocks = read_block_index(self.filename)
+
+    def read_block(self, position):
+        """Decode the block at <position> of the index into its request ids, issuances and json payloads."""
+        offset, codec, _, count, stored, raw = self.blocks[position, :FIRST_ID].tolist()
+        with open(self.filename, 'rb') as f:
+            f.seek(offset + BLOCK_HEADER.size)
+            data = decompress(codec, f.read(stored), raw)
+        return decode_block(data, count)
+
+    def first_id(self):
+        if len(self.blocks) == 0:
+            return None
+        return int(self.blocks[0, FIRST_ID])
+
+    def last_id(self):
+        if len(self.blocks) == 0:
+            return None
+        return int(self.blocks[-1, LAST_ID])
+
+    def count(self):
+        return int(self.blocks[:, COUNT].sum())
+
+    def id_range_of_times(self, start_time=None, stop_time=None):
+        """Translate an issuance interval (epoch seconds, inclusive) into the ids of its first and last entry.
+
+        Only the blocks whose issuances overlap the interval are decoded. Returns (None, None) if no entry was
+        issued in the interval."""
+        mask = np.ones(len(self.blocks), dtype=bool)
+        if start_time is not None:
+            mask &= self.blocks[:, LAST_ISSUANCE] >= start_time
+        if stop_time is not None:
+            mask &= self.blocks[:, FIRST_ISSUANCE] <= stop_time
+        start_id = stop_id = None
+        for position in np.flatnonzero(mask).tolist():
+            request_ids, issuances, _ = self.read_block(position)
+            inside = np.ones(len(request_ids), dtype=bool)
+            if start_time is not None:
+                inside &= issuances >= start_time
+            if stop_time is not None:
+                inside &= issuances <= stop_time
+            if inside.any():
+                start_id = int(request_ids[inside][0]) if start_id is None else start_id
+                stop_id = int(request_ids[inside][-1])
+        return start_id, stop_id
+
+    def iter_range(self, start_id=None, stop_id=None):
+        """Yield (requestId, json) of all entries with start_id <= requestId <= stop_id, block by block."""
+        mask = np.ones(len(self.blocks), dtype=bool)
+        if start_id is not None:
+            mask &= self.blocks[:, LAST_ID] >= start_id
+        if stop_id is not None:
+            mask &= self.blocks[:, FIRST_ID] <= stop_id
+        for position in np.flatnonzero(mask).tolist():
+            request_ids, _, payloads = self.read_block(position)
+            first, last = self.blocks[position, FIRST_ID:LAST_ID + 1].tolist()
+            if (start_id is not None and first < start_id) or (stop_id is not None and last > stop_id):
+                inside = np.ones(len(request_ids), dtype=bool)
+                if start_id is not None:
+                    inside &= request_ids >= start_id
+                if stop_id is not None:
+                    inside &= request_ids <= stop_id
+                payloads = [payloads[row] for row in np.flatnonzero(inside).tolist()]
+                request_ids = request_ids[inside]
+            yield from zip(request_ids.tolist(), payloads)
+
+
+def open_log_reader(filename):
+    """A BlockLogReader or a LogReader for <filename>, depending on its format."""
+    if is_block_log(filename):
+        return BlockLogReader(filename)
+    return LogReader(filename)
@@ -0,0 +1,340 @@
+"""
+Bulk export of generated travel requests to JSON lines, CSV or Parquet files, without a broker.
+"""
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from datagenerator.requestgenerator.overpass_handler import create_request_creator, parse_time, IdTracker, \
+    BUS_FILE, SHIFTING_DISTANCE, DEFAULT_OFFSET_DAYS, DEFAULT_SHIFT_DAYS
+from datagenerator.requestgenerator.clock import SimulatedClock
+from datagenerator.requestgenerator.keyed_random import KeyedRandom
+from datagenerator.requestgenerator.spatial_index import parse_trip_length
+from datagenerator.requestgenerator.seed_weights import parse_weights
+from datagenerator.emitter.scheduler import RateScheduler, ScaledRate, parse_rate_profile
+from datagenerator.emitter.workers import start_workers, monitor_workers, seed_worker, worker_filename
+
+DEFAULT_EXPORT_BATCH = 10000  # requests created and written at once
+DEFAULT_DEVICE = 42
+FILE_BUFFER_SIZE = 1024 * 1024  # bytes
+GZIP_LEVEL = 1  # twice as fast as the default level 6 for a tenth more bytes
+PARQUET_ROW_GROUP = 100000  # rows collected before a row group is written
+CSV_COLUMNS = ['deviceId', 'requestId', 'issuance', 'originLatitude', 'originLongitude', 'destinationLatitude',
+               'destinationLongitude', 'timeOfDeparture', 'purpose', 'transportationType']
+EXTENSIONS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.csv': 'csv', '.parquet': 'parquet',
+              '.pq': 'parquet'}
+
+
+def split_compression(filename):
+    """Split 'requests.csv.gz' into ('requests.csv', '.gz')."""
+    stem, extension = os.path.splitext(str(filename))
+    return (stem, extension) if extension == '.gz' else (str(filename), '')
+
+
+def format_of(filename):
+    """The format of an output file by its extension, ignoring a trailing .gz."""
+    stem, compression = split_compression(filename)
+    file_format = EXTENSIONS.get(os.path.splitext(stem)[1].lower())
+    if file_format is None:
+        raise ValueError("Can't tell the format of {0}, use .jsonl, .csv or .parquet or give --format.".format(
+            filename))
+    return file_format
+
+
+def shard_filename(filename, shard):
+    """Name of the file written by worker <shard>, e.g. 'out.csv.gz' -> 'out.worker2.csv.gz'."""
+    stem, compression = split_compression(filename)
+    return worker_filename(stem, shard) + compression
+
+
+def open_text(filename):
+    """Open a text file for writing, gzip-compressed if its name ends with .gz."""
+    if split_compression(filename)[1]:
+        return gzip.open(filename, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_LEVEL)
+    return open(filename, 'w', encoding='utf-8', newline='', buffering=FILE_BUFFER_SIZE)
+
+
+class JsonLinesWriter:
+    """Writes every request as its compact json payload on a line, exactly as it is published."""
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self._file = open_text(filename)
+
+    def write(self, batch):
+        if len(batch):
+            self._file.write("\n".join(batch.to_json_list()))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter:
+    """Writes one row per request with the CSV_COLUMNS, departures in local time like in the json."""
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self._file = open_text(filename)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(CSV_COLUMNS)
+
+    def write(self, batch):
+        self._writer.writerows(zip(*batch.columns()))
+
+    def close(self):
+        self._file.close()
+
+
+def import_pyarrow():
+    """Import the optional pyarrow, raising a ValueError with install instructions if it is missing."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Writing Parquet files needs pyarrow, install it with: pip install pyarrow")
+    return pyarrow
+
+
+class ParquetWriter:
+    """Writes the requests to a Parquet file with pyarrow, in row groups of <row_group> requests.
+
+    Issuance and departure are UTC timestamps, purpose and transportation type dictionary-encoded strings."""
+
+    def __init__(self, filename, row_group=PARQUET_ROW_GROUP, compression='snappy'):
+        pyarrow = import_pyarrow()
+        if split_compression(filename)[1]:
+            raise ValueError("Parquet files are compressed internally, drop the .gz of {0}.".format(filename))
+        self.pa = pyarrow
+        self.filename = str(filename)
+        self.row_group = row_group
+        timestamp = pyarrow.timestamp('s', tz='UTC')
+        category = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        self.schema = pyarrow.schema([
+            ('deviceId', pyarrow.int64()), ('requestId', pyarrow.int64()), ('issuance', timestamp),
+            ('originLatitude', pyarrow.float64()), ('originLongitude', pyarrow.float64()),
+            ('destinationLatitude', pyarrow.float64()), ('destinationLongitude', pyarrow.float64()),
+            ('timeOfDeparture', timestamp), ('purpose', category), ('transportationType', category)])
+        self._writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema, compression=compression)
+        self._tables = []
+        self._rows = 0
+
+    def _categories(self, indices, labels):
+        return self.pa.DictionaryArray.from_arrays(self.pa.array(indices.astype(np.int32)),
+                                                   self.pa.array([str(label) for label in labels]))
+
+    def write(self, batch):
+        if not len(batch):
+            return
+        columns = [batch.device_ids, batch.request_ids, np.array(batch.issuance), batch.origin_latitudes,
+                   batch.origin_longitudes, batch.destination_latitudes, batch.destination_longitudes,
+                   batch.departures]
+        arrays = [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)]
+        arrays += [self._categories(batch.purposes, batch.purpose_labels),
+                   self._categories(batch.transportation_types, batch.transportation_type_labels)]
+        self._tables.append(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self._rows += len(batch)
+        if self._rows >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        if self._tables:
+            self._writer.write_table(self.pa.concat_tables(self._tables).unify_dictionaries())
+            self._tables = []
+            self._rows = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+def open_writer(filename, file_format=None):
+    """Open the writer for <file_format>, by default the one matching the extension of <filename>."""
+    file_format = format_of(filename) if file_format is None else file_format
+    if file_format not in WRITERS:
+        raise ValueError("Unknown format '{0}', use {1}.".format(file_format, ", ".join(WRITERS)))
+    return WRITERS[file_format](filename)
+
+
+def export_requests(create_batch, writer, count=None, batch_size=DEFAULT_EXPORT_BATCH, on_written=None):
+    """Write batches created by create_batch(size) to <writer> until <count> requests are written, or until
+    create_batch returns an empty batch at the end of a simulated period. Returns the number of requests.
+
+    on_written(size) is called after every batch."""
+    written = 0
+    while count is None or written < count:
+        size = batch_size if count is None else min(batch_size, count - written)
+        batch = create_batch(size)
+        if len(batch) == 0:
+            break
+        writer.write(batch)
+        written += len(batch)
+        if on_written is not None:
+            on_written(len(batch))
+    return written
+
+
+def shard_count(count, worker, workers):
+    """Number of the <count> requests created by <worker>, the first ones take the remainder."""
+    if count is None:
+        return None
+    return count // workers + (1 if worker < count % workers else 0)
+
+
+def export_shard(arguments, worker=0, workers=1, sent=None, cache_dir=None):
+    """Export the share of <worker> of the requests described by the parsed command line <arguments>, with the
+    compiled seeds cached in <cache_dir> (the user's cache folder by default).
+
+    Workers stripe the request ids and the simulated clock, so together they write what a single process would
+    write, in <workers> files. With a seed and a fixed interval, request k is the same in every export that
+    contains it, whatever the first id, the batch size or the number of workers."""
+    seed_worker(arguments.seed, worker, workers)
+    keyed_random = None if arguments.seed is None else KeyedRandom(arguments.seed, arguments.device)
+    first = arguments.first + worker
+    clock = None
+    if arguments.simulate is not None:
+        if arguments.rate is None:
+            # request k is issued at simulate + k * interval, in any shard
+            clock = SimulatedClock(arguments.simulate + (first - workers) * arguments.interval, arguments.until,
+                                   arguments.interval * workers)
+        else:
+            clock = SimulatedClock(arguments.simulate, arguments.until)
+            profile = parse_rate_profile(arguments.rate, datetime.fromtimestamp(arguments.simulate))
+            if workers > 1:
+                profile = ScaledRate(profile, 1.0 / workers)
+            clock.pace(RateScheduler(profile, clock=clock.monotonic, sleep=clock.sleep))
+    creator = create_request_creator([arguments.device], arguments.ifile, arguments.limit, arguments.weights,
+                                     arguments.trip_length, IdTracker(first, workers), clock, keyed_random,
+                                     cache_dir)
+
+    def create_batch(size):
+        return creator.create_batch(size, arguments.offset, arguments.days_offset, arguments.shift_days)
+
+    def on_written(size):
+        if sent is not None:
+            sent[worker] += size
+
+    filename = arguments.output if workers == 1 else shard_filename(arguments.output, worker)
+    writer = open_writer(filename, arguments.format)
+    try:
+        return export_requests(create_batch, writer, shard_count(arguments.count, worker, workers),
+                               arguments.batch, on_written)
+    finally:
+        writer.close()
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return value
+
+
+def weights_rule(text):
+    try:
+        return parse_weights(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def trip_length(text):
+    try:
+        return parse_trip_length(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def time_argument(text):
+    try:
+        return parse_time(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("must be epoch seconds or 'YYYY-MM-DD HH:MM:SS'")
+
+
+def main(argv):
+    """Command line of the export, e.g. 'export requests.csv -n 1000000 --workers 4'."""
+    parser = argparse.ArgumentParser(prog='datagenerator export',
+                                     description='Generate travel requests into files instead of publishing them.')
+    parser.add_argument('output', help='file to write, .jsonl, .csv (both optionally .gz) or .parquet')
+    parser.add_argument('-n', '--count', type=positive_int, help='number of requests to export')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='format of the file. Default=by its extension')
+    parser.add_argument('--simulate', metavar='TIME', type=time_argument,
+                        help='issue the requests on a simulated clock starting at TIME (epoch seconds or '
+                             '"YYYY-MM-DD HH:MM:SS")')
+    parser.add_argument('--until', metavar='TIME', type=time_argument,
+                        help='end of the simulated period. Default=now unless COUNT is given')
+    parser.add_argument('--interval', metavar='SECONDS', type=float, default=1.0,
+                        help='simulated seconds between two requests. Default=1')
+    parser.add_argument('--rate', metavar='PROFILE',
+                        help='follow a rate profile on the simulated clock instead of a fixed interval')
+    parser.add_argument('--workers', metavar='N', type=positive_int, default=1,
+                        help='export from N processes, each writing its own shard (OUTPUT.workerN.csv, ...)')
+    parser.add_argument('--batch', metavar='N', type=positive_int, default=DEFAULT_EXPORT_BATCH,
+                        help='number of requests created and written at once. Default={0}'.format(
+                            DEFAULT_EXPORT_BATCH))
+    parser.add_argument('--seed', type=int, help='seed the random generators to make the export reproducible')
+    parser.add_argument('--first', metavar='ID', type=positive_int, default=1,
+                        help='id of the first request, to regenerate a range of a seeded export. Default=1')
+    parser.add_argument('-i', '--ifile', default=BUS_FILE, help='specify file to load coordinate-seeds from')
+    parser.add_argument('-d', '--device', type=int, default=DEFAULT_DEVICE, help='device id of the requests')
+    parser.add_argument('-l', '--limit', type=positive_int, help='use only LIMIT of the seeds')
+    parser.add_argument('--weights', metavar='RULE', action='append', type=weights_rule,
+                        help='weight the seeds like the generator does, may be repeated')
+    parser.add_argument('--trip_length', metavar='DISTRIBUTION', type=trip_length,
+                        help='pair origins and destinations at a distance drawn from DISTRIBUTION')
+    parser.add_argument('-o', '--offset', type=float, default=SHIFTING_DISTANCE,
+                        help='meters around the seeds the coordinates are spread. Default={0}'.format(
+                            SHIFTING_DISTANCE))
+    parser.add_argument('-O', '--days_offset', type=float, default=DEFAULT_OFFSET_DAYS,
+                        help='days the departures may be before the issuance. Default={0}'.format(
+                            DEFAULT_OFFSET_DAYS))
+    parser.add_argument('-D', '--shift_days', type=float, default=DEFAULT_SHIFT_DAYS,
+                        help='shift the departures DAYS into the past')
+    arguments = parser.parse_args(argv)
+
+    if arguments.simulate is None:
+        if arguments.count is None:
+            parser.error('give the number of requests with -n or a simulated period with --simulate')
+        if arguments.until is not None or arguments.rate is not None:
+            parser.error('--until and --rate need --simulate')
+    elif arguments.until is None and arguments.count is None:
+        arguments.until = time.time()
+    if arguments.interval <= 0:
+        parser.error('--interval must be positive')
+    try:
+        if arguments.rate is not None:
+            parse_rate_profile(arguments.rate)
+        if arguments.simulate is not None:
+            SimulatedClock(arguments.simulate, arguments.until)
+        if (arguments.format or format_of(arguments.output)) == 'parquet':
+            import_pyarrow()
+    except ValueError as e:
+        sys.exit("Invalid export: {0}".format(e))
+
+    started = time.monotonic()
+    try:
+        if arguments.workers == 1:
+            total = export_shard(arguments)
+        else:
+            print('Exporting with {0} processes.'.format(arguments.workers))
+            processes, sent = start_workers(export_shard, [arguments], arguments.workers)
+            total = monitor_workers(processes, sent, verb='exported')
+            if any(process.exitcode for process in processes):
+                sys.exit("A worker failed, the export is incomplete.")
+    except (ValueError, OSError) as e:
+        sys.exit("The export failed: {0}".format(e))
+    elapsed = time.monotonic() - started
+    print("Exported {0} requests to {1} in {2:.1f} seconds ({3:.0f} requests/s).".format(
+        total, arguments.output if arguments.workers == 1 else shard_filename(arguments.output, 'N'), elapsed,
+        total / elapsed if elapsed > 0 else 0))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,175 @@
+"""
+Minimal MQTT 3.1.1 broker on asyncio, standing in for Mosquitto in tests and offline benchmarks.
+
+It accepts connections, acknowledges publishes of all QoS levels, forwards them with QoS 0 to matching
+subscriptions and counts what it received. There is no persistence, authentication, retain or will support.
+"""
+import asyncio
+import struct
+import sys
+import threading
+from collections import Counter
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def encode_packet(packet_type, body=b'', flags=0):
+    """Prefix <body> with the fixed header of an MQTT packet."""
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length > 0 else byte)
+        if length == 0:
+            break
+    return bytes(header) + body
+
+
+def topic_matches(subscription, topic):
+    """Check whether <topic> matches a <subscription> which may contain the wildcards + and #."""
+    filter_levels = subscription.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels) or (level != '+' and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class LocalBroker:
+    """In-process MQTT broker. Set <keep_messages> to also store every received (topic, payload)."""
+
+    def __init__(self, keep_messages=False):
+        self.keep_messages = keep_messages
+        self.messages = []
+        self.received = Counter()  # messages per topic
+        self.connections = 0
+        self.port = None
+        self._server = None
+        self._subscriptions = {}  # writer -> list of topic filters
+        self._thread = None
+        self._loop = None
+
+    @property
+    def total(self):
+        return sum(self.received.values())
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening. Port 0 picks a free port, which is returned and stored in self.port."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for writer in list(self._subscriptions):
+            writer.close()
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """Run the broker on its own event loop in a daemon thread, for code that isn't asynchronous."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name='local-broker', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.port
+
+    def stop_thread(self):
+        future = asyncio.run_coroutine_threadsafe(self.stop(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _read_packet(self, reader):
+        first = await reader.readexactly(1)
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b''
+        return first[0] >> 4, first[0] & 0x0F, body
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._subscriptions[writer] = []
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == CONNECT:
+                    writer.write(encode_packet(CONNACK, b'\x00\x00'))
+                elif packet_type == PUBLISH:
+                    self._publish(writer, flags, body)
+                elif packet_type == PUBREL:
+                    writer.write(encode_packet(PUBCOMP, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(writer, body)
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(encode_packet(UNSUBACK, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(encode_packet(PINGRESP))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._subscriptions[writer]
+            writer.close()
+
+    def _publish(self, writer, flags, body):
+        qos = (flags >> 1) & 0x03
+        topic_length, = struct.unpack('!H', body[:2])
+        topic = body[2:2 + topic_length].decode('utf-8')
+        position = 2 + topic_length
+        if qos > 0:
+            packet_id = body[position:position + 2]
+            position += 2
+            writer.write(encode_packet(PUBACK if qos == 1 else PUBREC, packet_id))
+        payload = body[position:]
+
+        self.received[topic] += 1
+        if self.keep_messages:
+            self.messages.append((topic, payload))
+
+        forwarded = None
+        for subscriber, filters in self._subscriptions.items():
+            if any(topic_matches(subscription, topic) for subscription in filters):
+                if forwarded is None:
+                    encoded_topic = topic.encode('utf-8')
+                    forwarded = encode_packet(PUBLISH, struct.pack('!H', len(encoded_topic)) + encoded_topic + payload)
+                subscriber.write(forwarded)
+
+    def _subscribe(self, writer, body):
+        packet_id = body[:2]
+        position = 2
+        granted = bytearray()
+        while position < len(body):
+            length, = struct.unpack('!H', body[position:position + 2])
+            self._subscriptions[writer].append(body[position + 2:position + 2 + length].decode('utf-8'))
+            position += 2 + length + 1  # skip the requested QoS, everything is forwarded with QoS 0
+            granted.append(0)
+        writer.write(encode_packet(SUBACK, packet_id + bytes(granted)))
+
+
+async def serve_forever(port):
+    broker = LocalBroker()
+    await broker.start('0.0.0.0', port)
+    print("Local broker listening on port {0}.".format(broker.port))
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve_forever(int(sys.argv[1]) if len(sys.argv) > 1 else 1883))
@@ -0,0 +1,245 @@
+"""
+Sidecar offset index for request logs and a reader that seeks directly to a range of request ids.
+
+The index '<logfile>.idx' stores (requestId, byte offset, line number) of every <stride>th line of the log
+as fixed-width little-endian int64 triples after a short header.
+It relies on the request ids of one logfile being increasing, which holds for everything RequestLogWriter writes.
+"""
+import mmap
+import os
+import re
+import struct
+import warnings
+import numpy as np
+
+INDEX_MAGIC = b'DGIDX1'
+INDEX_HEADER = struct.Struct('<6sxxq')  # magic, padding, stride
+INDEX_ENTRY_SIZE = 3 * 8  # requestId, byte offset, line number
+DEFAULT_INDEX_STRIDE = 64  # lines of the log per index entry
+ISSUANCE_PATTERN = re.compile(r'"issuance":\s*(-?\d+)')
+
+
+def index_filename(log_filename):
+    """Name of the index belonging to a logfile."""
+    return str(log_filename) + ".idx"
+
+
+def parse_numbered_line(line):
+    """Split a log line '<requestId>::<json>' into the id and the json with its line breaks restored."""
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    number, payload = line.rstrip('\r\n').split('::', 1)
+    payload = payload.replace('#*?', '\r').replace('#*!', '\n')  # reintroduce line breaks of pretty json
+    return int(number), payload
+
+
+def read_issuance(payload):
+    """Extract the issuance (epoch seconds) from the json of a logged request without parsing all of it."""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    match = ISSUANCE_PATTERN.search(payload)
+    if match is None:
+        raise ValueError("Logged request without issuance: {0}".format(payload[:80]))
+    return int(match.group(1))
+
+
+class LogIndexWriter:
+    """Appends an entry for every <stride>th line of a log to its index file.
+
+    With <append> set, an existing index is continued and <lines> is the number of lines already in the log."""
+
+    def __init__(self, filename, stride=DEFAULT_INDEX_STRIDE, append=False, lines=0):
+        self.filename = str(filename)
+        self.stride = stride
+        self.lines = lines
+        self._pending = []
+        if append and os.path.exists(self.filename):
+            self._file = open(self.filename, "ab")
+        else:
+            self._file = open(self.filename, "wb")
+            self._file.write(INDEX_HEADER.pack(INDEX_MAGIC, stride))
+
+    def add(self, request_id, offset):
+        """Register the next line of the log, starting at byte <offset>."""
+        if self.lines % self.stride == 0:
+            self._pending.append((request_id, offset, self.lines))
+        self.lines += 1
+
+    def flush(self):
+        """Write pending entries. Call only after the log lines they point to are written."""
+        if self._pending:
+            self._file.write(np.asarray(self._pending, dtype='<i8').tobytes())
+            self._pending = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def iter_line_offsets(log_filename):
+    """Yield (requestId, byte offset) of every line of a logfile."""
+    offset = 0
+    with open(log_filename, "rb") as f:
+        for line in f:
+            separator = line.find(b'::')
+            if separator > 0:
+                yield int(line[:separator]), offset
+            offset += len(line)
+
+
+def build_index(log_filename, stride=DEFAULT_INDEX_STRIDE):
+    """Create the index for an existing logfile (e.g. written before indexes existed) in one streaming pass.
+
+    Returns the number of indexed lines."""
+    index = LogIndexWriter(index_filename(log_filename), stride)
+    for request_id, offset in iter_line_offsets(log_filename):
+        index.add(request_id, offset)
+    index.close()
+    return index.lines
+
+
+def scan_index(log_filename, stride=DEFAULT_INDEX_STRIDE):
+    """The entries build_index would write, kept in memory. Returns an array of shape (n, 3)."""
+    entries = [(request_id, offset, line) for line, (request_id, offset) in enumerate(iter_line_offsets(log_filename))
+               if line % stride == 0]
+    return np.asarray(entries, dtype='<i8').reshape(-1, 3)
+
+
+def load_index(log_filename):
+    """Map the index of a logfile into memory. Returns (stride, entries) with entries of shape (n, 3)."""
+    filename = index_filename(log_filename)
+    with open(filename, "rb") as f:
+        magic, stride = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+    if magic != INDEX_MAGIC:
+        raise ValueError("{0} is not a request log index.".format(filename))
+
+    size = os.path.getsize(filename) - INDEX_HEADER.size
+    count = size // INDEX_ENTRY_SIZE
+    if count == 0:
+        return stride, np.zeros((0, 3), dtype='<i8')
+    entries = np.memmap(filename, dtype='<i8', mode='r', offset=INDEX_HEADER.size, shape=(count, 3))
+    return stride, entries
+
+
+class LogReader:
+    """Random access to the entries of a request log through its index.
+
+    A missing or outdated index is rebuilt once when the reader is created. If the index can't be written
+    (e.g. next to a log in a read-only directory) the log is scanned into an index kept in memory instead."""
+
+    def __init__(self, filename, stride=DEFAULT_INDEX_STRIDE):
+        self.filename = str(filename)
+        self.size = os.path.getsize(self.filename)
+        try:
+            if not os.path.exists(index_filename(self.filename)) or \
+                    os.path.getmtime(index_filename(self.filename)) < os.path.getmtime(self.filename) - 1:
+                build_index(self.filename, stride)
+            self.stride, self.entries = load_index(self.filename)
+        except OSError as e:
+            warnings.warn("Can't use the index of {0} ({1}), scanning the log.".format(self.filename, e))
+            self.stride, self.entries = stride, scan_index(self.filename, stride)
+
+    def _map(self):
+        with open(self.filename, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def offset_of(self, request_id):
+        """Byte offset of the last indexed line with an id not larger than <request_id>."""
+        position = int(np.searchsorted(self.entries[:, 0], request_id, side='right')) - 1
+        if position < 0:
+            return 0
+        return int(self.entries[position, 1])
+
+    def first_id(self):
+        if len(self.entries) == 0:
+            return None
+        return int(self.entries[0, 0])
+
+    def last_id(self):
+        """Id of the last line, read from the end of the file."""
+        if len(self.entries) == 0:
+            return None
+        log = self._map()
+        try:
+            end = self.size
+            while end > 0 and log[end - 1:end] in (b'\n', b'\r'):
+                end -= 1
+            start = log.rfind(b'\n', 0, end) + 1
+            return int(log[start:log.find(b'::', start)])
+        finally:
+            log.close()
+
+    def count(self):
+        """Number of entries, only scanning the lines after the last index entry."""
+        if len(self.entries) == 0:
+            return 0
+        with open(self.filename, "rb") as f:
+            f.seek(int(self.entries[-1, 1]))
+            tail_lines = sum(1 for line in f if line.strip())
+        return int(self.entries[-1, 2]) + tail_lines
+
+    def _issuance_at(self, log, position):
+        log.seek(int(self.entries[position, 1]))
+        return read_issuance(log.readline())
+
+    def id_range_of_times(self, start_time=None, stop_time=None):
+        """Translate an issuance interval (epoch seconds, inclusive) into the ids of its first and last entry.
+
+        Uses a binary search over the indexed lines, assuming the issuance grows with the id.
+        Returns (None, None) if no entry was issued in the interval."""
+        if len(self.entries) == 0:
+            return None, None
+        log = self._map()
+        try:
+            # last indexed line issued before the interval, the entry we need comes after it
+            low, high = 0, len(self.entries)
+            while start_time is not None and low < high:
+                middle = (low + high) // 2
+                if self._issuance_at(log, middle) < start_time:
+                    low = middle + 1
+                else:
+                    high = middle
+            log.seek(int(self.entries[max(low - 1, 0), 1]))
+
+            start_id = stop_id = None
+            for line in iter(log.readline, b''):
+                if b'::' not in line:
+                    continue
+                issuance = read_issuance(line)
+                if stop_time is not None and issuance > stop_time:
+                    break
+                if start_time is None or issuance >= start_time:
+                    stop_id = int(line[:line.find(b'::')])
+                    if start_id is None:
+                        start_id = stop_id
+                        if stop_time is None:
+                            return start_id, self.last_id()
+            return start_id, stop_id
+        finally:
+            log.close()
+
+    def iter_lines(self, start_id=None, stop_id=None):
+        """Yield the raw lines with start_id <= requestId <= stop_id, seeking straight to the first of them."""
+        if self.size == 0:
+            return
+        log = self._map()
+        try:
+            log.seek(0 if start_id is None else self.offset_of(start_id))
+            for line in iter(log.readline, b''):
+                separator = line.find(b'::')
+                if separator <= 0:
+                    continue
+                request_id = int(line[:separator])
+                if start_id is not None and request_id < start_id:
+                    continue
+                if stop_id is not None and request_id > stop_id:
+                    break
+                yield line
+        finally:
+            log.close()
+
+    def iter_range(self, start_id=None, stop_id=None):
+        """Yield (requestId, json) of all entries with start_id <= requestId <= stop_id."""
+        for line in self.iter_lines(start_id, stop_id):
+            yield parse_numbered_line(line)
@@ -0,0 +1,221 @@
+"""
+Buffered, rotating writer for the logs of published travel requests.
+"""
+import atexit
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+from datagenerator.emitter.log_index import LogIndexWriter, build_index, index_filename, DEFAULT_INDEX_STRIDE
+
+DEFAULT_BUFFER_SIZE = 64 * 1024  # bytes collected before they are written to the file
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds after which buffered lines are written at the latest
+
+
+def rotated_filename(filename, index):
+    """Name of the <index>th rotated file, e.g. 'run.log' -> 'run.3.log', so it can still be resent."""
+    stem, extension = os.path.splitext(filename)
+    return "{0}.{1}{2}".format(stem, index, extension)
+
+
+class RequestLogWriter:
+    """Keeps the log file open and writes lines in buffered chunks instead of reopening it per request.
+
+    Lines are written once <buffer_size> bytes are collected or <flush_interval> seconds have passed.
+    The file is rotated after <max_bytes> bytes or <rotate_interval> seconds, if given.
+    With <background> set, a daemon thread flushes periodically even if no new lines arrive.
+    Unless <index_stride> is None, an offset index of the request ids is written next to every logfile."""
+
+    uses_lines = True  # RequestBatch log lines are passed to write_batch() if they were created
+
+    def __init__(self, filename, buffer_size=DEFAULT_BUFFER_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_bytes=None, rotate_interval=None, background=False, append=False,
+                 index_stride=DEFAULT_INDEX_STRIDE):
+        self.filename = str(filename)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.rotations = 0
+        self.lines = 0  # written since opening, across rotations
+        self.on_rotate = []  # callbacks receiving the name of each rotated file
+        self.index_stride = index_stride
+
+        self._lock = threading.RLock()
+        self._owner = None  # the thread in the middle of writing
+        self._deferred = None  # called once the owner has finished, see call_when_idle()
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._open_file("ab" if append else "wb")
+        self._index = None
+        if index_stride is not None:
+            lines = build_index(self.filename, index_stride) if self._file_bytes > 0 else 0
+            self._index = LogIndexWriter(index_filename(self.filename), index_stride, append=lines > 0,
+                                         lines=lines)
+        self._opened_at = time.monotonic()
+        self._flushed_at = self._opened_at
+        self._closed = False
+
+        self._stop = threading.Event()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._flush_periodically, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, line, request_id=None):
+        """Buffer one line (without line break) and write the buffer if it is due.
+
+        Lines with a <request_id> are added to the index."""
+        with self._writing():
+            if self._closed:
+                raise ValueError("Can't write to a closed log writer.")
+            if self._index is not None and request_id is not None:
+                self._index.add(request_id, self._file_bytes + self._buffered_bytes)
+            self._buffer.append(line + "\n")
+            self.lines += 1
+            self._buffered_bytes += (len(line) if line.isascii() else len(line.encode('utf-8'))) + 1
+
+            if self._buffered_bytes >= self.buffer_size or \
+                    time.monotonic() - self._flushed_at >= self.flush_interval:
+                self.flush()
+
+    def write_request(self, request, payload=None):
+        """Log a TravelRequest, reusing its already serialized <payload> if given."""
+        self.write(request.to_numbered_line(payload), request.get_id())
+
+    def write_batch(self, batch, rows, lines=None, payloads=None):
+        """Log the requests at the indices <rows> of a RequestBatch, reusing their log <lines> or their json
+        <payloads> if given."""
+        if lines is None:
+            lines = batch.to_numbered_lines(payloads)
+        request_ids = batch.request_ids.tolist()
+        for row in rows:
+            self.write(lines[row], request_ids[row])
+
+    def writing(self):
+        """Context to wrap a step that ends in a write, e.g. publishing the request logged right after.
+
+        A close requested with call_when_idle() during the step waits until all of it is done."""
+        return self._writing()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the lock and mark the current thread as writing, then run a deferred call once it is done."""
+        with self._lock:
+            outermost = self._owner is None
+            if outermost:
+                self._owner = threading.get_ident()
+            try:
+                yield
+            finally:
+                if outermost:
+                    self._owner = None
+        if outermost and self._deferred is not None:
+            deferred, self._deferred = self._deferred, None
+            deferred()
+
+    def call_when_idle(self, callback):
+        """Call <callback> now, or right after the current write if this thread is in the middle of one.
+
+        Signal handlers interrupt the main thread between any two lines, closing the writer there could lose the
+        chunk being written."""
+        if self._owner == threading.get_ident():
+            self._deferred = callback
+        else:
+            callback()
+
+    def _open_file(self, mode):
+        self._file = open(self.filename, mode)
+        self._file_bytes = self._file.tell()
+
+    def _write_buffer(self):
+        if self._buffer:
+            chunk = "".join(self._buffer).encode('utf-8')
+            self._file.write(chunk)
+            self._file.flush()
+            self._buffer = []  # only now, a failed write keeps the lines
+            self._buffered_bytes = 0
+            self._file_bytes += len(chunk)
+
+    def flush(self):
+        """Write all buffered lines to the file and rotate it if it is due."""
+        with self._writing():
+            self._write_buffer()
+            if self._index is not None:
+                self._index.flush()  # only after the lines it points to are in the file
+            self._flushed_at = time.monotonic()
+
+            if self._rotation_due():
+                self.rotate()
+
+    def _rotation_due(self):
+        if self.max_bytes is not None and self._file_bytes >= self.max_bytes:
+            return True
+        if self.rotate_interval is not None and self._file_bytes > 0 and \
+                time.monotonic() - self._opened_at >= self.rotate_interval:
+            return True
+        return False
+
+    def rotate(self):
+        """Close the current file, move it to the next free numbered name and start a new one."""
+        with self._writing():
+            self._file.close()
+            index = self.rotations + 1
+            while os.path.exists(rotated_filename(self.filename, index)):
+                index += 1
+            target = rotated_filename(self.filename, index)
+            os.replace(self.filename, target)
+            self.rotations = index
+            if self._index is not None:
+                self._index.close()
+                os.replace(index_filename(self.filename), index_filename(target))
+                self._index = LogIndexWriter(index_filename(self.filename), self.index_stride)
+
+            self._open_file("wb")
+            self._opened_at = time.monotonic()
+
+        for callback in self.on_rotate:
+            callback(target)
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Flush everything that is left and close the file. Closing twice does nothing."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        with self._writing():
+            if self._closed:
+                return
+            self.flush()
+            self._file.close()
+            if self._index is not None:
+                self._index.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def close_on_exit(writer, signals=(signal.SIGINT, signal.SIGTERM)):
+    """Make sure <writer> is flushed and closed when the program exits or is stopped by one of <signals>."""
+    atexit.register(writer.close)
+
+    def stop(signum):
+        writer.close()
+        sys.exit("Stopped by signal {0}. Log written to {1}.".format(signum, writer.filename))
+
+    def handle(signum, frame):
+        writer.call_when_idle(lambda: stop(signum))
+
+    # signal handlers can only be installed from the main thread
+    if threading.current_thread() is threading.main_thread():
+        for signum in signals:
+            signal.signal(signum, handle)
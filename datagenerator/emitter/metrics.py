@@ -0,0 +1,252 @@
+"""
+Live metrics of a running generator: counters, latency histograms and gauges, served in the Prometheus text format
+and summarized in a periodic stats line.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds in seconds, creating a request takes some ten microseconds and publishing may block for seconds
+DEFAULT_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 0.1, 1.0)
+DEFAULT_STATS_INTERVAL = 10.0  # seconds between two stats lines
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A value that only goes up. With a <function> it is read from elsewhere, e.g. the acks counted by a Publisher,
+    and costs nothing until it is scraped."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, function=None):
+        self.name = name
+        self.description = description
+        self.function = function
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+    def samples(self):
+        yield self.name, self.get()
+
+
+class Gauge(Counter):
+    """A value that goes up and down, like the depth of a queue."""
+
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Counts observations (seconds) in cumulative buckets with the upper bounds <buckets>."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, value, count):
+        """Observe <value> <count> times, e.g. the time per request of a whole batch."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def quantile(self, q):
+        """Estimate the <q> quantile by interpolating within its bucket, None without observations."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # beyond the largest bucket
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), list(self.counts)):
+            cumulative += count
+            yield '{0}_bucket{{le="{1}"}}'.format(self.name, format_value(bound)), cumulative
+        yield self.name + '_sum', self.sum
+        yield self.name + '_count', cumulative
+
+
+class Metrics:
+    """The instrumentation of one generator process.
+
+    The loops count generated requests and time their stages only if they were given a Metrics object, so a
+    generator without metrics pays nothing for them. Everything the publishers and the log writer already count
+    is read from them when the metrics are scraped."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.generated = Counter('datagenerator_requests_generated_total', 'Travel requests created.')
+        self.published = Counter('datagenerator_requests_published_total', 'Requests handed to the MQTT client.')
+        self.acked = Counter('datagenerator_requests_acked_total', 'Requests acknowledged (sent for QoS 0).')
+        self.failed = Counter('datagenerator_requests_failed_total', 'Requests rejected by the MQTT client.')
+        self.dropped = Counter('datagenerator_requests_dropped_total', 'Requests shed above the pending watermark.')
+        self.logged = Counter('datagenerator_requests_logged_total', 'Lines written to the logfile.')
+        self.reconnects = Counter('datagenerator_reconnects_total', 'Connections to a broker after the first one.')
+        self.generation = Histogram('datagenerator_generation_seconds', 'Time to create a request.', buckets)
+        self.serialization = Histogram('datagenerator_serialization_seconds', 'Time to serialize a request.',
+                                       buckets)
+        self.publish = Histogram('datagenerator_publish_seconds', 'Time to hand a request to the MQTT client, '
+                                                                  'including waiting for a free slot.', buckets)
+        self.pending = Gauge('datagenerator_pending_messages', 'Messages published but not yet acknowledged.')
+        self.queue_depth = Gauge('datagenerator_queue_depth', 'Batches waiting to be published.')
+        self.target_rate = Gauge('datagenerator_target_rate', 'Messages per second the rate profile asks for.')
+        self.metrics = [self.generated, self.published, self.acked, self.failed, self.dropped, self.logged,
+                        self.reconnects, self.generation, self.serialization, self.publish, self.pending,
+                        self.queue_depth, self.target_rate]
+
+        self._report_time = time.monotonic()
+        self._report_acked = 0
+        self._report_generated = 0
+
+    def watch_publishers(self, publishers):
+        """Read the counters of a list of Publishers or AsyncPublishers."""
+        self.published.function = lambda: sum(publisher.published for publisher in publishers)
+        self.acked.function = lambda: sum(publisher.acked for publisher in publishers)
+        self.failed.function = lambda: sum(publisher.failed for publisher in publishers)
+        self.dropped.function = lambda: sum(getattr(publisher, 'dropped', 0) for publisher in publishers)
+        self.pending.function = lambda: sum(publisher.published - publisher.acked - publisher.failed
+                                            for publisher in publishers)
+
+    def watch_log(self, log_writer):
+        self.logged.function = lambda: log_writer.lines
+
+    def watch_rate(self, rate_scheduler):
+        """Read the target rate from the profile of a RateScheduler at its elapsed time."""
+        self.target_rate.function = lambda: rate_scheduler.profile(rate_scheduler.deadlines.elapsed()) \
+            if rate_scheduler.deadlines.started_at is not None else 0.0
+
+    def watch_client(self, client):
+        """Count the reconnections of a paho client, keeping its on_connect callback."""
+        on_connect = client.on_connect
+        connections = []
+
+        def count_connection(client, userdata, flags, rc):
+            if rc == 0:
+                if connections:
+                    self.reconnects.inc()
+                connections.append(rc)
+            if on_connect is not None:
+                on_connect(client, userdata, flags, rc)
+        client.on_connect = count_connection
+
+    def observe_request(self, started, created, serialized, published):
+        """Count a request and time its stages from the perf_counter() readings between them."""
+        self.generated.value += 1
+        self.generation.observe(created - started)
+        self.serialization.observe(serialized - created)
+        self.publish.observe(published - serialized)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.description))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.kind))
+            lines += ['{0} {1}'.format(name, format_value(value)) for name, value in metric.samples()]
+        return '\n'.join(lines) + '\n'
+
+    def report(self, report_interval=DEFAULT_STATS_INTERVAL):
+        """Return a stats line with the counters, rates and 99th percentiles, or None if it isn't due."""
+        now = time.monotonic()
+        window = now - self._report_time
+        if window < report_interval:
+            return None
+
+        generated, acked = self.generated.get(), self.acked.get()
+        rate = (acked - self._report_acked) / window
+        line = "Generated {0} ({1:.1f}/s), published {2}, acked {3} ({4:.1f} msg/s".format(
+            generated, (generated - self._report_generated) / window, self.published.get(), acked, rate)
+        target = self.target_rate.get()
+        line += ", target {0:.1f})".format(target) if self.target_rate.function is not None else ")"
+        line += ", logged {0}, failed {1}, dropped {2}, pending {3}, reconnects {4}".format(
+            self.logged.get(), self.failed.get(), self.dropped.get(), self.pending.get(), self.reconnects.get())
+        if self.queue_depth.function is not None:
+            line += ", queue {0}".format(self.queue_depth.get())
+        percentiles = ["{0} {1:.3f}".format(name, histogram.quantile(0.99) * 1000)
+                       for name, histogram in (('generate', self.generation), ('serialize', self.serialization),
+                                               ('publish', self.publish)) if histogram.count]
+        if percentiles:
+            line += ", p99 ms: " + ", ".join(percentiles)
+
+        self._report_time = now
+        self._report_acked = acked
+        self._report_generated = generated
+        return line + "."
+
+
+class MetricsServer:
+    """Serves the metrics on http://<host>:<port>/metrics from a daemon thread, e.g. for Prometheus."""
+
+    def __init__(self, metrics, host='127.0.0.1', port=9355):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_address(text, default_host='127.0.0.1'):
+    """Turn '[HOST:]PORT' into (host, port)."""
+    host, _, port = text.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError("'{0}' isn't a port or HOST:PORT.".format(text))
+    if not 0 <= port < 65536:
+        raise ValueError("The port {0} is out of range.".format(port))
+    return host or default_host, port
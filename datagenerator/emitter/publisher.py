@@ -0,0 +1,109 @@
+"""
+Publishing to the MQTT broker with bounded memory under load.
+"""
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+DEFAULT_QOS = 0
+DEFAULT_MAX_INFLIGHT = 20  # messages sent but not acknowledged by the broker (QoS 1 and 2)
+DEFAULT_MAX_PENDING = 1000  # messages handed to paho but not yet sent or acknowledged
+REPORT_INTERVAL = 5.0  # seconds
+
+
+class Publisher:
+    """Wraps a connected paho client: runs its network loop once, publishes with a fixed QoS and counts acks.
+
+    At most <max_pending> messages are waiting in paho's outgoing queue. Beyond this watermark publish() either
+    blocks until the broker catches up or, with <shed> set, drops the message, so memory stays bounded when the
+    broker slows down. A message counts as acked once paho reports it as published, which means sent for QoS 0,
+    PUBACK for QoS 1 and PUBCOMP for QoS 2."""
+
+    def __init__(self, client, qos=DEFAULT_QOS, max_inflight=DEFAULT_MAX_INFLIGHT,
+                 max_pending=DEFAULT_MAX_PENDING, shed=False):
+        if qos not in (0, 1, 2):
+            raise ValueError("QoS must be 0, 1 or 2.")
+        self.client = client
+        self.qos = qos
+        self.max_pending = max_pending
+        self.shed = shed
+
+        self.published = 0  # handed to paho
+        self.acked = 0
+        self.dropped = 0  # shed because too many messages were pending
+        self.failed = 0  # rejected by paho, e.g. QoS 0 while disconnected
+
+        self._condition = threading.Condition()
+        self._started = False
+        self._report_time = time.monotonic()
+        self._report_acked = 0
+
+        client.max_inflight_messages_set(max_inflight)
+        client.on_publish = self._on_publish
+
+    def start(self):
+        """Start the network loop in a background thread. Calling it again does nothing."""
+        if not self._started:
+            self.client.loop_start()
+            self._started = True
+
+    def stop(self, timeout=5.0):
+        """Wait up to <timeout> seconds for pending messages, then disconnect and stop the network loop."""
+        self.flush(timeout)
+        self.client.disconnect()
+        if self._started:
+            self.client.loop_stop()
+            self._started = False
+
+    def pending(self):
+        return self.published - self.acked - self.failed
+
+    def publish(self, topic, payload):
+        """Publish <payload> on <topic>. Returns False if the message was shed or rejected."""
+        with self._condition:
+            while self.pending() >= self.max_pending:
+                if self.shed:
+                    self.dropped += 1
+                    return False
+                self._condition.wait(1.0)
+            self.published += 1  # reserve before publishing, the ack may arrive before publish() returns
+
+        # paho calls on_publish while holding its own locks, so our lock must not be held here
+        info = self.client.publish(topic, payload, self.qos)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS or (info.rc == mqtt.MQTT_ERR_NO_CONN and self.qos > 0):
+            return True  # QoS 1 and 2 messages are kept by paho and sent after reconnecting
+
+        with self._condition:
+            self.failed += 1
+            self._condition.notify_all()
+        return False
+
+    def _on_publish(self, client, userdata, mid):
+        with self._condition:
+            self.acked += 1
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until all published messages are acked. Returns False if <timeout> seconds passed before."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.pending() > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def report(self, report_interval=REPORT_INTERVAL):
+        """Return a line with the counters and the acked rate since the last report, or None if it isn't due."""
+        now = time.monotonic()
+        window = now - self._report_time
+        if window < report_interval:
+            return None
+
+        acked = self.acked
+        rate = (acked - self._report_acked) / window
+        self._report_time = now
+        self._report_acked = acked
+        return "Published {0}, acked {1} ({2:.1f} msg/s), pending {3}, dropped {4}, failed {5}.".format(
+            self.published, acked, rate, self.pending(), self.dropped, self.failed)
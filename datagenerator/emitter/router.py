@@ -0,0 +1,98 @@
+"""
+Routing of requests to topics and brokers, for load tests of consumers which are sharded by area, type or device.
+"""
+import math
+import string
+import zlib
+import numpy as np
+
+DEFAULT_PORT = 1883
+DEFAULT_CELL_SIZE = 0.05  # degrees, about 5.5 km north-south
+ROUTE_FIELDS = ('device', 'transportation', 'purpose', 'cell', 'topic')
+
+
+def parse_brokers(spec):
+    """Split a comma separated list of 'host[:port]' into (host, port) tuples."""
+    brokers = []
+    for address in spec.split(','):
+        host, _, port = address.strip().partition(':')
+        if not host:
+            raise ValueError("Empty broker address in '{0}'.".format(spec))
+        brokers.append((host, int(port) if port else DEFAULT_PORT))
+    return brokers
+
+
+def cell_of(latitude, longitude, cell_size=DEFAULT_CELL_SIZE):
+    """Name the grid cell of a coordinate as '<row>_<column>', counted from the south-west corner of the globe."""
+    return "{0}_{1}".format(int(math.floor((latitude + 90.0) / cell_size)),
+                            int(math.floor((longitude + 180.0) / cell_size)))
+
+
+def shard_of(key, shards):
+    """Map a routing key to one of <shards> brokers, the same way in every process and run."""
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+class Router:
+    """Picks the topic and the broker of every request.
+
+    The <topic> may contain the fields {device}, {transportation}, {purpose} and {cell} (the grid cell of the
+    origin with an edge of <cell_size> degrees), e.g. 'travel_requests/{cell}'. Each request is sent to one of
+    <brokers> brokers chosen by hashing its <shard_by> field, by default its topic, so all requests of a topic
+    reach the same broker."""
+
+    def __init__(self, topic, brokers=1, shard_by='topic', cell_size=DEFAULT_CELL_SIZE):
+        names = {name for _, name, _, _ in string.Formatter().parse(topic) if name is not None}
+        unknown = names - set(ROUTE_FIELDS[:-1])
+        if unknown:
+            raise ValueError("Unknown topic fields: {0}.".format(", ".join(sorted(unknown))))
+        if shard_by not in ROUTE_FIELDS:
+            raise ValueError("Can't shard by '{0}', use one of {1}.".format(shard_by, ", ".join(ROUTE_FIELDS)))
+        if cell_size <= 0:
+            raise ValueError("The cell size must be positive.")
+        self.topic = topic
+        self.fields = names
+        self.brokers = brokers
+        self.shard_by = shard_by
+        self.cell_size = cell_size
+        self._shards = {}  # routing key -> broker index
+        self._static_route = (shard_of(topic, brokers) if brokers > 1 else 0, topic)
+
+    def is_static(self):
+        """True if all requests go to the same topic on the same broker."""
+        return not self.fields and (self.brokers == 1 or self.shard_by == 'topic')
+
+    def _route(self, values):
+        topic = self.topic.format(**values) if self.fields else self.topic
+        if self.brokers == 1:
+            return 0, topic
+        key = topic if self.shard_by == 'topic' else values[self.shard_by]
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = self._shards[key] = shard_of(key, self.brokers)
+        return shard, topic
+
+    def route(self, request):
+        """Return (broker index, topic) of a TravelRequest."""
+        if self.is_static():
+            return self._static_route
+        return self._route({
+            'device': request.device_id,
+            'transportation': request.transportation_type,
+            'purpose': request.purpose,
+            'cell': cell_of(request.origin.latitude, request.origin.longitude, self.cell_size),
+        })
+
+    def route_batch(self, batch):
+        """Return a list of (broker index, topic) for all requests of a RequestBatch."""
+        if self.is_static():
+            return [self._static_route] * len(batch)
+
+        rows = np.floor((batch.origin_latitudes + 90.0) / self.cell_size).astype(np.int64)
+        columns = np.floor((batch.origin_longitudes + 180.0) / self.cell_size).astype(np.int64)
+        transportation = batch.transportation_type_labels
+        purposes = batch.purpose_labels
+        return [self._route({'device': device, 'transportation': transportation[t], 'purpose': purposes[p],
+                             'cell': "{0}_{1}".format(row, column)})
+                for device, t, p, row, column in zip(batch.device_ids.tolist(), batch.transportation_types.tolist(),
+                                                     batch.purposes.tolist(), rows.tolist(), columns.tolist())]
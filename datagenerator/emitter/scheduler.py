@@ -0,0 +1,283 @@
+"""
+Timing of emitted requests based on absolute deadlines instead of fixed sleeps.
+"""
+import math
+import time
+from datetime import datetime
+from datagenerator.emitter.log_index import read_issuance
+
+
+class DeadlineScheduler:
+    """Waits until deadlines given in seconds after the start of the scheduler.
+
+    Since every deadline is measured from the same start, time spent between two waits (creating, logging and
+    publishing a request) is compensated automatically and delays don't add up to a drift."""
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.started_at = None
+        self.max_lag = 0.0  # seconds the scheduler was behind its deadlines at most
+
+    def start(self):
+        self.started_at = self.clock()
+        self.max_lag = 0.0
+
+    def elapsed(self):
+        return self.clock() - self.started_at
+
+    def wait_until(self, deadline):
+        """Sleep until <deadline> seconds after the start. Returns how late the call already was (or 0)."""
+        if self.started_at is None:
+            self.start()
+        remaining = deadline - self.elapsed()
+        if remaining > 0:
+            self.sleep(remaining)
+            return 0.0
+        self.max_lag = max(self.max_lag, -remaining)
+        return -remaining
+
+
+def issuance_schedule(entries, speed=1.0):
+    """Attach replay deadlines to logged (requestId, json) entries following their original issuance.
+
+    The issuance is only logged in whole seconds, so requests issued within the same second are spread evenly
+    over that second. All intervals are divided by <speed>; a speed of 0 means as fast as possible.
+    Yields (deadline, requestId, json)."""
+    first_issuance = None
+    second = None
+    group = []
+
+    def emit(group_second):
+        for position, (request_id, payload) in enumerate(group):
+            offset = group_second - first_issuance + position / len(group)
+            yield (offset / speed if speed > 0 else 0.0), request_id, payload
+
+    for request_id, payload in entries:
+        issuance = read_issuance(payload)
+        if first_issuance is None:
+            first_issuance = second = issuance
+        if issuance != second:
+            yield from emit(second)
+            group = []
+            second = issuance
+        group.append((request_id, payload))
+
+    if group:
+        yield from emit(second)
+
+
+class ConstantRate:
+    """Always the same number of messages per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def __call__(self, elapsed):
+        return self.rate
+
+    def __str__(self):
+        return "{0} msg/s".format(self.rate)
+
+
+class StepRate:
+    """Rate that jumps to new values at given times. <steps> is a list of (start in seconds, rate)."""
+
+    def __init__(self, steps):
+        self.steps = sorted(steps)
+
+    def __call__(self, elapsed):
+        rate = self.steps[0][1]
+        for start, step_rate in self.steps:
+            if start > elapsed:
+                break
+            rate = step_rate
+        return rate
+
+    def __str__(self):
+        return "steps " + ", ".join("{0} msg/s after {1} s".format(rate, start) for start, rate in self.steps)
+
+
+class LinearRamp:
+    """Rate growing linearly from <start_rate> to <end_rate> within <duration> seconds, then staying there."""
+
+    def __init__(self, start_rate, end_rate, duration):
+        self.start_rate = start_rate
+        self.end_rate = end_rate
+        self.duration = duration
+
+    def __call__(self, elapsed):
+        if elapsed >= self.duration:
+            return self.end_rate
+        return self.start_rate + (self.end_rate - self.start_rate) * elapsed / self.duration
+
+    def __str__(self):
+        return "ramp from {0} to {1} msg/s within {2} s".format(self.start_rate, self.end_rate, self.duration)
+
+
+class SineRate:
+    """Rate oscillating around <mean> by <amplitude> with a <period> in seconds, lowest at elapsed + phase = 0."""
+
+    def __init__(self, mean, amplitude, period=86400, phase=0.0):
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period
+        self.phase = phase
+
+    def __call__(self, elapsed):
+        return max(0.0, self.mean - self.amplitude * math.cos(2 * math.pi * (elapsed + self.phase) / self.period))
+
+    def __str__(self):
+        return "{0} +/- {1} msg/s over {2} s".format(self.mean, self.amplitude, self.period)
+
+
+class ScaledRate:
+    """Another profile multiplied by a constant <factor>, e.g. to split a rate between several workers."""
+
+    def __init__(self, profile, factor):
+        self.profile = profile
+        self.factor = factor
+
+    def __call__(self, elapsed):
+        return self.profile(elapsed) * self.factor
+
+    def __str__(self):
+        return "{0} of {1}".format(self.factor, self.profile)
+
+
+def parse_rate_profile(spec, now=None):
+    """Create a rate profile from a command line specification. Raises ValueError for invalid ones.
+
+    '100'                     constant 100 msg/s
+    'step:10@0,50@60,100@120' 10 msg/s, after 60 s 50 msg/s, after 120 s 100 msg/s
+    'ramp:10:200:300'         linear ramp from 10 to 200 msg/s within 300 s
+    'sine:100:80[:86400]'     100 +/- 80 msg/s, with the default daily period lowest at 3 am local time
+
+    A profile may pause at a rate of 0 for a while, but it has to end up at a positive rate."""
+    kind, _, arguments = spec.partition(':')
+    try:
+        if not arguments:
+            rate = parse_rate_value(kind)
+            if rate <= 0:
+                raise ValueError("a constant rate must be positive")
+            profile = ConstantRate(rate)
+        elif kind == 'step':
+            steps = sorted((parse_rate_value(start), parse_rate_value(rate)) for rate, start in
+                           (step.split('@') for step in arguments.split(',')))
+            if any(rate < 0 for _, rate in steps):
+                raise ValueError("rates must not be negative")
+            if steps[-1][1] <= 0:
+                raise ValueError("the last step must have a positive rate")
+            profile = StepRate(steps)
+        elif kind == 'ramp':
+            start_rate, end_rate, duration = (parse_rate_value(value) for value in arguments.split(':'))
+            if duration <= 0:
+                raise ValueError("the duration of a ramp must be positive")
+            if start_rate < 0 or end_rate <= 0:
+                raise ValueError("a ramp must start at a rate of at least 0 and end at a positive one")
+            profile = LinearRamp(start_rate, end_rate, duration)
+        elif kind == 'sine':
+            values = [parse_rate_value(value) for value in arguments.split(':')]
+            if len(values) not in (2, 3):
+                raise ValueError("a sine rate needs a mean, an amplitude and optionally a period")
+            mean, amplitude = values[:2]
+            period = values[2] if len(values) == 3 else 86400
+            if period <= 0:
+                raise ValueError("the period must be positive")
+            if mean + abs(amplitude) <= 0:
+                raise ValueError("the highest rate, mean + amplitude, must be positive")
+            # align the curve with the local time of day, so the lowest rate is at 3 am
+            now = datetime.now() if now is None else now
+            seconds_of_day = now.hour * 3600 + now.minute * 60 + now.second
+            profile = SineRate(mean, amplitude, period, (seconds_of_day - 3 * 3600) % period)
+        else:
+            raise ValueError("unknown kind '{0}'".format(kind))
+    except (TypeError, IndexError, ValueError) as e:
+        raise ValueError("Invalid rate profile '{0}': {1}".format(spec, e))
+    return profile
+
+
+def parse_rate_value(value):
+    """A finite float from a rate profile specification."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("'{0}' is not a finite number".format(value))
+    return number
+
+
+class RateScheduler:
+    """Paces messages to follow a rate profile using absolute deadlines.
+
+    The deadline of each message is the previous deadline plus 1/rate, so neither sleep inaccuracy nor the time
+    spent on the messages themselves lowers the rate. If the emitter falls behind by more than <burst> messages,
+    the backlog is dropped instead of catching up in one big burst (like a token bucket)."""
+
+    PAUSE_STEP = 0.1  # seconds to look ahead while the profile is at a rate of 0
+    MAX_PAUSE = 7 * 86400.0  # a profile still at 0 after this many seconds won't send anything anymore
+
+    def __init__(self, profile, burst=100, report_interval=5.0, clock=time.monotonic, sleep=time.sleep):
+        self.profile = profile
+        self.burst = burst
+        self.report_interval = report_interval
+        self.deadlines = DeadlineScheduler(clock, sleep)
+        self.next_deadline = 0.0
+        self.sent = 0
+        self._report_started = 0.0
+        self._report_sent = 0
+
+    def start(self):
+        self.deadlines.start()
+        self.next_deadline = 0.0
+        self.sent = 0
+        self._report_started = 0.0
+        self._report_sent = 0
+
+    def reserve(self):
+        """Take the slot of the next message without waiting for it.
+
+        Returns the seconds until the slot is due, negative if it is already late. Asynchronous code can use this
+        with its own sleep, everything else should call wait_next()."""
+        if self.deadlines.started_at is None:
+            self.start()
+
+        rate = self.profile(self.next_deadline)
+        paused_at = self.next_deadline
+        while not rate > 0:  # paused, look again a bit later
+            if self.next_deadline - paused_at > self.MAX_PAUSE:
+                raise ValueError("The rate profile {0} stays at 0 msg/s.".format(self.profile))
+            self.next_deadline += self.PAUSE_STEP
+            rate = self.profile(self.next_deadline)
+
+        delay = self.next_deadline - self.deadlines.elapsed()
+        if -delay * rate > self.burst:
+            self.next_deadline -= delay + self.burst / rate  # skip the backlog beyond the allowed burst
+        if delay < 0:
+            self.deadlines.max_lag = max(self.deadlines.max_lag, -delay)
+        self.next_deadline += 1.0 / rate
+        self.sent += 1
+        self._report_sent += 1
+        return delay
+
+    def wait_next(self):
+        """Wait until the next message is due. Returns how late it is (or 0)."""
+        delay = self.reserve()
+        if delay > 0:
+            self.deadlines.sleep(delay)
+            return 0.0
+        return -delay
+
+    def report(self):
+        """Return (achieved rate, target rate) since the last report and start a new reporting window.
+
+        Returns None until <report_interval> seconds have passed."""
+        elapsed = self.deadlines.elapsed()
+        window = elapsed - self._report_started
+        if window < self.report_interval:
+            return None
+
+        achieved = self._report_sent / window
+        # average target rate over the window
+        target = sum(self.profile(self._report_started + window * i / 10) for i in range(11)) / 11
+        self._report_started = elapsed
+        self._report_sent = 0
+        return achieved, target
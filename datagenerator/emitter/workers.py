@@ -0,0 +1,78 @@
+"""
+Fan-out of the generator over several processes.
+"""
+import multiprocessing
+import os
+import random
+import signal
+import time
+import numpy as np
+
+REPORT_INTERVAL = 5.0  # seconds between two throughput reports of the parent
+
+
+def worker_filename(filename, worker):
+    """Give every worker its own logfile, e.g. 'run.log' -> 'run.worker2.log'."""
+    stem, extension = os.path.splitext(str(filename))
+    return "{0}.worker{1}{2}".format(stem, worker, extension)
+
+
+def seed_worker(seed, worker, workers):
+    """Seed the random generators of a worker process.
+
+    With a <seed>, every worker gets its own reproducible, independent stream derived from it. Without, the state
+    inherited from the parent is replaced by fresh entropy, so forked workers don't create identical requests."""
+    if seed is None:
+        random.seed()
+        np.random.seed()
+        return None
+
+    worker_seed = int(np.random.SeedSequence(seed).spawn(workers)[worker].generate_state(1)[0])
+    random.seed(worker_seed)
+    np.random.seed(worker_seed)
+    return worker_seed
+
+
+def start_workers(target, args, workers):
+    """Start <workers> processes calling target(*args, worker, workers, sent) and return them with the counters.
+
+    sent is an array shared with the parent in which every worker counts its published messages at sent[worker]."""
+    sent = multiprocessing.RawArray('q', workers)
+    processes = []
+    for worker in range(workers):
+        process = multiprocessing.Process(target=target, args=tuple(args) + (worker, workers, sent),
+                                          name='generator-worker-{0}'.format(worker))
+        process.start()
+        processes.append(process)
+    return processes, sent
+
+
+def monitor_workers(processes, sent, report_interval=REPORT_INTERVAL, verb='published'):
+    """Print the combined throughput of all workers until they are finished or the parent is interrupted.
+
+    <verb> says what the workers do with the requests they count, e.g. 'exported'."""
+    last_total = 0
+    last_time = time.monotonic()
+    try:
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(report_interval / len(processes))
+
+            now = time.monotonic()
+            if now - last_time >= report_interval:
+                total = sum(sent)
+                print("Workers {0} {1} requests, {2:.1f} msg/s in total ({3}).".format(
+                    verb, total, (total - last_total) / (now - last_time),
+                    ", ".join(str(count) for count in sent)))
+                last_total = total
+                last_time = now
+    except KeyboardInterrupt:
+        print("Stopping {0} workers...".format(len(processes)))
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # don't interrupt the shutdown of the workers
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # lets the workers flush their logs
+        for process in processes:
+            process.join()
+    return sum(sent)
@@ -0,0 +1,139 @@
+"""
+Time sources for the issuance of requests and a cached formatter for their departure times.
+"""
+import time
+from datetime import datetime
+import numpy as np
+
+BLOCK_SECONDS = 900  # every time zone offset in use is a multiple of 15 minutes
+MAX_CACHED_BLOCKS = 1 << 16
+# 'MM:SS' of every second within a block, for blocks starting at minute 0, 15, 30 and 45
+BLOCK_SUFFIXES = [['{0:02d}:{1:02d}'.format(quarter * 15 + second // 60, second % 60)
+                   for second in range(BLOCK_SECONDS)] for quarter in range(4)]
+
+
+class SystemClock:
+    """The wall clock, read once per request or once per batch."""
+
+    def now(self):
+        return time.time()
+
+    def tick(self):
+        """Issuance of the next request in epoch seconds."""
+        return int(time.time())
+
+    def ticks(self, count):
+        """Issuance of the next <count> requests: the same second for the whole batch."""
+        return int(time.time())
+
+
+class SimulatedClock:
+    """A clock starting at <start> (epoch seconds) which only advances when requests are issued.
+
+    Every request moves it forward by <interval> seconds, or by as much as a RateScheduler paced with pace() waits
+    between two messages, so the requests of a week follow the same timing as live ones but are created as fast
+    as the CPU allows. Requests at or after <until> aren't issued any more."""
+
+    def __init__(self, start, until=None, interval=1.0):
+        if interval <= 0:
+            raise ValueError("The simulated interval between requests must be positive.")
+        if until is not None and until <= start:
+            raise ValueError("The simulation must end after its start.")
+        self.start = float(start)
+        self.until = until
+        self.interval = interval
+        self.elapsed = 0.0
+        self.scheduler = None
+
+    def pace(self, scheduler):
+        """Advance the clock like <scheduler> waits, which has to use monotonic() and sleep() of this clock."""
+        self.scheduler = scheduler
+
+    def now(self):
+        return self.start + self.elapsed
+
+    def monotonic(self):
+        return self.elapsed
+
+    def sleep(self, seconds):
+        self.elapsed += max(seconds, 0.0)
+
+    def finished(self):
+        return self.until is not None and self.now() >= self.until
+
+    def tick(self):
+        """Advance to the issuance of the next request and return it in epoch seconds, None after the end."""
+        if self.scheduler is None:
+            self.elapsed += self.interval
+        else:
+            self.scheduler.wait_next()
+        return None if self.finished() else int(self.now())
+
+    def ticks(self, count):
+        """Advance over the next <count> requests and return their issuances as an array.
+
+        The array is shorter than <count> if the simulation ends before."""
+        if self.scheduler is None:
+            issuances = self.start + self.elapsed + self.interval * np.arange(1, count + 1)
+            if self.until is not None:
+                issuances = issuances[issuances < self.until]
+            self.elapsed += self.interval * count
+            return issuances.astype(np.int64)
+        issuances = []
+        for _ in range(count):
+            issuance = self.tick()
+            if issuance is None:
+                break
+            issuances.append(issuance)
+        return np.array(issuances, dtype=np.int64)
+
+
+class DepartureFormatter:
+    """Formats epoch seconds as local time like '2020-01-02 03:04:05', the way departures appear in the json.
+
+    The date, hour and minute are cached per 15 minute block, so a departure costs a dictionary lookup and one
+    string concatenation instead of building a datetime."""
+
+    def __init__(self):
+        self.blocks = {}
+
+    def _block(self, block):
+        entry = self.blocks.get(block)
+        if entry is None:
+            if len(self.blocks) >= MAX_CACHED_BLOCKS:
+                self.blocks.clear()
+            start = datetime.fromtimestamp(block * BLOCK_SECONDS)
+            if start.minute % 15 or start.second:
+                entry = (None, 0)  # historic offsets like local mean time, formatted one by one
+            else:
+                entry = (start.strftime('%Y-%m-%d %H:'), start.minute // 15)
+            self.blocks[block] = entry
+        return entry
+
+    def format(self, seconds):
+        block, offset = divmod(int(seconds), BLOCK_SECONDS)
+        prefix, quarter = self._block(block)
+        if prefix is None:
+            return str(datetime.fromtimestamp(int(seconds)))
+        return prefix + BLOCK_SUFFIXES[quarter][offset]
+
+    def format_many(self, seconds):
+        """Format an array of epoch seconds, returning a list of strings."""
+        blocks, offsets = np.divmod(np.asarray(seconds, dtype=np.int64), BLOCK_SECONDS)
+        unique, inverse = np.unique(blocks, return_inverse=True)
+        entries = [self._block(block) for block in unique.tolist()]
+        if any(prefix is None for prefix, _ in entries):
+            return [self.format(value) for value in np.asarray(seconds, dtype=np.int64).tolist()]
+        prefixes = [prefix for prefix, _ in entries]
+        suffixes = [BLOCK_SUFFIXES[quarter] for _, quarter in entries]
+        return [prefixes[i] + suffixes[i][offset] for i, offset in zip(inverse.tolist(), offsets.tolist())]
+
+
+DEPARTURES = DepartureFormatter()
+
+
+def format_departures(seconds):
+    """Format epoch seconds (a number or an array) as departures with the shared formatter."""
+    if np.ndim(seconds):
+        return DEPARTURES.format_many(seconds)
+    return DEPARTURES.format(seconds)
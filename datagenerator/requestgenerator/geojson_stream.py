@@ -0,0 +1,144 @@
+"""
+Streaming reader for GeoJSON FeatureCollections too large to load at once, e.g. country-scale Overpass extracts.
+"""
+import json
+import re
+
+DEFAULT_CHUNK_SIZE = 1 << 20  # characters read at once
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonStream:
+    """Reads json values one by one from a file, keeping only the unparsed rest of the current chunk in memory."""
+
+    def __init__(self, f, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _read(self, size):
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Return the next character that isn't whitespace without consuming it, '' at the end of the file."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read(self.chunk_size):
+                return ''
+
+    def expect(self, character):
+        found = self.peek()
+        if found != character:
+            raise ValueError("Expected '{0}' but found '{1}' in the json stream.".format(character, found))
+        self.position += 1
+
+    def value(self):
+        """Decode the next complete json value, reading more of the file as long as it is cut off."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number at the very end of the buffer might continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._read(size):
+                continue  # decode once more, now knowing that nothing follows
+            size *= 2  # big features need fewer attempts
+
+
+def iter_features(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the features of a GeoJSON FeatureCollection one by one.
+
+    Other members of the collection are skipped, wherever they are. Memory use is bounded by the largest feature
+    and the chunk size instead of the size of the file."""
+    with open(filename, encoding='utf-8') as f:
+        stream = JsonStream(f, chunk_size)
+        stream.expect('{')
+        while stream.peek() != '}':
+            key = stream.value()
+            stream.expect(':')
+            if key != 'features':
+                stream.value()
+            else:
+                stream.expect('[')
+                while stream.peek() != ']':
+                    yield stream.value()
+                    if stream.peek() == ',':
+                        stream.position += 1
+                stream.expect(']')
+            if stream.peek() == ',':
+                stream.position += 1
+
+
+def _mean(points):
+    longitudes, latitudes = zip(*((point[0], point[1]) for point in points))
+    return sum(longitudes) / len(longitudes), sum(latitudes) / len(latitudes)
+
+
+def _ring_centroid(ring):
+    """Area and centroid of a closed ring by the shoelace formula, in degrees (planar, fine within a feature).
+
+    Plain Python is faster than NumPy for the few vertices of typical stops and stations."""
+    origin_x, origin_y = ring[0][0], ring[0][1]  # relative coordinates keep the cross products precise
+    area = centroid_x = centroid_y = 0.0
+    previous_x, previous_y = 0.0, 0.0
+    for point in ring[1:] + ring[:1]:
+        x, y = point[0] - origin_x, point[1] - origin_y
+        cross = previous_x * y - x * previous_y
+        area += cross
+        centroid_x += (previous_x + x) * cross
+        centroid_y += (previous_y + y) * cross
+        previous_x, previous_y = x, y
+    if abs(area) < 1e-18:
+        return 0.0, _mean(ring)
+    return abs(area) / 2, (origin_x + centroid_x / (3 * area), origin_y + centroid_y / (3 * area))
+
+
+def geometry_centroid(geometry):
+    """Return a representative (longitude, latitude) of a GeoJSON geometry, None for empty geometries.
+
+    Points are taken as they are. Polygons (areas like stations, ways and relations) use the centroid of their
+    outer ring, multipolygons the area-weighted centroid of their parts, and lines the mean of their vertices."""
+    if not geometry:
+        return None
+    kind = geometry.get('type')
+    if kind == 'GeometryCollection':
+        centroids = [c for c in (geometry_centroid(g) for g in geometry.get('geometries', [])) if c is not None]
+        return _mean(centroids) if centroids else None
+
+    coordinates = geometry.get('coordinates')
+    if not coordinates:
+        return None
+    if kind == 'Point':
+        return float(coordinates[0]), float(coordinates[1])
+    if kind in ('MultiPoint', 'LineString'):
+        return _mean(coordinates)
+    if kind == 'MultiLineString':
+        return _mean([point for line in coordinates for point in line])
+    if kind in ('Polygon', 'MultiPolygon'):
+        polygons = [coordinates] if kind == 'Polygon' else coordinates
+        parts = [_ring_centroid(polygon[0]) for polygon in polygons if polygon and polygon[0]]
+        if not parts:
+            return None
+        total = sum(area for area, _ in parts)
+        if total <= 0:
+            return _mean([centroid for _, centroid in parts])
+        return (sum(area * centroid[0] for area, centroid in parts) / total,
+                sum(area * centroid[1] for area, centroid in parts) / total)
+    raise ValueError("Unknown geometry type '{0}'.".format(kind))
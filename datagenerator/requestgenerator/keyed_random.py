@@ -0,0 +1,48 @@
+"""
+Counter-based random numbers keyed on the seed, the device and the request id, so every request can be regenerated.
+"""
+import numpy as np
+
+# uniform numbers reserved for every request, the columns of KeyedRandom.uniforms()
+ORIGIN, ORIGIN_DISTANCE, ORIGIN_ANGLE = 0, 1, 2
+DESTINATION, DESTINATION_DISTANCE, DESTINATION_ANGLE = 3, 4, 5
+TRIP_LENGTH = 6  # two columns, a normal trip length needs both
+DEPARTURE, PURPOSE, TRANSPORTATION_TYPE, DEVICE = 8, 9, 10, 11
+DRAWS_PER_REQUEST = 12
+BLOCKS_PER_REQUEST = DRAWS_PER_REQUEST // 4  # Philox yields four numbers per step of its counter
+MAX_SPREAD = 64  # read ids further apart than this on average one by one instead of the stream between them
+
+
+class KeyedRandom:
+    """The random numbers of request k are Philox output at counter k, keyed on (<seed>, <device>).
+
+    Nothing depends on the requests created before, so the same ids give the same requests in any order, in
+    any process and with any number of workers, and request k is regenerated without creating the others."""
+
+    def __init__(self, seed, device=0):
+        self.seed = int(seed)
+        self.device = int(device)
+        entropy = [value & 0xFFFFFFFFFFFFFFFF for value in (self.seed, self.device)]
+        self.key = np.random.SeedSequence(entropy).generate_state(2, dtype=np.uint64)
+
+    def _raw(self, first, count):
+        """<count> rows of DRAWS_PER_REQUEST raw 64 bit numbers for the consecutive ids from <first> on."""
+        generator = np.random.Philox(key=self.key, counter=int(first) * BLOCKS_PER_REQUEST)
+        return generator.random_raw(count * DRAWS_PER_REQUEST).reshape(count, DRAWS_PER_REQUEST)
+
+    def uniforms(self, request_ids):
+        """Uniform numbers in [0, 1) for every id, an array of shape (len(request_ids), DRAWS_PER_REQUEST).
+
+        Ids close to each other, like the consecutive or striped ids of a batch, are read from one stream."""
+        ids = np.asarray(request_ids, dtype=np.int64).reshape(-1)
+        if len(ids) == 0:
+            return np.empty((0, DRAWS_PER_REQUEST))
+        if np.any(ids < 0):
+            raise ValueError("Request ids must not be negative.")
+        first = int(ids.min())
+        span = int(ids.max()) - first + 1
+        if span <= MAX_SPREAD * len(ids):
+            raw = self._raw(first, span)[ids - first]
+        else:
+            raw = np.concatenate([self._raw(request_id, 1) for request_id in ids.tolist()])
+        return (raw >> np.uint64(11)) * (1.0 / (1 << 53))
@@ -2,92 +2,132 @@
 Script to handle data files produced with overpass.
 """
 import uuid
-import calendar
-import json
 from datagenerator.utils import path_utils
 import random
-from datagenerator.requestgenerator.travel_request import TravelRequest, Issuance, TimeStamp, Coordinate, Device, \
+from datagenerator.requestgenerator.travel_request import TravelRequest, Issuance, Coordinate, Device, \
     Purpose, TransportationType
-from datagenerator.requestgenerator.geometric_operations import shift_coordinate
+from datagenerator.requestgenerator.geometric_operations import shift_coordinate, shift_coordinates
+from datagenerator.requestgenerator.request_batch import RequestBatch
+from datagenerator.requestgenerator.clock import SystemClock, SimulatedClock, format_departures
+from datagenerator.requestgenerator.weighted_sampler import WeightedSampler
+from datagenerator.requestgenerator import keyed_random as keyed
+from datagenerator.requestgenerator.keyed_random import KeyedRandom
+from datagenerator.requestgenerator.spatial_index import SeedGrid, parse_trip_length
+from datagenerator.requestgenerator.seed_cache import SeedCache, load_seeds
+from datagenerator.requestgenerator.seed_weights import compute_weights, parse_weights
+from datagenerator.emitter.log_writer import RequestLogWriter, close_on_exit, DEFAULT_FLUSH_INTERVAL
+from datagenerator.emitter.block_log import BlockLogWriter, open_log_reader, import_zstandard, CODECS, \
+    BLOCK_LOG_EXTENSION, LOG_EXTENSIONS
+from datagenerator.emitter.scheduler import DeadlineScheduler, RateScheduler, ConstantRate, ScaledRate, \
+    issuance_schedule, parse_rate_profile
+from datagenerator.emitter.workers import start_workers, monitor_workers, seed_worker, worker_filename
+from datagenerator.emitter.publisher import Publisher, DEFAULT_MAX_INFLIGHT, REPORT_INTERVAL
+from datagenerator.emitter.router import Router, parse_brokers, DEFAULT_CELL_SIZE, DEFAULT_PORT
+from datagenerator.emitter.async_pipeline import AsyncPublisher, run_pipeline, DEFAULT_BATCH_SIZE, DEFAULT_PUBLISHERS
+from datagenerator.emitter.metrics import Metrics, MetricsServer, parse_address, DEFAULT_STATS_INTERVAL
+import asyncio
 import paho.mqtt.client as mqtt  # import the client
 import time
 import math
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import getopt
+import signal
 import sys
 import os
-from easygui import fileopenbox
 
 BUS_FILE = path_utils.get_data_path().joinpath('bus_stops_gothenburg.geojson')
 SHIFTING_DISTANCE = 500  # meters of shifting distance
 DEFAULT_OFFSET_DAYS = 7  # length of the interval in generated data
 DEFAULT_SHIFT_DAYS = 0.0  # don't shift the days unless specified
+KEYED_BLOCK_SIZE = 64  # requests created ahead when a keyed generator creates them one by one
 disconnected = True
 last_id: int = -2
 
 
-def load_geo_features(filename):
-    """Opens a json-file containing a list of geo features and returns them as object."""
-    with open(filename, encoding='utf-8') as f:
-        geo_features: object = json.load(f)
-        return geo_features
+def save_request(request: TravelRequest, filename, payload=None):
+    with open(filename, "a") as file:
+        file.write(request.to_numbered_line(payload) + "\n")
 
 
-def extract_coordinate_list(feature_object, coord_limit=None):
-    """Turn a json-object containing features into a list of their coordinates."""
-    feature_list = feature_object['features']
-    coordinate_list = [(feature['geometry']['coordinates']) for feature in feature_list]
-    if coord_limit is not None:
-        np.random.shuffle(coordinate_list)
-        coordinate_list = coordinate_list[:coord_limit]
-    return coordinate_list
+def parse_time(text):
+    """Turn epoch seconds or a local date/time like '2020-01-07 13:45:00' into epoch seconds."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
 
 
-def create_empty_file(filename):
-    with open(filename, "w"):
-        pass
+def create_random_departure(now, max_offset_days: float, shift_days: float, before_only: bool = False):
+    """Draw a departure in epoch seconds up to <max_offset_days> around <now> (epoch seconds), shifted by days."""
+    # do we only want to create random dates which are earlier than now?
+    if before_only:
+        offset_days = random.uniform(0, max_offset_days)
+    else:
+        offset_days = random.uniform(-max_offset_days, max_offset_days)
 
+    return int(now - (offset_days + shift_days) * 86400)
 
-def save_request(request: TravelRequest, filename):
-    with open(filename, "a") as file:
-        file.write(request.to_numbered_line() + "\n")
 
+def create_random_departures(now, count, max_offset_days: float, shift_days: float, before_only: bool = False,
+                             uniforms=None):
+    """Vectorized version of create_random_departure returning an array of epoch seconds.
 
-def create_random_datetime(max_offset_days: float, shift_days: float, before_only: bool = False):
-    # do we only want to create random dates which are earlier than now()?
-    if before_only:
-        offset_days = random.uniform(0, max_offset_days)
+    <now> is a single time or an array with the issuance of every request. The offsets are drawn from
+    <uniforms> (numbers in [0, 1), one per request) if given."""
+    if uniforms is not None:
+        offset_days = uniforms * max_offset_days if before_only else (2 * uniforms - 1) * max_offset_days
+    elif before_only:
+        offset_days = np.random.uniform(0, max_offset_days, count)
     else:
-        offset_days = random.uniform(-max_offset_days, max_offset_days)
+        offset_days = np.random.uniform(-max_offset_days, max_offset_days, count)
 
-    return datetime.now() - timedelta(days=(offset_days + shift_days))
+    return (np.asarray(now, dtype=np.int64) - ((offset_days + shift_days) * 86400).astype(np.int64)).astype(np.int64)
 
 
 class OverpassHandler:
 
-    def __init__(self, filename: str, coord_limit=None):
+    def __init__(self, filename: str, coord_limit=None, cache_dir=None, weights=None):
+        """With a list of weighting rules as <weights> every seed also gets a weight for picking it."""
         self.filename = filename
+        self.cache_dir = cache_dir
+        self.seeds = None
         self.coordinate_list = []
-        self.load_coordinate_list(coord_limit)
-
-    def load_coordinate_list(self, coord_limit=None):
-        """Directly extract the coordinates of features from a json-file."""
-        self.coordinate_list = extract_coordinate_list(load_geo_features(self.filename), coord_limit)
+        self.weights = None
+        self.load_coordinate_list(coord_limit, weights)
+
+    def load_coordinate_list(self, coord_limit=None, weights=None):
+        """Load the coordinates of the features in a json-file through the compiled seed cache.
+
+        The coordinates are an (n, 2) array of longitude and latitude, memory-mapped unless limited."""
+        if not weights:
+            self.seeds = load_seeds(self.filename, self.cache_dir, limit=coord_limit)
+        else:
+            # weigh all seeds before limiting them, so the weights are cached for every limit
+            seeds = load_seeds(self.filename, self.cache_dir, labels=True)
+            seeds.weights = compute_weights(self.filename, seeds, weights, SeedCache(self.cache_dir))
+            self.seeds = seeds.sample(coord_limit)
+        self.coordinate_list = self.seeds.coordinates
+        self.weights = self.seeds.weights
 
     def get_coordinates(self):
         return self.coordinate_list
 
+    def get_weights(self):
+        return self.weights
+
 
 class CoordinatePicker:
 
-    def __init__(self, coordinates):
+    def __init__(self, coordinates, weights=None):
         self.coordinates = coordinates
+        self.seeds = np.asarray(coordinates, dtype=float).reshape(-1, 2)  # columns: longitude, latitude
+        self.sampler = WeightedSampler(weights, size=len(self.seeds))
 
     def pick_randomly(self):
-        """Pick one of the provided coordinates."""
-        coord = random.choice(self.coordinates)
-        return Coordinate(coord[1], coord[0])
+        """Pick one of the provided coordinates (weighted if weights were given)."""
+        longitude, latitude = self.seeds[self.sampler.pick()].tolist()
+        return Coordinate(latitude, longitude)
 
     def pick_randomly_with_circular_uncertainty(self, uncertainty_distance=SHIFTING_DISTANCE):
         """Pick a coordinate randomly and add uncertainty of upto <distance> meters to it."""
@@ -100,15 +140,86 @@ class CoordinatePicker:
 
         return with_uncertainty
 
+    def pick_many_with_circular_uncertainty(self, count, uncertainty_distance=SHIFTING_DISTANCE, uniforms=None):
+        """Pick <count> coordinates randomly with uncertainty of upto <distance> meters in one vectorized call.
+
+        Returns two arrays (latitudes, longitudes) instead of Coordinate objects. With <uniforms>, an array of
+        numbers in [0, 1) with the columns seed, distance and angle, nothing is drawn."""
+        if uniforms is None:
+            seeds = self.seeds[self.sampler.pick_many(count)]
+            return add_circular_uncertainty(seeds[:, 1], seeds[:, 0], uncertainty_distance)
+        seeds = self.seeds[self.sampler.pick_from_uniforms(uniforms[:, 0])]
+        return add_circular_uncertainty(seeds[:, 1], seeds[:, 0], uncertainty_distance, uniforms[:, 1:3])
+
+
+def add_circular_uncertainty(latitudes, longitudes, uncertainty_distance=SHIFTING_DISTANCE, uniforms=None):
+    """Shift arrays of coordinates to random locations within <uncertainty_distance> meters around them.
+
+    The distances and angles are taken from the two columns of <uniforms> if given."""
+    count = len(latitudes)
+    # make distribution uniform over the area instead of the distance by squaring it
+    if uniforms is None:
+        distances = np.sqrt(np.random.uniform(0, uncertainty_distance ** 2, count))
+        angles_rad = np.random.uniform(0, 2 * math.pi, count)
+    else:
+        distances = np.sqrt(uniforms[:, 0]) * uncertainty_distance
+        angles_rad = uniforms[:, 1] * (2 * math.pi)
+    return shift_coordinates(latitudes, longitudes, angles_rad, distances)
+
+
+class DestinationPicker:
+    """Picks destinations at a distance from the origin that follows a trip-length distribution.
+
+    A point at a sampled distance in a random direction is snapped to the nearest seed, found with a SeedGrid.
+    Where seeds are sparse the trips get longer or shorter accordingly, just like real trips between stops."""
+
+    def __init__(self, coordinates, trip_lengths, cell_size=None):
+        self.seeds = np.asarray(coordinates, dtype=float).reshape(-1, 2)  # columns: longitude, latitude
+        self.grid = SeedGrid(self.seeds[:, 1], self.seeds[:, 0], cell_size)
+        self.trip_lengths = trip_lengths
+
+    def pick_many_near(self, latitudes, longitudes, uncertainty_distance=SHIFTING_DISTANCE, uniforms=None):
+        """Pick a destination for each origin, with uncertainty of upto <distance> meters.
+
+        Returns two arrays (latitudes, longitudes). With <uniforms> nothing is drawn, its columns are the
+        direction of the trip, the distance and angle of the uncertainty and two for the trip length."""
+        count = len(latitudes)
+        if uniforms is None:
+            angles_rad = np.random.uniform(0, 2 * math.pi, count)
+            trip_lengths = self.trip_lengths.sample(count)
+        else:
+            angles_rad = uniforms[:, 0] * (2 * math.pi)
+            trip_lengths = self.trip_lengths.from_uniforms(uniforms[:, 3:5])
+        wanted_latitudes, wanted_longitudes = shift_coordinates(latitudes, longitudes, angles_rad, trip_lengths)
+        seeds = self.seeds[self.grid.nearest_many(wanted_latitudes, wanted_longitudes)[0]]
+        return add_circular_uncertainty(seeds[:, 1], seeds[:, 0], uncertainty_distance,
+                                        None if uniforms is None else uniforms[:, 1:3])
+
+    def pick_near(self, origin: Coordinate, uncertainty_distance=SHIFTING_DISTANCE):
+        """Pick a destination for a single origin Coordinate."""
+        latitudes, longitudes = self.pick_many_near(np.array([origin.latitude]), np.array([origin.longitude]),
+                                                    uncertainty_distance)
+        return Coordinate(float(latitudes[0]), float(longitudes[0]))
+
 
 class IdTracker:
 
-    def __init__(self):
-        self.current_id = 1
+    def __init__(self, start=1, step=1):
+        """Hand out the ids start, start + step, start + 2 * step, ...
+
+        Several generators sharing a device use the same step and different starts to avoid collisions."""
+        self.current_id = start
+        self.step = step
 
     def next(self):
         result = self.current_id
-        self.current_id = self.current_id + 1
+        self.current_id = self.current_id + self.step
+        return result
+
+    def next_many(self, count):
+        """Reserve <count> consecutive ids at once and return them as an array."""
+        result = np.arange(count, dtype=np.int64) * self.step + self.current_id
+        self.current_id = self.current_id + count * self.step
         return result
 
 
@@ -122,21 +233,40 @@ class PurposePicker:
         if p is None or len(p) != len(self.purposes):
             p = [1 / len(self.purposes) for _ in self.purposes]
 
-        total_likelihood = sum(p)
-        self.borders = [likelihood / total_likelihood for likelihood in np.cumsum(p)]
+        self.sampler = WeightedSampler(p)
+        self.borders = self.sampler.cdf_list
 
     def pick_random(self):
-        rand = np.random.uniform()
-        return self.purposes[next(i for i, v in enumerate(self.borders) if v >= rand)]
+        return self.purposes[self.sampler.pick()]
+
+    def pick_many(self, count, uniforms=None):
+        """Return the indices of <count> randomly picked purposes, from <uniforms> if given."""
+        if uniforms is not None:
+            return self.sampler.pick_from_uniforms(uniforms)
+        return self.sampler.pick_many(count)
 
 
 class DevicePicker:
 
-    def __init__(self, devices):
+    def __init__(self, devices, p=None):
+        if p is not None and len(p) != len(devices):
+            p = None
         self.devices = devices
+        self.device_array = np.asarray(devices, dtype=np.int64)
+        self.sampler = WeightedSampler(p, size=len(devices))
 
     def pick_random(self):
-        return Device(random.choice(self.devices))
+        return Device(self.devices[self.sampler.pick()])
+
+    def pick_id(self):
+        """Pick a device id without wrapping it into a Device."""
+        return int(self.devices[self.sampler.pick()])
+
+    def pick_many(self, count, uniforms=None):
+        """Return an array of <count> randomly picked device ids, from <uniforms> if given."""
+        if uniforms is not None:
+            return self.device_array[self.sampler.pick_from_uniforms(uniforms)]
+        return self.device_array[self.sampler.pick_many(count)]
 
 
 class TransportationTypePicker:
@@ -146,19 +276,30 @@ class TransportationTypePicker:
         if p is None or len(p) != len(types):
             p = [1 / len(types) for _ in types]
         self.transportation_types = types
-        total_likelihood = sum(p)
-        self.borders = [likelihood / total_likelihood for likelihood in np.cumsum(p)]
+        self.sampler = WeightedSampler(p)
+        self.borders = self.sampler.cdf_list
 
     def pick_random(self):
-        rand = np.random.uniform()
-        return self.transportation_types[next(i for i, v in enumerate(self.borders) if v >= rand)]
+        return self.transportation_types[self.sampler.pick()]
+
+    def pick_many(self, count, uniforms=None):
+        """Return the indices of <count> randomly picked transportation types, from <uniforms> if given."""
+        if uniforms is not None:
+            return self.sampler.pick_from_uniforms(uniforms)
+        return self.sampler.pick_many(count)
 
 
 class RequestCreator:
 
     def __init__(self, id_tracker: IdTracker, devices, coordinate_picker: CoordinatePicker,
                  purpose_picker: PurposePicker, type_picker: TransportationTypePicker,
-                 coordinate_picker_target: CoordinatePicker = None):
+                 coordinate_picker_target: CoordinatePicker = None, destination_picker: DestinationPicker = None,
+                 clock=None, keyed_random=None):
+        """Targets are picked independently of the source unless a <destination_picker> pairs them by distance.
+
+        The issuance of the requests is read from <clock>, the system clock unless a SimulatedClock is given.
+        With a KeyedRandom the fields of every request are drawn from the numbers keyed on its id instead of the
+        global NumPy generator, so any request can be regenerated from its id (and its issuance)."""
         if coordinate_picker_target is None:
             coordinate_picker_target = coordinate_picker
 
@@ -168,20 +309,108 @@ class RequestCreator:
         self.coordinate_picker_target = coordinate_picker_target
         self.purpose_picker = purpose_picker
         self.transportation_type_picker = type_picker
+        self.destination_picker = destination_picker
+        self.clock = SystemClock() if clock is None else clock
+        self.keyed_random = keyed_random
+        self._keyed_block = (0, 1, None, [])  # first id, step, options and fields of the requests created ahead
 
     def create_random_request(self, uncertainty_distance=SHIFTING_DISTANCE, max_offset_days=DEFAULT_OFFSET_DAYS,
                               shift=DEFAULT_SHIFT_DAYS):
-        device_id = self.device_picker.pick_random()
+        request_issuance = self.clock.tick()
+        if request_issuance is None:
+            return None  # the simulated time is over
+        if self.keyed_random is not None:
+            return self._create_keyed_request(request_issuance, uncertainty_distance, max_offset_days, shift)
+        device_id = self.device_picker.pick_id()
         request_id = self.id_tracker.next()
-        request_issuance = calendar.timegm(time.gmtime())
         request_source = self.coordinate_picker_source.pick_randomly_with_circular_uncertainty(uncertainty_distance)
-        request_target = self.coordinate_picker_target.pick_randomly_with_circular_uncertainty(uncertainty_distance)
-        request_timestamp = TimeStamp(create_random_datetime(max_offset_days, shift, True))
+        if self.destination_picker is None:
+            request_target = self.coordinate_picker_target.pick_randomly_with_circular_uncertainty(
+                uncertainty_distance)
+        else:
+            request_target = self.destination_picker.pick_near(request_source, uncertainty_distance)
+        request_timestamp = format_departures(create_random_departure(request_issuance, max_offset_days, shift, True))
         request_purpose = self.purpose_picker.pick_random()
         transportation_type = self.transportation_type_picker.pick_random()
         return TravelRequest(device_id, request_id, request_issuance, request_source, request_target, request_timestamp,
                              request_purpose, transportation_type)
 
+    def create_batch(self, count, uncertainty_distance=SHIFTING_DISTANCE, max_offset_days=DEFAULT_OFFSET_DAYS,
+                     shift=DEFAULT_SHIFT_DAYS):
+        """Create <count> random requests at once as a columnar RequestBatch.
+
+        All fields are drawn as NumPy arrays and the system clock is only read once for the whole batch. A simulated
+        clock may end within the batch, which then holds fewer requests (none after the end)."""
+        request_issuance = self.clock.ticks(count)
+        if np.ndim(request_issuance):
+            count = len(request_issuance)
+        if self.keyed_random is not None:
+            return self._create_keyed_batch(self.id_tracker.next_many(count), request_issuance, uncertainty_distance,
+                                            max_offset_days, shift)
+        device_ids = self.device_picker.pick_many(count)
+        request_ids = self.id_tracker.next_many(count)
+        source_lat, source_long = self.coordinate_picker_source.pick_many_with_circular_uncertainty(
+            count, uncertainty_distance)
+        if self.destination_picker is None:
+            target_lat, target_long = self.coordinate_picker_target.pick_many_with_circular_uncertainty(
+                count, uncertainty_distance)
+        else:
+            target_lat, target_long = self.destination_picker.pick_many_near(source_lat, source_long,
+                                                                             uncertainty_distance)
+        departures = create_random_departures(request_issuance, count, max_offset_days, shift, True)
+        purposes = self.purpose_picker.pick_many(count)
+        transportation_types = self.transportation_type_picker.pick_many(count)
+        return RequestBatch(device_ids, request_ids, request_issuance, source_lat, source_long, target_lat,
+                            target_long, departures, purposes, self.purpose_picker.purposes, transportation_types,
+                            self.transportation_type_picker.transportation_types)
+
+    def _create_keyed_batch(self, request_ids, request_issuance, uncertainty_distance, max_offset_days, shift):
+        count = len(request_ids)
+        uniforms = self.keyed_random.uniforms(request_ids)
+        device_ids = self.device_picker.pick_many(count, uniforms[:, keyed.DEVICE])
+        source_lat, source_long = self.coordinate_picker_source.pick_many_with_circular_uncertainty(
+            count, uncertainty_distance, uniforms[:, keyed.ORIGIN:keyed.ORIGIN_ANGLE + 1])
+        if self.destination_picker is None:
+            target_lat, target_long = self.coordinate_picker_target.pick_many_with_circular_uncertainty(
+                count, uncertainty_distance, uniforms[:, keyed.DESTINATION:keyed.DESTINATION_ANGLE + 1])
+        else:
+            target_lat, target_long = self.destination_picker.pick_many_near(
+                source_lat, source_long, uncertainty_distance, uniforms[:, keyed.DESTINATION:keyed.TRIP_LENGTH + 2])
+        departures = create_random_departures(request_issuance, count, max_offset_days, shift, True,
+                                              uniforms[:, keyed.DEPARTURE])
+        purposes = self.purpose_picker.pick_many(count, uniforms[:, keyed.PURPOSE])
+        transportation_types = self.transportation_type_picker.pick_many(count, uniforms[:, keyed.TRANSPORTATION_TYPE])
+        return RequestBatch(device_ids, request_ids, request_issuance, source_lat, source_long, target_lat,
+                            target_long, departures, purposes, self.purpose_picker.purposes, transportation_types,
+                            self.transportation_type_picker.transportation_types)
+
+    def _create_keyed_request(self, request_issuance, uncertainty_distance, max_offset_days, shift):
+        """Take the next request from a block of the following ids created ahead without an issuance.
+
+        A request only depends on its id, and its departure on the issuance by a fixed number of seconds, so
+        this creates the same requests as create_batch without paying the NumPy overhead for every single one."""
+        request_id = self.id_tracker.next()
+        options = (uncertainty_distance, max_offset_days, shift)
+        first, step, block_options, rows = self._keyed_block
+        index, remainder = divmod(request_id - first, step)
+        if remainder or not 0 <= index < len(rows) or block_options != options:
+            step = self.id_tracker.step
+            batch = self._create_keyed_batch(np.arange(KEYED_BLOCK_SIZE, dtype=np.int64) * step + request_id, 0,
+                                             *options)
+            purposes = np.asarray(batch.purpose_labels, dtype=object)[batch.purposes]
+            types = np.asarray(batch.transportation_type_labels, dtype=object)[batch.transportation_types]
+            rows = list(zip(batch.device_ids.tolist(), batch.origin_latitudes.tolist(),
+                            batch.origin_longitudes.tolist(), batch.destination_latitudes.tolist(),
+                            batch.destination_longitudes.tolist(), batch.departures.tolist(), purposes.tolist(),
+                            types.tolist()))
+            self._keyed_block = (request_id, step, options, rows)
+            index = 0
+        device_id, origin_lat, origin_long, destination_lat, destination_long, departure, purpose, \
+            transportation_type = rows[index]
+        return TravelRequest(device_id, request_id, request_issuance, Coordinate(origin_lat, origin_long),
+                             Coordinate(destination_lat, destination_long),
+                             format_departures(request_issuance + departure), purpose, transportation_type)
+
     def create_timed_request(self, timestamp):
         source = self.picker.pick()
         target = self.picker.pick()
@@ -193,7 +422,29 @@ class RequestCreator:
         return TravelRequest(source, target, issuance)
 
 
+def create_request_creator(devices, coordinate_filename=BUS_FILE, coord_limit=None, weights=None, trip_lengths=None,
+                           id_tracker=None, clock=None, keyed_random=None, cache_dir=None):
+    """Set up the RequestCreator of the generator: origins and destinations are picked from the seeds of
+    <coordinate_filename> (weighted by the rules <weights>), paired at <trip_lengths> if given.
+    The compiled seeds are cached in <cache_dir>, the user's cache folder by default.
+
+    Raises ValueError or OSError if the seeds can't be loaded."""
+    op_handler = OverpassHandler(coordinate_filename, coord_limit, cache_dir=cache_dir, weights=weights)
+    coord_picker = CoordinatePicker(op_handler.get_coordinates(), op_handler.get_weights())
+    trans_type_picker = TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75])
+    purpose_picker = PurposePicker(p=[5, 3, 1, 1])
+
+    destination_picker = None
+    if trip_lengths is not None:
+        destination_picker = DestinationPicker(op_handler.get_coordinates(), trip_lengths)
+    return RequestCreator(IdTracker() if id_tracker is None else id_tracker, devices, coord_picker, purpose_picker,
+                          trans_type_picker, destination_picker=destination_picker, clock=clock,
+                          keyed_random=keyed_random)
+
+
 def on_disconnect(clients, userdata, rc):
+    if rc == 0:
+        return  # disconnected on purpose
     print("Unexpected disconnection.")
     print("Last requestId before loss of connection: #{0}".format(last_id))
     print("trying to reconnect... ")
@@ -204,14 +455,14 @@ def on_connect(client, userdata, flags, rc):
     print("Last requestId before connection was established: #{0}".format(last_id))
 
 
-def create_client(client_name, broker_address):
+def create_client(client_name, broker_address, port=DEFAULT_PORT):
     # Set up topic to publish to using mqtt
     connected = False
     client = mqtt.Client(client_name)
     attempts = 5
     while not connected:
         try:
-            client.connect(broker_address)
+            client.connect(broker_address, port)
             connected = True
         except ConnectionRefusedError as e:
             print("Failed to create a client with following error:")
@@ -234,12 +485,46 @@ def create_client(client_name, broker_address):
     return client
 
 
-def run(argv):
+PUBLISHER_OPTIONS = ['qos=', 'max_inflight=', 'max_pending=', 'shed']
+
+
+def parse_publisher_options(opts):
+    """Collect the keyword arguments for a Publisher from the parsed command line options."""
+    kwargs = {}
+    for opt, arg in opts:
+        try:
+            if opt == '--qos':
+                kwargs['qos'] = int(arg)
+                if kwargs['qos'] not in (0, 1, 2):
+                    raise ValueError
+            elif opt == '--max_inflight':
+                kwargs['max_inflight'] = int(arg)
+            elif opt == '--max_pending':
+                kwargs['max_pending'] = int(arg)
+            elif opt == '--shed':
+                kwargs['shed'] = True
+        except ValueError:
+            sys.exit("Argument [{0}] must be an integer (QoS: 0, 1 or 2). Exit.".format(opt))
+    return kwargs
+
+
+def run(argv, worker=None, workers=1, sent=None):
+    """Continuously create and publish requests as configured by the command line arguments <argv>.
+
+    With --workers N the requests are created by N processes, each calling run() with its <worker> index,
+    the number of <workers> and the shared array <sent> to count its published requests in."""
+    global last_id
+
     # read the passed list of arguments into opts (names) and args (values)
     try:
-        opts, args = getopt.getopt(argv, 'i:b:t:c:d:ps:o:l:f:O:D:',
-                                   ['ifile=', 'broker=', 'topic=', 'client=', 'device=', 'print',
-                                    'sleep=', 'offset=', 'limit=', 'filename=', 'days_offset=', 'shift_days='])
+        opts, args = getopt.getopt(argv, 'i:b:t:c:d:pPs:o:l:f:O:D:',
+                                   ['ifile=', 'broker=', 'topic=', 'client=', 'device=', 'print', 'pretty',
+                                    'sleep=', 'offset=', 'limit=', 'filename=', 'days_offset=', 'shift_days=',
+                                    'flush_interval=', 'rotate_size=', 'rotate_interval=', 'log_thread', 'rate=',
+                                    'workers=', 'seed=', 'async', 'batch=', 'publishers=', 'shard_by=',
+                                    'cell_size=', 'trip_length=', 'weights=', 'simulate=', 'until=', 'metrics=',
+                                    'stats_interval=', 'log_format='] +
+                                   PUBLISHER_OPTIONS)
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
@@ -251,13 +536,34 @@ def run(argv):
     client_name = 'random client'
     topic = 'travel_requests'
     device = uuid.getnode()
-    save_filename = str(device) + ".log"
+    save_filename = str(device)  # the extension follows the log format
     do_print = False
+    pretty = False
     sleep = 0.01
     offset = SHIFTING_DISTANCE
     max_offset_days = DEFAULT_OFFSET_DAYS
     coord_limit = None
     shift_days = DEFAULT_SHIFT_DAYS
+    flush_interval = DEFAULT_FLUSH_INTERVAL
+    rotate_size = None
+    rotate_interval = None
+    log_thread = False
+    rate_profile = None
+    rate_spec = None
+    worker_count = 1
+    seed = None
+    use_async = False
+    batch_size = DEFAULT_BATCH_SIZE
+    publisher_tasks = DEFAULT_PUBLISHERS
+    shard_by = 'topic'
+    cell_size = DEFAULT_CELL_SIZE
+    trip_lengths = None
+    weights = []
+    simulate_from = None
+    simulate_until = None
+    metrics_address = None
+    stats_interval = None
+    log_format = 'text'
 
     # parse all command line options into variables
     for opt, arg in opts:
@@ -274,6 +580,8 @@ def run(argv):
         elif opt in ('-p', '--print'):
             do_print = True
             print('Printing mode activated.')
+        elif opt in ('-P', '--pretty'):
+            pretty = True
         elif opt in ('-s', '--sleep'):
             try:
                 sleep = float(arg)
@@ -290,58 +598,376 @@ def run(argv):
             except ValueError:
                 sys.exit("Seed limit argument [-l]/[--limit] must be an integer. Exit.")
         elif opt in ('-f', '--filename'):
-            save_filename = str(arg) + ".log"
+            save_filename = str(arg)
         elif opt in ('-O', '--days_offset'):
             max_offset_days = float(arg)
         elif opt in ('-D', '--shift_days'):
             shift_days = float(arg)
+        elif opt == '--flush_interval':
+            try:
+                flush_interval = float(arg)
+            except ValueError:
+                sys.exit("Flush interval argument [--flush_interval] must be float. Exit.")
+        elif opt == '--rotate_size':
+            try:
+                rotate_size = int(float(arg) * 1024 * 1024)
+            except ValueError:
+                sys.exit("Rotation size argument [--rotate_size] must be float (megabytes). Exit.")
+        elif opt == '--rotate_interval':
+            try:
+                rotate_interval = float(arg)
+            except ValueError:
+                sys.exit("Rotation interval argument [--rotate_interval] must be float (seconds). Exit.")
+        elif opt == '--log_thread':
+            log_thread = True
+        elif opt == '--rate':
+            try:
+                rate_profile = parse_rate_profile(arg)
+                rate_spec = arg
+            except ValueError as e:
+                sys.exit("Rate argument [--rate] is invalid: {0}. Exit.".format(e))
+        elif opt == '--workers':
+            try:
+                worker_count = int(arg)
+                if worker_count < 1:
+                    raise ValueError
+            except ValueError:
+                sys.exit("Workers argument [--workers] must be a positive integer. Exit.")
+        elif opt == '--seed':
+            try:
+                seed = int(arg)
+            except ValueError:
+                sys.exit("Seed argument [--seed] must be an integer. Exit.")
+        elif opt == '--async':
+            use_async = True
+        elif opt in ('--batch', '--publishers'):
+            try:
+                value = int(arg)
+                if value < 1:
+                    raise ValueError
+            except ValueError:
+                sys.exit("Argument [{0}] must be a positive integer. Exit.".format(opt))
+            if opt == '--batch':
+                batch_size = value
+            else:
+                publisher_tasks = value
+        elif opt == '--shard_by':
+            shard_by = arg
+        elif opt == '--cell_size':
+            try:
+                cell_size = float(arg)
+            except ValueError:
+                sys.exit("Cell size argument [--cell_size] must be float (degrees). Exit.")
+        elif opt == '--trip_length':
+            try:
+                trip_lengths = parse_trip_length(arg)
+            except ValueError as e:
+                sys.exit("Trip length argument [--trip_length] is invalid: {0} Exit.".format(e))
+        elif opt == '--weights':
+            try:
+                weights.append(parse_weights(arg))
+            except ValueError as e:
+                sys.exit("Weights argument [--weights] is invalid: {0} Exit.".format(e))
+        elif opt in ('--simulate', '--until'):
+            try:
+                if opt == '--simulate':
+                    simulate_from = parse_time(arg)
+                else:
+                    simulate_until = parse_time(arg)
+            except ValueError:
+                sys.exit("Simulation arguments [--simulate]/[--until] must be epoch seconds or "
+                         "'YYYY-MM-DD HH:MM:SS'. Exit.")
+        elif opt == '--metrics':
+            try:
+                metrics_address = parse_address(arg)
+            except ValueError as e:
+                sys.exit("Metrics argument [--metrics] is invalid: {0} Exit.".format(e))
+        elif opt == '--stats_interval':
+            try:
+                stats_interval = float(arg)
+                if stats_interval <= 0:
+                    raise ValueError
+            except ValueError:
+                sys.exit("Stats interval argument [--stats_interval] must be a positive float (seconds). Exit.")
+        elif opt == '--log_format':
+            if arg != 'text' and arg not in CODECS:
+                sys.exit("Log format argument [--log_format] must be text, {0}. Exit.".format(' or '.join(CODECS)))
+            if arg == 'zstd':
+                try:
+                    import_zstandard()
+                except ValueError as e:
+                    sys.exit("{0} Exit.".format(e))
+            log_format = arg
+    save_filename += '.log' if log_format == 'text' else BLOCK_LOG_EXTENSION
+
+    # a simulation issues requests from its start until the end (or now) without waiting in between
+    clock = None
+    if simulate_from is not None:
+        simulate_until = time.time() if simulate_until is None else simulate_until
+        if rate_spec is not None:
+            rate_profile = parse_rate_profile(rate_spec, datetime.fromtimestamp(simulate_from))
+        try:
+            clock = SimulatedClock(simulate_from, simulate_until, sleep)
+        except ValueError as e:
+            sys.exit("Invalid simulation: {0} Exit.".format(e))
 
-    # Create a coordinate picker using a file containing coordinates as seeds
-    op_handler = OverpassHandler(coordinate_filename, coord_limit)
-    coord_picker = CoordinatePicker(op_handler.get_coordinates())
-    trans_type_picker = TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75])
-    purpose_picker = PurposePicker(p=[5, 3, 1, 1])
-
-    # Create a RequestCreator using random selection for most fields
-    travel_request_creator = RequestCreator(IdTracker(), [device], coord_picker, purpose_picker,
-                                            trans_type_picker)
-
-    # Start client
-    client = create_client(client_name, broker_address)
-
-    # Create empty file with desired filename
-    create_empty_file(save_filename)
+    # route every request to a topic and one of the brokers
+    try:
+        brokers = parse_brokers(broker_address)
+        router = Router(topic, len(brokers), shard_by, cell_size)
+    except ValueError as e:
+        sys.exit("Invalid routing of requests: {0} Exit.".format(e))
+
+    # the parent only starts the workers and reports their combined throughput
+    if worker is None and worker_count > 1:
+        print('Starting {0} generator processes.'.format(worker_count))
+        processes, sent = start_workers(run, [argv], worker_count)
+        total = monitor_workers(processes, sent)
+        print('Workers published {0} requests in total.'.format(total))
+        return
+
+    worker = 0 if worker is None else worker
+    seed_worker(seed, worker, workers)
+    if workers > 1:
+        # each worker publishes its share with its own client, logfile and ids
+        client_name = '{0} {1}'.format(client_name, worker)
+        save_filename = worker_filename(save_filename, worker)
+        if rate_profile is not None:
+            rate_profile = ScaledRate(rate_profile, 1.0 / workers)
+    if clock is not None:
+        if rate_profile is not None:
+            clock.pace(RateScheduler(rate_profile, clock=clock.monotonic, sleep=clock.sleep))
+        print('Simulating requests issued from {0} to {1} as fast as possible.'.format(
+            datetime.fromtimestamp(simulate_from), datetime.fromtimestamp(simulate_until)))
+
+    # Create a RequestCreator using random selection for most fields, with the seeds of a file as coordinates
+    if weights:
+        print('Weighting seeds by {0}.'.format(' * '.join(str(rule) for rule in weights)))
+    if trip_lengths is not None:
+        print('Pairing origins with destinations at {0}.'.format(trip_lengths))
+    # with a seed every request is drawn from numbers keyed on the seed, the device and its id
+    keyed_random = None if seed is None else KeyedRandom(seed, int(device))
+    try:
+        travel_request_creator = create_request_creator([device], coordinate_filename, coord_limit, weights,
+                                                        trip_lengths, IdTracker(worker + 1, workers), clock,
+                                                        keyed_random)
+    except (ValueError, OSError) as e:
+        sys.exit("Can't load the seeds of {0}: {1} Exit.".format(coordinate_filename, e))
+
+    # Open the log file once and make sure it is flushed when the generator is stopped
+    if log_format == 'text':
+        log_writer = RequestLogWriter(save_filename, flush_interval=flush_interval, max_bytes=rotate_size,
+                                      rotate_interval=rotate_interval, background=log_thread)
+    else:
+        log_writer = BlockLogWriter(save_filename, flush_interval=flush_interval, max_bytes=rotate_size,
+                                    rotate_interval=rotate_interval, background=log_thread, codec=log_format,
+                                    pretty=pretty)
+    close_on_exit(log_writer)
+
+    # metrics are only collected if they are served or logged, the loops skip all timing otherwise
+    metrics = None
+    if metrics_address is not None or stats_interval is not None:
+        metrics = Metrics()
+        metrics.watch_log(log_writer)
+        if stats_interval is None:
+            stats_interval = DEFAULT_STATS_INTERVAL
+    if metrics_address is not None:
+        host, port = metrics_address[0], metrics_address[1] + worker  # one port per worker
+        try:
+            MetricsServer(metrics, host, port).start()
+        except OSError as e:
+            sys.exit("Can't serve the metrics on {0}:{1}: {2} Exit.".format(host, port, e))
+        print('Serving metrics on http://{0}:{1}/metrics.'.format(host, port))
+
+    if use_async:
+        def create_batch(count):
+            return travel_request_creator.create_batch(count, offset, max_offset_days, shift_days)
+
+        async_rate = rate_profile if clock is None else None
+        if async_rate is None and clock is None and sleep > 0:
+            async_rate = ConstantRate(1.0 / sleep)  # SLEEP seconds between messages, like the synchronous loop
+        print('Publishing asynchronously in batches of {0} with {1} publisher tasks.'.format(
+            batch_size, publisher_tasks))
+        signum = asyncio.run(publish_async(create_batch, client_name, brokers, router, opts, batch_size,
+                                           publisher_tasks, pretty, log_writer, async_rate, worker, sent, do_print,
+                                           metrics=metrics, stats_interval=stats_interval))
+        if signum is not None:
+            log_writer.close()
+            sys.exit("Stopped by signal {0}. Log written to {1}.".format(signum, log_writer.filename))
+        if clock is not None:
+            log_writer.close()
+            print('Simulation finished, last requestId #{0}. Log written to {1}.'.format(last_id, log_writer.filename))
+        return
+
+    # Start one client and its network loop per broker
+    publishers = []
+    for host, port in brokers:
+        client = create_client(client_name, host, port)
+        if metrics is not None:
+            metrics.watch_client(client)
+        publisher = Publisher(client, **parse_publisher_options(opts))
+        publisher.start()
+        publishers.append(publisher)
+    if metrics is not None:
+        metrics.watch_publishers(publishers)
 
     # Print information before starting to loop
     print('Publisher node has been started.')
     print('Publishing to client at: {}'.format(client_name))
     print('Device: \t', device)
     print('Topic: \t\t', topic)
-    print('Sleeping {} seconds between messages.'.format(sleep))
-
-    global last_id
+    if clock is None and rate_profile is None:
+        print('Sleeping {} seconds between messages.'.format(sleep))
+    elif clock is None:
+        print('Publishing at a rate of {}.'.format(rate_profile))
+        rate_scheduler = RateScheduler(rate_profile)
+        rate_scheduler.start()
+        if metrics is not None:
+            metrics.watch_rate(rate_scheduler)
 
     while True:
         """Loop to continuously create and publish requests."""
-        req = travel_request_creator.create_random_request(offset, max_offset_days, shift_days)
-        save_request(req, save_filename)
-        client.publish(topic, req.to_json())
-        last_id = req.get_id()
-        client.loop_start()
+        if rate_profile is not None and clock is None:
+            rate_scheduler.wait_next()
+            rates = rate_scheduler.report()
+            if rates is not None:
+                print('Achieved {0:.1f} msg/s, target {1:.1f} msg/s.'.format(*rates))
+
+        # publish and log as one step, a signal closes the log only once the published request is in it
+        with log_writer.writing():
+            if metrics is None:
+                req = travel_request_creator.create_random_request(offset, max_offset_days, shift_days)
+                if req is None:
+                    break  # the simulated time is over
+                payload = req.to_json(pretty)  # serialize once, reuse for log and broker
+                broker, request_topic = router.route(req)
+                published = publishers[broker].publish(request_topic, payload)
+            else:
+                started = time.perf_counter()
+                req = travel_request_creator.create_random_request(offset, max_offset_days, shift_days)
+                if req is None:
+                    break
+                created = time.perf_counter()
+                payload = req.to_json(pretty)
+                serialized = time.perf_counter()
+                broker, request_topic = router.route(req)
+                published = publishers[broker].publish(request_topic, payload)
+                metrics.observe_request(started, created, serialized, time.perf_counter())
+                stats = metrics.report(stats_interval)
+                if stats is not None:
+                    print(stats)
+            if published:
+                log_writer.write_request(req, payload)  # only log what was actually published
+                if sent is not None:
+                    sent[worker] += 1
+            last_id = req.get_id()
+
+        for (host, port), publisher in zip(brokers, publishers):
+            report = publisher.report()
+            if report is not None:
+                print(report if len(brokers) == 1 else "{0}:{1}: {2}".format(host, port, report))
 
         if do_print:
-            print(req.to_json())
-            print(req.travelRequest['requestId'])
+            print(payload)
+            print(req.request_id)
+
+        if rate_profile is None and clock is None:
+            time.sleep(sleep)
+
+    for publisher in publishers:
+        publisher.stop()
+    log_writer.close()
+    print('Simulation finished, last requestId #{0}. Log written to {1}.'.format(last_id, log_writer.filename))
+
+
+async def publish_async(create_batch, client_name, brokers, router, opts, batch_size, publisher_tasks,
+                        pretty, log_writer, rate_profile=None, worker=0, sent=None, do_print=False, count=None,
+                        metrics=None, stats_interval=DEFAULT_STATS_INTERVAL):
+    """Publish batches of requests with the asynchronous pipeline until <count> requests are sent (or forever).
+
+    <brokers> is a list of (host, port) with one connection each, the <router> picks topic and broker per request.
+    With <metrics> a stats line is printed every <stats_interval> seconds.
+    Returns the number of the signal that stopped the pipeline, or None."""
+    kwargs = parse_publisher_options(opts)
+    max_inflight = kwargs.pop('max_inflight', DEFAULT_MAX_INFLIGHT)
+    kwargs.pop('shed', None)  # the pipeline never drops messages, it stops generating instead
+    publishers = []
+    for host, port in brokers:
+        client = mqtt.Client(client_name)
+        client.on_disconnect = on_disconnect
+        client.max_inflight_messages_set(max_inflight)
+        if metrics is not None:
+            metrics.watch_client(client)
+        publisher = AsyncPublisher(client, **kwargs)
+        await publisher.connect(host, port)
+        publishers.append(publisher)
+    print("Connection to Mosquitto established successfully.\n")
+
+    rate_scheduler = None
+    if rate_profile is not None:
+        print('Publishing at a rate of {}.'.format(rate_profile))
+        rate_scheduler = RateScheduler(rate_profile)
+        rate_scheduler.start()
+
+    report_time = time.monotonic()
+    report_acked = 0
+
+    def on_published(batch, published):
+        nonlocal report_time, report_acked
+        global last_id
+        last_id = int(batch.request_ids[-1])
+        if sent is not None:
+            sent[worker] += published
+        if do_print:
+            for payload in batch.to_json_list(pretty):
+                print(payload)
+
+        now = time.monotonic()
+        if now - report_time >= REPORT_INTERVAL:
+            acked = sum(publisher.acked for publisher in publishers)
+            print("Published {0}, acked {1} ({2:.1f} msg/s), failed {3}.".format(
+                sum(publisher.published for publisher in publishers), acked,
+                (acked - report_acked) / (now - report_time), sum(publisher.failed for publisher in publishers)))
+            report_time = now
+            report_acked = acked
+        if metrics is not None:
+            stats = metrics.report(stats_interval)
+            if stats is not None:
+                print(stats)
+
+    # stop the pipeline between two messages, the signal handlers of the log writer can't interrupt the event loop
+    stopped = []
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda signum=signum: (stopped.append(signum), task.cancel()))
 
-        time.sleep(sleep)
+    try:
+        await run_pipeline(create_batch, publishers, router, count, batch_size, publishers=publisher_tasks,
+                           pretty=pretty, log_writer=log_writer, rate_scheduler=rate_scheduler,
+                           on_published=on_published, metrics=metrics)
+    except asyncio.CancelledError:
+        if not stopped:
+            raise
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        for publisher in publishers:
+            publisher.disconnect()
+    return stopped[0] if stopped else None
 
 
 def resend_from_logfile(argv):
     # read the passed list of arguments into opts (names) and args (values)
     try:
-        opts, args = getopt.getopt(argv, 'i:b:t:c:d:ps:o:l:f:r',
-                                   ['ifile=', 'broker=', 'topic=', 'client=', 'device=', 'print',
-                                    'sleep=', 'offset=', 'limit=', 'filename=', 'days_offset=', 'resend'])
+        # the logfile is passed as positional argument, also accept it in the form --resend=LOGFILE
+        argv = [part for arg in argv
+                for part in (['--resend', arg.split('=', 1)[1]] if arg.startswith('--resend=') else [arg])]
+        opts, args = getopt.gnu_getopt(argv, 'i:b:t:c:d:pPs:o:l:f:r',
+                                       ['ifile=', 'broker=', 'topic=', 'client=', 'device=', 'print', 'pretty',
+                                        'sleep=', 'offset=', 'limit=', 'filename=', 'days_offset=', 'resend',
+                                        'speed=', 'from=', 'to=', 'from_time=', 'to_time=', 'gui'] +
+                                       PUBLISHER_OPTIONS)
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
@@ -352,6 +978,13 @@ def resend_from_logfile(argv):
     topic = 'travel_requests'
     do_print = False
     sleep = 0.01
+    speed = None
+    filename = args[0] if args else None
+    use_gui = filename is None
+    start = None
+    stop = None
+    start_time = None
+    stop_time = None
 
     # parse all command line options into variables
     for opt, arg in opts:
@@ -369,33 +1002,77 @@ def resend_from_logfile(argv):
                 sleep = float(arg)
             except ValueError:
                 sys.exit("Sleep time argument [-s]/[--sleep] must be float. Exit.")
+        elif opt == '--speed':
+            try:
+                speed = float(arg)
+            except ValueError:
+                sys.exit("Speed argument [--speed] must be float. Exit.")
+        elif opt in ('--from', '--to'):
+            try:
+                if opt == '--from':
+                    start = int(arg)
+                else:
+                    stop = int(arg)
+            except ValueError:
+                sys.exit("Id range arguments [--from]/[--to] must be integers. Exit.")
+        elif opt in ('--from_time', '--to_time'):
+            try:
+                if opt == '--from_time':
+                    start_time = parse_time(arg)
+                else:
+                    stop_time = parse_time(arg)
+            except ValueError:
+                sys.exit("Time range arguments [--from_time]/[--to_time] must be epoch seconds or "
+                         "'YYYY-MM-DD HH:MM:SS'. Exit.")
+        elif opt == '--gui':
+            use_gui = True
 
     print("Publisher node created.")
     print("This publisher repeats travel requests logged during a previous session.\n")
 
-    # open a log file
-    filename = fileopenbox(default="*.log",
-                           filetypes=['*.log'])  # show an "Open" dialog box and return the path to the selected file
-    if filename is None or not filename.endswith(".log"):
-        sys.exit("Failed to open a .log file. Exiting the program at resend#1.\nGood Bye!")
+    # open a log file, only load the GUI if no logfile was passed
+    if use_gui:
+        from easygui import fileopenbox
+        # show an "Open" dialog box and return the path to the selected file
+        filename = fileopenbox(default="*.log", filetypes=['*' + extension for extension in LOG_EXTENSIONS])
+    if filename is None or not filename.endswith(LOG_EXTENSIONS) or not os.path.isfile(filename):
+        sys.exit("Failed to open a .log or {0} file. Exiting the program at resend#1.\nGood Bye!".format(
+            BLOCK_LOG_EXTENSION))
+
+    # the offset index (or the block index of a block log) lets us count and seek without reading the whole file
+    try:
+        log_reader = open_log_reader(filename)
+        lines = log_reader.count()
+        first = log_reader.first_id()
+        last = log_reader.last_id()
+    except ValueError:
+        sys.exit("The entries in this logfile seem to have the wrong format.\n"
+                 "Exiting the program at resend#3.\nGood Bye!")
+    except OSError as e:
+        sys.exit("Failed to read the logfile: {0}\nExiting the program at resend#3.\nGood Bye!".format(e))
 
-    lines = len(open(filename).readlines())
     if lines < 1:
         sys.exit("Logfile contains less than one entry. Nothing to do here.\n"
                  "Exiting the program at resend#2.\nGood Bye!")
 
-    with open(filename) as f:
-        try:
-            first = int(f.readline().split("::", 1)[0])
-            last = int(f.read().splitlines()[-1].split("::", 1)[0])
-        except ValueError:
-            sys.exit("The entries in this logfile seem to have the wrong format.\n"
-                     "Exiting the program at resend#3.\nGood Bye!")
-
     print("Logfile opened successfully. It seems to have {0} entries.\n"
           "First one is #{1}, last one is #{2}.\n".format(lines, first, last))
 
-    bad_inputs = True
+    if start_time is not None or stop_time is not None:
+        time_start, time_stop = log_reader.id_range_of_times(start_time, stop_time)
+        if time_start is None:
+            sys.exit("No logged request was issued in the given time range. Nothing to do here.\n"
+                     "Exiting the program at resend#4.\nGood Bye!")
+        start = time_start if start is None else max(start, time_start)
+        stop = time_stop if stop is None else min(stop, time_stop)
+
+    # ask for the range only in interactive sessions, scripted replays default to the whole log
+    bad_inputs = use_gui and start is None and stop is None
+    start = first if start is None else start
+    stop = last if stop is None else stop
+    if start > stop:
+        sys.exit("The range to resend is empty (#{0} to #{1}).\nExiting the program at resend#5.\nGood Bye!"
+                 .format(start, stop))
 
     while bad_inputs:
         try:
@@ -409,19 +1086,38 @@ def resend_from_logfile(argv):
             print("Please only enter integers.")
 
     client = create_client(client_name, broker_address)
+    publisher = Publisher(client, **parse_publisher_options(opts))
+    publisher.start()
 
     global last_id
-    with open(filename) as f:
-        for i, line in enumerate(f):
-            if i in range(start - 1, stop):
-                line = line.replace('#*?', '\r').replace('#*!', '\n')  # reintroduce line breaks
-                line = line.split('::', 1)[1]  # split number away
-                line = os.linesep.join([s for s in line.splitlines() if s])  # remove empty lines
-                client.publish(topic, line)
-                last_id = i + 1
-                client.loop_start()
-
-                if do_print:
-                    print(line)
-
-                time.sleep(sleep)
+    if speed is None:
+        for request_id, line in log_reader.iter_range(start, stop):
+            line = os.linesep.join([s for s in line.splitlines() if s])  # remove empty lines
+            publisher.publish(topic, line)
+            last_id = request_id
+
+            if do_print:
+                print(line)
+
+            time.sleep(sleep)
+        publisher.stop()
+        return
+
+    # replay following the issuance times of the logged requests
+    print("Replaying with the original timing at speed {0}x (0 = as fast as possible).".format(speed))
+    scheduler = DeadlineScheduler()
+    scheduler.start()
+    count = 0
+    for deadline, request_id, line in issuance_schedule(log_reader.iter_range(start, stop), speed):
+        scheduler.wait_until(deadline)
+        line = os.linesep.join([s for s in line.splitlines() if s])  # remove empty lines
+        publisher.publish(topic, line)
+        last_id = request_id
+        count += 1
+
+        if do_print:
+            print(line)
+
+    print("Replayed {0} requests in {1:.3f} seconds, at most {2:.1f} ms behind schedule.".format(
+        count, scheduler.elapsed(), scheduler.max_lag * 1000))
+    publisher.stop()
@@ -0,0 +1,67 @@
+"""
+Columnar representation of many travel requests created in one shot.
+"""
+import numpy as np
+from datagenerator.requestgenerator.clock import format_departures
+from datagenerator.requestgenerator.travel_request import TravelRequest, Coordinate, COMPACT_JSON_TEMPLATE, \
+    PRETTY_JSON_TEMPLATE, label_of, encode_label
+
+
+class RequestBatch:
+    """A block of travel requests stored as one NumPy array per field instead of one object per request."""
+
+    def __init__(self, device_ids, request_ids, issuance, origin_latitudes, origin_longitudes,
+                 destination_latitudes, destination_longitudes, departures, purposes, purpose_labels,
+                 transportation_types, transportation_type_labels):
+        self.device_ids = np.asarray(device_ids, dtype=np.int64)
+        self.request_ids = np.asarray(request_ids, dtype=np.int64)
+        self.issuance = np.broadcast_to(np.asarray(issuance, dtype=np.int64), self.request_ids.shape)
+        self.origin_latitudes = np.asarray(origin_latitudes, dtype=float)
+        self.origin_longitudes = np.asarray(origin_longitudes, dtype=float)
+        self.destination_latitudes = np.asarray(destination_latitudes, dtype=float)
+        self.destination_longitudes = np.asarray(destination_longitudes, dtype=float)
+        self.departures = np.asarray(departures, dtype=np.int64)  # epoch seconds
+        self.purposes = np.asarray(purposes, dtype=np.intp)  # indices into purpose_labels
+        self.purpose_labels = [label_of(purpose) for purpose in purpose_labels]
+        self.transportation_types = np.asarray(transportation_types, dtype=np.intp)
+        self.transportation_type_labels = [label_of(t) for t in transportation_type_labels]
+
+    def __len__(self):
+        return len(self.request_ids)
+
+    def departure_strings(self):
+        """Format all departures in local time like TimeStamp does ('YYYY-MM-DD HH:MM:SS')."""
+        return format_departures(self.departures)
+
+    def columns(self):
+        """Return all fields as lists of plain Python values, one list per field in the order of the json."""
+        purposes = np.asarray(self.purpose_labels, dtype=object)[self.purposes]
+        types = np.asarray(self.transportation_type_labels, dtype=object)[self.transportation_types]
+        return [self.device_ids.tolist(), self.request_ids.tolist(), self.issuance.tolist(),
+                self.origin_latitudes.tolist(), self.origin_longitudes.tolist(),
+                self.destination_latitudes.tolist(), self.destination_longitudes.tolist(),
+                self.departure_strings(), purposes.tolist(), types.tolist()]
+
+    def to_json_list(self, pretty=False):
+        """Serialize every request of the batch to json without creating TravelRequest objects."""
+        template = PRETTY_JSON_TEMPLATE if pretty else COMPACT_JSON_TEMPLATE
+        purposes = np.asarray([encode_label(label) for label in self.purpose_labels], dtype=object)[self.purposes]
+        types = np.asarray([encode_label(label) for label in self.transportation_type_labels],
+                           dtype=object)[self.transportation_types]
+
+        fields = self.columns()[:8] + [purposes.tolist(), types.tolist()]
+        return [template.format(*row) for row in zip(*fields)]
+
+    def to_numbered_lines(self, payloads=None):
+        """Create the log lines of all requests, reusing already serialized <payloads> if given."""
+        if payloads is None:
+            payloads = self.to_json_list()
+        return [str(request_id) + "::" + payload.replace('\r', '#*?').replace('\n', '#*!')
+                for request_id, payload in zip(self.request_ids.tolist(), payloads)]
+
+    def to_requests(self):
+        """Turn the batch back into a list of TravelRequest objects."""
+        return [TravelRequest(device_id, request_id, issuance, Coordinate(origin_lat, origin_long),
+                              Coordinate(destination_lat, destination_long), departure, purpose, transportation_type)
+                for (device_id, request_id, issuance, origin_lat, origin_long, destination_lat, destination_long,
+                     departure, purpose, transportation_type) in zip(*self.columns())]
@@ -0,0 +1,360 @@
+"""
+Building seed files for new areas from Overpass queries or offline OpenStreetMap extracts.
+
+    python3 -m datagenerator seeds build --area Malmö --output data/bus_stops_malmo.geojson
+    python3 -m datagenerator seeds build --input sweden.osm --bbox 57.6,11.8,57.8,12.1 --output stops.geojson
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+from array import array
+import numpy as np
+from datagenerator.utils import path_utils
+from datagenerator.requestgenerator.geojson_stream import iter_features, geometry_centroid
+from datagenerator.requestgenerator.seed_cache import SeedCache, file_digest
+
+QUERY_FILE = path_utils.get_data_path().joinpath('overpass_query.txt')
+DEFAULT_ENDPOINT = 'https://overpass-api.de/api/interpreter'
+DEFAULT_MAX_AGE = 24.0  # hours an undated query result is reused
+DEFAULT_TIMEOUT = 180  # seconds to wait for the Overpass API
+USER_AGENT = 'dit355-datagenerator'
+
+SELECTOR = re.compile(r'\b(node|way|relation|nwr)((?:\[[^\]]+\])+)')
+TAG_FILTER = re.compile(r'\[\s*"?([^"=!~\]]+?)"?\s*(?:(=|!=|~|!~)\s*"?([^"\]]*)"?)?\s*\]')
+OUT_STATEMENT = re.compile(r'(^|;)(\s*)out\b([^;]*);', re.MULTILINE)
+
+
+def default_cache_dir():
+    return path_utils.get_cache_path().joinpath('overpass')
+
+
+def compile_query(query, area=None, bbox=None, date=None):
+    """Turn an overpass-turbo query into one the Overpass API accepts and which returns the position of everything.
+
+    {{geocodeArea:NAME}} becomes an area search by name (<area> replaces NAME) and {{bbox}} the given <bbox>
+    (south, west, north, east). The output is forced to json, ways and relations get their center, and with a
+    <date> the query runs against the data of that moment, so its result never changes."""
+    lines = query.strip().splitlines()
+    if lines and re.match(r'https?://', lines[0]):
+        lines = lines[1:]  # the overpass-turbo link saved with the query
+    query = re.sub(r'/\*.*?\*/', '', "\n".join(lines), flags=re.DOTALL)
+    query = re.sub(r'(^|\s)//[^\n]*', r'\1', query)
+
+    def geocode_area(match):
+        return 'area["name"="{0}"]["boundary"="administrative"]'.format(area or match.group(1))
+
+    query = re.sub(r'\{\{geocodeArea:([^}]*)\}\}', geocode_area, query)
+    if '{{bbox}}' in query:
+        if bbox is None:
+            raise ValueError("The query uses {{bbox}}, please give a bounding box.")
+        query = query.replace('{{bbox}}', ",".join(str(value) for value in bbox))
+    unknown = re.search(r'\{\{[^}]*\}\}', query)
+    if unknown:
+        raise ValueError("Unsupported overpass-turbo shortcut {0}.".format(unknown.group(0)))
+
+    settings = '[out:json]' + ('[date:"{0}"]'.format(date) if date else '')
+    statement = re.match(r'\s*((?:\[[^\]]*\]\s*)+);', query)
+    if statement:
+        settings += re.sub(r'\[(?:out|date):[^\]]*\]', '', statement.group(1)).strip()
+        query = query[statement.end():]
+
+    # every element brings its own position, the skeleton output of the members isn't needed
+    query = re.sub(r'(^|;)\s*>\s*;', r'\1', query)
+
+    def out_statement(match):
+        prefix, output = match.group(1), match.group(3)
+        if re.search(r'\bskel\b', output):
+            return prefix
+        return '{0}{1}out{2}{3};'.format(prefix, match.group(2), output,
+                                         '' if re.search(r'\b(center|geom|bb)\b', output) else ' center')
+
+    query = OUT_STATEMENT.sub(out_statement, query)
+    query = "\n".join(line for line in query.splitlines() if line.strip())
+    return settings + ';\n' + query.strip() + '\n'
+
+
+def query_tag_filters(query):
+    """Extract the tag filters of the selectors in a query, to apply them to offline data.
+
+    Returns a list of alternatives, each a list of (key, operator, value) that must all match."""
+    alternatives = []
+    for _, filters in SELECTOR.findall(query):
+        conditions = [(key.strip(), operator or None, value) for key, operator, value in TAG_FILTER.findall(filters)]
+        if conditions and conditions not in alternatives:
+            alternatives.append(conditions)
+    return alternatives
+
+
+def tags_match(tags, alternatives):
+    """Check whether <tags> fulfil all conditions of at least one alternative (always true without any)."""
+    if not alternatives:
+        return True
+    for conditions in alternatives:
+        for key, operator, value in conditions:
+            actual = tags.get(key)
+            if operator is None:
+                matched = actual is not None
+            elif operator == '=':
+                matched = actual == value
+            elif operator == '!=':
+                matched = actual != value
+            elif operator == '~':
+                matched = actual is not None and re.search(value, actual) is not None
+            else:
+                matched = actual is None or re.search(value, actual) is None
+            if not matched:
+                break
+        else:
+            return True
+    return False
+
+
+def in_bbox(longitude, latitude, bbox):
+    return bbox is None or (bbox[0] <= latitude <= bbox[2] and bbox[1] <= longitude <= bbox[3])
+
+
+def element_position(element):
+    """(longitude, latitude) of an element of an Overpass json response, None if it has none."""
+    if 'lat' in element and 'lon' in element:
+        return element['lon'], element['lat']
+    if 'center' in element:
+        return element['center']['lon'], element['center']['lat']
+    if 'bounds' in element:
+        bounds = element['bounds']
+        return (bounds['minlon'] + bounds['maxlon']) / 2, (bounds['minlat'] + bounds['maxlat']) / 2
+    if element.get('geometry'):
+        points = [point for point in element['geometry'] if point]
+        return sum(p['lon'] for p in points) / len(points), sum(p['lat'] for p in points) / len(points)
+    return None
+
+
+def stop_feature(osm_id, longitude, latitude, tags):
+    properties = {'@id': osm_id}
+    for key in ('name', 'ref'):
+        if key in tags:
+            properties[key] = tags[key]
+    return {'type': 'Feature', 'properties': properties,
+            'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]}}
+
+
+def features_from_overpass_json(response, alternatives=None, bbox=None):
+    """Yield a point feature for every tagged element of an Overpass json response (a dict)."""
+    for element in response.get('elements', []):
+        tags = element.get('tags')
+        if not tags or not tags_match(tags, alternatives):
+            continue  # untagged elements are only the nodes of ways
+        position = element_position(element)
+        if position is not None and in_bbox(position[0], position[1], bbox):
+            yield stop_feature('{0}/{1}'.format(element['type'], element['id']), position[0], position[1], tags)
+
+
+def features_from_geojson(filename, alternatives=None, bbox=None):
+    """Yield a point feature for every matching feature of a GeoJSON file, streamed."""
+    for feature in iter_features(filename):
+        tags = feature.get('properties') or {}
+        position = geometry_centroid(feature.get('geometry'))
+        if position is not None and tags_match(tags, alternatives) and in_bbox(position[0], position[1], bbox):
+            yield stop_feature(tags.get('@id', feature.get('id')), position[0], position[1], tags)
+
+
+def features_from_osm_xml(filename, alternatives=None, bbox=None):
+    """Yield a point feature for every matching node and way of an OSM XML file (optionally gzipped), streamed.
+
+    Ways are placed at the mean of their nodes. The positions of all nodes are kept in compact arrays for this,
+    relations are skipped."""
+    node_ids, node_positions = array('q'), array('d')
+    sorted_ids = positions = None
+    opener = gzip.open if str(filename).endswith('.gz') else open
+    with opener(filename, 'rb') as f:
+        tags, refs = {}, []
+        for event, element in ElementTree.iterparse(f, events=('end',)):
+            if element.tag == 'tag':
+                tags[element.get('k')] = element.get('v')
+                continue
+            if element.tag == 'nd':
+                refs.append(int(element.get('ref')))
+                continue
+
+            if element.tag == 'node':
+                longitude, latitude = float(element.get('lon')), float(element.get('lat'))
+                node_ids.append(int(element.get('id')))
+                node_positions.extend((longitude, latitude))
+                if tags and tags_match(tags, alternatives) and in_bbox(longitude, latitude, bbox):
+                    yield stop_feature('node/' + element.get('id'), longitude, latitude, tags)
+            elif element.tag == 'way' and tags and tags_match(tags, alternatives) and refs:
+                if sorted_ids is None:  # nodes come first in OSM files
+                    ids = np.frombuffer(node_ids, dtype=np.int64)
+                    order = np.argsort(ids)
+                    sorted_ids = ids[order]
+                    positions = np.frombuffer(node_positions, dtype=float).reshape(-1, 2)[order]
+                refs = np.asarray(refs, dtype=np.int64)
+                indices = np.minimum(np.searchsorted(sorted_ids, refs), len(sorted_ids) - 1)
+                indices = indices[sorted_ids[indices] == refs]  # nodes missing from the extract are left out
+                if len(indices):
+                    longitude, latitude = positions[indices].mean(axis=0).tolist()
+                    if in_bbox(longitude, latitude, bbox):
+                        yield stop_feature('way/' + element.get('id'), longitude, latitude, tags)
+            if element.tag in ('node', 'way', 'relation'):
+                tags, refs = {}, []
+                element.clear()
+
+
+def read_offline_features(filename, alternatives=None, bbox=None):
+    """Pick the reader of an offline file by its content type: Overpass json, GeoJSON or OSM XML."""
+    name = str(filename).lower()
+    if name.endswith('.pbf'):
+        raise ValueError("PBF files can't be read directly, convert them first, "
+                         "e.g. 'osmium cat {0} -o extract.osm'.".format(filename))
+    if name.endswith(('.osm', '.osm.gz', '.xml', '.xml.gz')):
+        return features_from_osm_xml(filename, alternatives, bbox)
+    with open(filename, encoding='utf-8') as f:
+        start = f.read(4096)
+    if '"elements"' in start:
+        with open(filename, encoding='utf-8') as f:
+            return features_from_overpass_json(json.load(f), alternatives, bbox)
+    return features_from_geojson(filename, alternatives, bbox)
+
+
+def fetch_overpass(query, endpoint=DEFAULT_ENDPOINT, timeout=DEFAULT_TIMEOUT):
+    """Run a compiled query against the Overpass API and return the decoded json response."""
+    request = urllib.request.Request(endpoint, data=urllib.parse.urlencode({'data': query}).encode('utf-8'),
+                                     headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+class QueryCache:
+    """Stop features built before, stored as GeoJSON and keyed on the query and the version of the data.
+
+    The version is the date of a dated query, the hash of an offline file, or 'latest' for the current data
+    of the API, which is only reused for <max_age> hours."""
+
+    def __init__(self, directory=None, max_age=DEFAULT_MAX_AGE):
+        self.directory = str(default_cache_dir() if directory is None else directory)
+        self.max_age = max_age
+
+    def filename(self, query, version):
+        key = hashlib.sha256("{0}\n{1}".format(version, query).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'stops-{0}.geojson'.format(key[:32]))
+
+    def get(self, query, version):
+        filename = self.filename(query, version)
+        if not os.path.exists(filename):
+            return None
+        if version == 'latest' and time.time() - os.path.getmtime(filename) > self.max_age * 3600:
+            return None
+        return filename
+
+    def put(self, query, version, collection):
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self.filename(query, version)
+        write_collection(filename + '.tmp', collection)
+        os.replace(filename + '.tmp', filename)
+        return filename
+
+
+def feature_collection(features, timestamp=None, query=None):
+    collection = {'type': 'FeatureCollection', 'generator': USER_AGENT}
+    if timestamp is not None:
+        collection['timestamp'] = timestamp
+    if query is not None:
+        collection['query'] = query
+    collection['features'] = features
+    return collection
+
+
+def write_collection(filename, collection):
+    """Write a FeatureCollection with one compact feature per line.
+
+    The features may be an iterator, they are written one by one as they come."""
+    with open(filename, 'w', encoding='utf-8') as f:
+        header = {key: value for key, value in collection.items() if key != 'features'}
+        f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "features": [\n')
+        separator = ''
+        for feature in collection['features']:
+            f.write(separator + json.dumps(feature, ensure_ascii=False, separators=(',', ':')))
+            separator = ',\n'
+        f.write('\n]}\n')
+
+
+def build_seeds(output, query=None, input_file=None, area=None, bbox=None, date=None, endpoint=DEFAULT_ENDPOINT,
+                cache=None, refresh=False, seed_cache=None):
+    """Build a seed file at <output> from the Overpass API or an offline <input_file> and compile its seed cache.
+
+    Returns the number of seeds."""
+    cache = QueryCache() if cache is None else cache
+    seed_cache = SeedCache() if seed_cache is None else seed_cache
+    query = compile_query(QUERY_FILE.read_text(encoding='utf-8') if query is None else query, area, bbox, date)
+
+    if input_file is not None:
+        version = 'file:' + file_digest(input_file)
+    else:
+        version = 'date:' + date if date else 'latest'
+    if bbox is not None:
+        version += ':bbox:' + ",".join(str(value) for value in bbox)
+
+    cached = None if refresh else cache.get(query, version)
+    if cached is None:
+        if input_file is not None:
+            features = read_offline_features(input_file, query_tag_filters(query), bbox)
+            collection = feature_collection(features, query=query)
+        else:
+            response = fetch_overpass(query, endpoint)
+            timestamp = response.get('osm3s', {}).get('timestamp_osm_base')
+            collection = feature_collection(features_from_overpass_json(response, bbox=bbox), timestamp, query)
+        cached = cache.put(query, version, collection)
+
+    with open(cached, encoding='utf-8') as source, open(output, 'w', encoding='utf-8') as target:
+        target.write(source.read())
+    return len(seed_cache.load(output))
+
+
+def parse_bbox(text):
+    values = tuple(float(value) for value in text.split(','))
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise argparse.ArgumentTypeError("A bounding box is south,west,north,east.")
+    return values
+
+
+def main(argv):
+    """Entry point of 'python3 -m datagenerator seeds ...'."""
+    parser = argparse.ArgumentParser(prog='datagenerator seeds', description='Build seed files for new areas.')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='extract stops from Overpass or an offline OpenStreetMap file')
+    build.add_argument('-o', '--output', required=True, help='GeoJSON file to write the seeds to')
+    build.add_argument('-q', '--query', help='overpass-turbo query file. Default=data/overpass_query.txt')
+    build.add_argument('--area', help='name of the area to search in, replacing the one of the query')
+    build.add_argument('--bbox', type=parse_bbox, metavar='S,W,N,E',
+                       help='only keep stops within this bounding box, also used for {{bbox}} in the query')
+    build.add_argument('--date', help='query the data of this moment (e.g. 2019-11-10T23:11:02Z) for '
+                                      'reproducible results')
+    build.add_argument('-i', '--input', help='read an offline .osm(.gz), Overpass json or GeoJSON file instead '
+                                             'of querying the Overpass API')
+    build.add_argument('--endpoint', default=DEFAULT_ENDPOINT, help='Overpass API interpreter URL')
+    build.add_argument('--max_age', type=float, default=DEFAULT_MAX_AGE,
+                       help='hours an undated result of the Overpass API is reused. Default=24')
+    build.add_argument('--refresh', action='store_true', help='ignore cached results')
+    arguments = parser.parse_args(argv)
+    if arguments.command != 'build':
+        parser.print_help()
+        sys.exit(2)
+
+    query = None
+    if arguments.query is not None:
+        with open(arguments.query, encoding='utf-8') as f:
+            query = f.read()
+    try:
+        count = build_seeds(arguments.output, query, arguments.input, arguments.area, arguments.bbox,
+                            arguments.date, arguments.endpoint, QueryCache(max_age=arguments.max_age),
+                            arguments.refresh)
+    except (ValueError, OSError) as e:
+        sys.exit("Building the seeds failed: {0}".format(e))
+    print("Wrote {0} seeds to {1}.".format(count, arguments.output))
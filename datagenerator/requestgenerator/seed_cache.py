@@ -0,0 +1,281 @@
+"""
+Compiled binary cache of seed coordinates, so they aren't parsed from GeoJSON at every start.
+"""
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import warnings
+from array import array
+import numpy as np
+from datagenerator.utils import path_utils
+from datagenerator.requestgenerator.geojson_stream import iter_features, geometry_centroid, DEFAULT_CHUNK_SIZE
+
+CACHE_VERSION = 3  # increase when the layout or the parsing of the cache changes
+HASH_CHUNK_SIZE = 1 << 20  # bytes
+SPOOL_SIZE = 1 << 16  # values of a column held in memory while a cache is compiled
+LABEL_COLUMNS = ('names', 'refs')
+
+
+def file_digest(filename):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_cache_dir():
+    return path_utils.get_cache_path().joinpath('seeds')
+
+
+class Seeds:
+    """Seed coordinates as an (n, 2) float64 array of longitude and latitude, with optional names, refs and weights.
+
+    Loaded from the cache the arrays are memory-mapped read-only, so all processes share the same pages."""
+
+    def __init__(self, coordinates, names=None, refs=None, weights=None):
+        self.coordinates = coordinates
+        self.names = names
+        self.refs = refs
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def subset(self, indices):
+        """Copy of the seeds at <indices>."""
+        return Seeds(self.coordinates[indices],
+                     None if self.names is None else self.names[indices],
+                     None if self.refs is None else self.refs[indices],
+                     None if self.weights is None else self.weights[indices])
+
+    def sample(self, limit=None):
+        """Keep <limit> randomly chosen seeds in their original order, or all of them without a limit."""
+        if limit is None or limit >= len(self):
+            return self
+        return self.subset(np.sort(np.random.choice(len(self), limit, replace=False)))
+
+
+def label_array(labels):
+    """Labels as an object array, each keeps its own length instead of being padded to the longest one."""
+    return np.array(labels, dtype=object)
+
+
+def decode_labels(data, offsets):
+    """Inverse of the cached label columns: label i is the utf-8 text data[offsets[i]:offsets[i + 1]]."""
+    text = data.tobytes()
+    bounds = offsets.tolist()
+    return label_array([text[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])])
+
+
+def iter_geojson_seeds(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream (centroid, name, ref) of the features of a GeoJSON file, skipping features without a geometry."""
+    for feature in iter_features(filename, chunk_size):
+        centroid = geometry_centroid(feature.get('geometry'))
+        if centroid is None:
+            continue
+        properties = feature.get('properties') or {}
+        yield centroid, str(properties.get('name', '')), str(properties.get('ref', ''))
+
+
+def read_geojson_seeds(filename, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream the features of a GeoJSON file into Seeds with a name and a ref from their properties.
+
+    Features without a geometry are skipped. With a <limit> a uniform random sample of that many features is kept
+    by reservoir sampling, so memory stays proportional to the result instead of the file."""
+    coordinates = array('d')
+    names = []
+    refs = []
+    seen = 0
+    for entry in iter_geojson_seeds(filename, chunk_size):
+        seen += 1
+
+        if limit is None or len(names) < limit:
+            coordinates.extend(entry[0])
+            names.append(entry[1])
+            refs.append(entry[2])
+        else:
+            # replace a kept feature with probability limit / seen
+            position = random.randrange(seen)
+            if position < limit:
+                coordinates[2 * position:2 * position + 2] = array('d', entry[0])
+                names[position] = entry[1]
+                refs[position] = entry[2]
+
+    return Seeds(np.frombuffer(coordinates, dtype=float).reshape(-1, 2), label_array(names), label_array(refs))
+
+
+class ColumnSpool:
+    """Collects the values of one cached array in a temporary file, keeping at most SPOOL_SIZE of them in memory.
+
+    <typecode> is that of an array.array, numpy reads it as the same type."""
+
+    def __init__(self, directory, typecode):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.buffer = array(typecode)
+
+    def extend(self, values):
+        if isinstance(values, bytes):
+            self.buffer.frombytes(values)
+        else:
+            self.buffer.extend(values)
+        if len(self.buffer) >= SPOOL_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.buffer.tofile(self.file)
+        del self.buffer[:]
+
+    def save(self, f, shape):
+        """Write all values to the open file <f> as an .npy array of <shape>."""
+        self.flush()
+        np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(self.buffer.typecode).str, 'fortran_order': False,
+                                                 'shape': shape})
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, f)
+
+    def close(self):
+        self.file.close()
+
+
+class SeedCache:
+    """Directory of compiled seed files, keyed on the SHA-256 of their source file.
+
+    For every source a small json entry remembers its size, modification time and hash, so the source is only
+    hashed again after it changed. The arrays themselves are stored as .npy files named after the hash, names and
+    refs as their utf-8 bytes and the offsets where every label starts."""
+
+    def __init__(self, directory=None):
+        self.directory = str(default_cache_dir() if directory is None else directory)
+
+    def _entry_filename(self, source):
+        key = hashlib.sha256(os.path.abspath(str(source)).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, 'source-{0}.json'.format(key))
+
+    def _array_filename(self, digest, column):
+        return os.path.join(self.directory, 'seeds-{0}-v{1}.{2}.npy'.format(digest, CACHE_VERSION, column))
+
+    def digest_of(self, source):
+        """Hash of <source>, taken from its cache entry if the file is unchanged since it was hashed."""
+        status = os.stat(source)
+        try:
+            with open(self._entry_filename(source), encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry['size'] == status.st_size and entry['mtime_ns'] == status.st_mtime_ns:
+                return entry['sha256']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = file_digest(source)
+        self._write_atomically(self._entry_filename(source), lambda f: f.write(json.dumps({
+            'source': os.path.abspath(str(source)), 'size': status.st_size, 'mtime_ns': status.st_mtime_ns,
+            'sha256': digest}).encode('utf-8')))
+        return digest
+
+    def _write_atomically(self, filename, write):
+        # several workers may compile at the same time, each of them replaces the file with a complete one
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                write(f)
+            os.chmod(temporary, 0o644)  # mkstemp creates private files, other users may share the cache
+            os.replace(temporary, filename)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def store_column(self, digest, column, values):
+        self._write_atomically(self._array_filename(digest, column),
+                               lambda f: np.save(f, np.ascontiguousarray(values)))
+
+    def fetch_column(self, digest, column):
+        """Memory-map one array of the seeds compiled from a source with <digest>, None if it isn't cached."""
+        try:
+            return np.load(self._array_filename(digest, column), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def store_spool(self, digest, column, spool, shape):
+        self._write_atomically(self._array_filename(digest, column), lambda f: spool.save(f, shape))
+
+    def compile(self, digest, source):
+        """Parse the seeds of <source> into the cache with <digest>.
+
+        The seeds are streamed through temporary files, so memory doesn't grow with the size of the source."""
+        os.makedirs(self.directory, exist_ok=True)
+        spools = {'coordinates': ColumnSpool(self.directory, 'd')}
+        for column in LABEL_COLUMNS:
+            spools[column + '.data'] = ColumnSpool(self.directory, 'B')
+            spools[column + '.offsets'] = ColumnSpool(self.directory, 'q')
+            spools[column + '.offsets'].extend((0,))
+        try:
+            count = 0
+            sizes = dict.fromkeys(LABEL_COLUMNS, 0)
+            for centroid, *labels in iter_geojson_seeds(source):
+                spools['coordinates'].extend(centroid)
+                for column, label in zip(LABEL_COLUMNS, labels):
+                    encoded = label.encode('utf-8')
+                    sizes[column] += len(encoded)
+                    spools[column + '.data'].extend(encoded)
+                    spools[column + '.offsets'].extend((sizes[column],))
+                count += 1
+
+            # the coordinates last, a cache without them is compiled again
+            for column in LABEL_COLUMNS:
+                self.store_spool(digest, column + '.data', spools[column + '.data'], (sizes[column],))
+                self.store_spool(digest, column + '.offsets', spools[column + '.offsets'], (count + 1,))
+            self.store_spool(digest, 'coordinates', spools['coordinates'], (count, 2))
+        finally:
+            for spool in spools.values():
+                spool.close()
+
+    def fetch_labels(self, digest, column):
+        """The names or refs of the seeds compiled from a source with <digest>, None if they aren't cached."""
+        data = self.fetch_column(digest, column + '.data')
+        offsets = self.fetch_column(digest, column + '.offsets')
+        if data is None or offsets is None:
+            return None
+        return decode_labels(data, offsets)
+
+    def fetch(self, digest, labels=False):
+        """Memory-map the seeds compiled from a source with <digest>, None if they aren't cached."""
+        coordinates = self.fetch_column(digest, 'coordinates')
+        if coordinates is None or not labels:
+            return None if coordinates is None else Seeds(coordinates)
+        columns = [self.fetch_labels(digest, column) for column in LABEL_COLUMNS]
+        if any(values is None for values in columns):
+            return None
+        return Seeds(coordinates, *columns)
+
+    def load(self, source, labels=False, limit=None):
+        """Return the Seeds of <source>, compiling and caching them on the first call.
+
+        With a <limit> only that many randomly chosen seeds are copied out of the memory-mapped cache. If the cache
+        directory isn't writable the seeds are parsed without being cached, sampling the <limit> while reading."""
+        try:
+            digest = self.digest_of(source)
+        except OSError as e:
+            if not os.path.exists(source):
+                raise
+            warnings.warn("Seed cache {0} is not usable ({1}), parsing {2}.".format(self.directory, e, source))
+            return read_geojson_seeds(source, limit)
+
+        seeds = self.fetch(digest, labels)
+        if seeds is None:
+            try:
+                self.compile(digest, source)
+            except OSError as e:
+                warnings.warn("Can't write the seed cache to {0}: {1}".format(self.directory, e))
+                return read_geojson_seeds(source, limit)
+            seeds = self.fetch(digest, labels)
+        return seeds.sample(limit)
+
+
+def load_seeds(source, cache_dir=None, labels=False, limit=None):
+    """Load the seeds of a GeoJSON file through the default (or the given) cache."""
+    return SeedCache(cache_dir).load(source, labels, limit)
@@ -0,0 +1,172 @@
+"""
+Per-seed weights from the stop metadata, so the generated load concentrates on busy stops like production load does.
+"""
+import csv
+import hashlib
+import warnings
+import numpy as np
+from datagenerator.requestgenerator.geojson_stream import iter_features, geometry_centroid
+from datagenerator.requestgenerator.seed_cache import SeedCache, file_digest
+from datagenerator.requestgenerator.spatial_index import SeedGrid
+
+DEFAULT_WEIGHT = 1.0  # weight of seeds a rule doesn't say anything about
+
+
+def read_property(filename, key):
+    """Stream the value of property <key> of every feature of a GeoJSON file, None where it is missing.
+
+    Features without a geometry are skipped, just like when the seeds are read, so the values line up with them."""
+    return [(feature.get('properties') or {}).get(key) for feature in iter_features(filename)
+            if geometry_centroid(feature.get('geometry')) is not None]
+
+
+class DensityWeights:
+    """Weights seeds by the number of seeds within <radius> meters (themselves included).
+
+    Stop positions cluster at hubs like Centralstationen, so this favours them without any extra data."""
+
+    def __init__(self, radius):
+        if radius <= 0:
+            raise ValueError("The density radius must be positive.")
+        self.radius = radius
+
+    def __str__(self):
+        return 'density:{0:g}'.format(self.radius)
+
+    def cache_key(self):
+        return str(self)
+
+    def compute(self, source, seeds):
+        latitudes, longitudes = seeds.coordinates[:, 1], seeds.coordinates[:, 0]
+        grid = SeedGrid(latitudes, longitudes, cell_size=self.radius)
+        return grid.count_within_many(latitudes, longitudes, self.radius).astype(float)
+
+
+class PropertyWeights:
+    """Weights seeds by a property of their GeoJSON feature.
+
+    Without <values> the property is taken as a number (e.g. boardings per day), with 'count' the number of
+    ';'-separated entries (e.g. the lines in route_ref), and otherwise <values> maps each value to a weight,
+    e.g. {'yes': 3.0} for the tram property. '*' in <values> sets the weight of all other values."""
+
+    def __init__(self, key, values=None):
+        self.key = key
+        self.values = values
+
+    def __str__(self):
+        if self.values is None or self.values == 'count':
+            return 'property:' + self.key + ('' if self.values is None else ':count')
+        return 'property:{0}:{1}'.format(self.key, ",".join('{0}={1:g}'.format(value, weight)
+                                                            for value, weight in self.values.items()))
+
+    def cache_key(self):
+        return str(self)
+
+    def weight_of(self, value):
+        if self.values is None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return DEFAULT_WEIGHT
+        if self.values == 'count':
+            return float(len([entry for entry in str(value).split(';') if entry.strip()])) if value else 0.0
+        return self.values.get(str(value) if value is not None else None, self.values.get('*', DEFAULT_WEIGHT))
+
+    def compute(self, source, seeds):
+        values = read_property(source, self.key)
+        if len(values) != len(seeds):
+            raise ValueError("The seeds don't match the features of {0}.".format(source))
+        return np.array([self.weight_of(value) for value in values], dtype=float)
+
+
+class CsvWeights:
+    """Weights seeds with a CSV file of name or ref and weight per row, e.g. boardings exported from production.
+
+    A header row is skipped. Seeds whose name and ref are both missing from the file get <default>."""
+
+    def __init__(self, filename, default=DEFAULT_WEIGHT):
+        self.filename = filename
+        self.default = default
+
+    def __str__(self):
+        return 'csv:{0}'.format(self.filename)
+
+    def cache_key(self):
+        return 'csv:{0}:{1:g}'.format(file_digest(self.filename), self.default)
+
+    def read(self):
+        table = {}
+        with open(self.filename, newline='', encoding='utf-8') as f:
+            for number, row in enumerate(csv.reader(f)):
+                if len(row) < 2 or row[0].startswith('#'):
+                    continue
+                try:
+                    table[row[0].strip()] = float(row[1])
+                except ValueError:
+                    if number > 0:
+                        raise ValueError("Row {0} of {1} has no valid weight.".format(number + 1, self.filename))
+        return table
+
+    def compute(self, source, seeds):
+        table = self.read()
+        names = seeds.names.tolist()
+        refs = seeds.refs.tolist()
+        weights = np.array([table.get(name, table.get(ref, self.default)) for name, ref in zip(names, refs)],
+                           dtype=float)
+        matched = sum(1 for name, ref in zip(names, refs) if name in table or ref in table)
+        if matched == 0:
+            warnings.warn("None of the seeds is listed in {0}.".format(self.filename))
+        return weights
+
+
+def parse_weights(text):
+    """Parse a weighting rule: 'density:RADIUS', 'property:KEY[:count|:VALUE=WEIGHT,...]' or 'csv:FILE[:DEFAULT]'."""
+    kind, _, rest = text.partition(':')
+    try:
+        if kind == 'density':
+            return DensityWeights(float(rest))
+        if kind == 'property' and rest:
+            key, _, values = rest.partition(':')
+            if not values:
+                return PropertyWeights(key)
+            if values == 'count':
+                return PropertyWeights(key, 'count')
+            return PropertyWeights(key, {value: float(weight) for value, weight in
+                                         (entry.rsplit('=', 1) for entry in values.split(','))})
+        if kind == 'csv' and rest:
+            filename, _, default = rest.rpartition(':')
+            try:
+                return CsvWeights(filename, float(default)) if filename else CsvWeights(rest)
+            except ValueError:
+                return CsvWeights(rest)  # a colon in the filename, e.g. C:\weights.csv
+    except ValueError:
+        pass
+    raise ValueError("Unknown seed weights '{0}', use density:RADIUS, property:KEY[:count|:VALUE=WEIGHT,...] "
+                     "or csv:FILE[:DEFAULT].".format(text))
+
+
+def compute_weights(source, seeds, rules, cache=None):
+    """Multiply the weights of all <rules> for the <seeds> of <source>.
+
+    The result is stored in the seed cache next to the coordinates and memory-mapped on the next load, so the
+    sampling table is only built from the properties once."""
+    cache = SeedCache() if cache is None else cache
+    key = hashlib.sha256("\n".join(rule.cache_key() for rule in rules).encode('utf-8')).hexdigest()[:16]
+    column = 'weights-' + key
+    try:
+        digest = cache.digest_of(source)
+    except OSError:
+        digest = None
+    weights = None if digest is None else cache.fetch_column(digest, column)
+    if weights is not None and len(weights) == len(seeds):
+        return weights
+
+    weights = np.ones(len(seeds))
+    for rule in rules:
+        weights *= rule.compute(source, seeds)
+    if digest is not None:
+        try:
+            cache.store_column(digest, column, weights)
+        except OSError as e:
+            warnings.warn("Can't write the seed weights to {0}: {1}".format(cache.directory, e))
+    return weights
@@ -0,0 +1,226 @@
+"""
+Spatial index over the seed coordinates and trip-length distributions for locality-aware destinations.
+"""
+import math
+import numpy as np
+from datagenerator.requestgenerator.geometric_operations import radii_of_curvature
+
+SEEDS_PER_CELL = 4  # average number of seeds in an occupied cell if no cell size is given
+MIN_CELL_SIZE = 50.0  # meters
+BRUTE_FORCE_CHUNK = 256  # queries compared with all seeds at once
+
+
+class SeedGrid:
+    """Uniform grid over seed coordinates answering nearest-seed queries for whole arrays at once.
+
+    The seeds are projected onto a plane tangent at their mean latitude (precise enough within a city) and sorted
+    by grid cell, so finding the seeds of a cell is a binary search over the occupied cells, O(log n).
+    Queries search a square of cells around their position that grows until the nearest seed is certain."""
+
+    def __init__(self, latitudes, longitudes, cell_size=None):
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if latitudes.size == 0:
+            raise ValueError("A grid needs at least one seed.")
+
+        self.reference_latitude = float(np.mean(latitudes))
+        self.reference_longitude = float(np.mean(longitudes))
+        meridional, prime_vertical = radii_of_curvature(math.radians(self.reference_latitude))
+        # meters per degree of longitude and latitude around the reference
+        self.scale = np.array([math.radians(prime_vertical * math.cos(math.radians(self.reference_latitude))),
+                               math.radians(meridional)])
+
+        points = self.project(latitudes, longitudes)
+        self.corner = points.min(axis=0)
+        extent = points.max(axis=0) - self.corner
+        if cell_size is None:
+            cell_size = max(MIN_CELL_SIZE, math.sqrt(max(extent[0] * extent[1], 1.0) * SEEDS_PER_CELL / len(points)))
+        if cell_size <= 0:
+            raise ValueError("The cell size must be positive.")
+        self.cell_size = float(cell_size)
+        self.columns, self.rows = (extent // self.cell_size).astype(np.int64) + 1
+
+        keys = self._keys(self._cells(points))
+        self.order = np.argsort(keys, kind='stable')  # seed indices sorted by cell
+        self.points = points[self.order]
+        self.cell_keys, self.cell_starts, counts = np.unique(keys[self.order], return_index=True,
+                                                             return_counts=True)
+        self.cell_ends = self.cell_starts + counts
+
+    def __len__(self):
+        return len(self.order)
+
+    def project(self, latitudes, longitudes):
+        """Project coordinates in degrees to meters east and north of the reference, as an (n, 2) array."""
+        return np.column_stack(((np.asarray(longitudes, dtype=float) - self.reference_longitude) * self.scale[0],
+                                (np.asarray(latitudes, dtype=float) - self.reference_latitude) * self.scale[1]))
+
+    def _cells(self, points):
+        return np.floor((points - self.corner) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        return cells[..., 1] * self.columns + cells[..., 0]
+
+    def _candidates(self, points, cells, ring):
+        """Gather the seeds within <ring> cells around every query into one flat array, grouped by query.
+
+        Returns the sorted positions of the candidates, their squared distances and the group size per query."""
+        column_offsets, row_offsets = np.meshgrid(np.arange(-ring, ring + 1), np.arange(-ring, ring + 1))
+        columns = cells[:, 0, None] + column_offsets.ravel()
+        rows = cells[:, 1, None] + row_offsets.ravel()
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+
+        keys = rows * self.columns + columns
+        positions = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        occupied = inside & (self.cell_keys[positions] == keys)
+        starts = np.where(occupied, self.cell_starts[positions], 0).ravel()
+        counts = np.where(occupied, self.cell_ends[positions] - self.cell_starts[positions], 0).ravel()
+
+        total = int(counts.sum())
+        per_query = counts.reshape(len(points), -1).sum(axis=1)
+        candidates = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        differences = self.points[candidates] - np.repeat(points, per_query, axis=0)
+        return candidates, differences[:, 0] ** 2 + differences[:, 1] ** 2, per_query
+
+    def _search(self, points, cells, ring):
+        """Find the nearest seed within <ring> cells around every query.
+
+        Returns (indices, distances) with -1 and inf for queries without any seed in these cells."""
+        indices = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.inf)
+        candidates, squared, per_query = self._candidates(points, cells, ring)
+        if len(candidates) == 0:
+            return indices, distances
+
+        # the nearest seed of a query is the first candidate of its group with the smallest distance
+        found = np.flatnonzero(per_query)
+        group_starts = (np.cumsum(per_query) - per_query)[found]
+        minima = np.minimum.reduceat(squared, group_starts)
+        closest = np.flatnonzero(squared == np.repeat(minima, per_query[found]))
+        first = closest[np.searchsorted(closest, group_starts)]
+        indices[found] = self.order[candidates[first]]
+        distances[found] = np.sqrt(minima)
+        return indices, distances
+
+    def count_within_many(self, latitudes, longitudes, radius):
+        """Count the seeds within <radius> meters of every given coordinate."""
+        points = self.project(latitudes, longitudes)
+        cells = self._cells(points)
+        ring = max(1, math.ceil(radius / self.cell_size))
+        if len(points) == 0:
+            return np.zeros(0, dtype=np.int64)
+        counts = np.zeros(len(points), dtype=np.int64)
+        for chunk in np.array_split(np.arange(len(points)), math.ceil(len(points) / BRUTE_FORCE_CHUNK)):
+            _, squared, per_query = self._candidates(points[chunk], cells[chunk], ring)
+            owners = np.repeat(np.arange(len(chunk)), per_query)
+            counts[chunk] = np.bincount(owners[squared <= radius ** 2], minlength=len(chunk))
+        return counts
+
+    def nearest_many(self, latitudes, longitudes):
+        """Return the indices of the seeds nearest to every given coordinate and their distances in meters."""
+        points = self.project(latitudes, longitudes)
+        cells = self._cells(points)
+        indices = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.inf)
+
+        pending = np.arange(len(points))
+        ring = 1
+        while pending.size:
+            if (2 * ring + 1) ** 2 > len(self.cell_keys):
+                # far from most seeds, comparing with all of them is cheaper than searching even more cells
+                for chunk in np.array_split(pending, math.ceil(len(pending) / BRUTE_FORCE_CHUNK)):
+                    differences = points[chunk, None, :] - self.points[None, :, :]
+                    squared = differences[..., 0] ** 2 + differences[..., 1] ** 2
+                    best = np.argmin(squared, axis=1)
+                    indices[chunk] = self.order[best]
+                    distances[chunk] = np.sqrt(squared[np.arange(len(chunk)), best])
+                break
+
+            found, found_distances = self._search(points[pending], cells[pending], ring)
+            # seeds outside the searched square are at least <ring> cells away from a query
+            certain = found_distances <= ring * self.cell_size
+            indices[pending[certain]] = found[certain]
+            distances[pending[certain]] = found_distances[certain]
+            pending = pending[~certain]
+            ring *= 2
+        return indices, distances
+
+    def nearest(self, latitude, longitude):
+        """Return the index of the seed nearest to one coordinate and its distance in meters."""
+        indices, distances = self.nearest_many([latitude], [longitude])
+        return int(indices[0]), float(distances[0])
+
+
+class UniformTripLength:
+    """Trip lengths evenly distributed between <minimum> and <maximum> meters."""
+
+    def __init__(self, minimum, maximum):
+        if not 0 <= minimum <= maximum:
+            raise ValueError("Trip lengths need 0 <= minimum <= maximum.")
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def sample(self, count):
+        return np.random.uniform(self.minimum, self.maximum, count)
+
+    def from_uniforms(self, uniforms):
+        return self.minimum + uniforms[:, 0] * (self.maximum - self.minimum)
+
+    def __str__(self):
+        return "uniform trip lengths from {0} to {1} m".format(self.minimum, self.maximum)
+
+
+class ExponentialTripLength:
+    """Trip lengths with an exponential distribution around a <mean> in meters, many short and few long trips."""
+
+    def __init__(self, mean):
+        if mean <= 0:
+            raise ValueError("The mean trip length must be positive.")
+        self.mean = mean
+
+    def sample(self, count):
+        return np.random.exponential(self.mean, count)
+
+    def from_uniforms(self, uniforms):
+        return -self.mean * np.log1p(-uniforms[:, 0])
+
+    def __str__(self):
+        return "exponential trip lengths with a mean of {0} m".format(self.mean)
+
+
+class LogNormalTripLength:
+    """Trip lengths with a log-normal distribution, a common model of urban trips, given its <median> in meters."""
+
+    def __init__(self, median, sigma=0.8):
+        if median <= 0 or sigma < 0:
+            raise ValueError("The median trip length must be positive and sigma non-negative.")
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, count):
+        return np.random.lognormal(math.log(self.median), self.sigma, count)
+
+    def from_uniforms(self, uniforms):
+        """Transform two columns of uniform numbers into trip lengths with Box-Muller."""
+        normal = np.sqrt(-2.0 * np.log1p(-uniforms[:, 0])) * np.cos(2 * math.pi * uniforms[:, 1])
+        return self.median * np.exp(self.sigma * normal)
+
+    def __str__(self):
+        return "log-normal trip lengths with a median of {0} m (sigma {1})".format(self.median, self.sigma)
+
+
+def parse_trip_length(spec):
+    """Create a trip-length distribution from a command line specification. Raises ValueError for invalid ones.
+
+    'uniform:500:3000'     between 500 and 3000 m
+    'exp:1500'             exponential with a mean of 1500 m
+    'lognormal:2000[:0.8]' log-normal with a median of 2000 m and sigma 0.8"""
+    kind, _, arguments = spec.partition(':')
+    values = [float(value) for value in arguments.split(':')] if arguments else []
+    if kind == 'uniform' and len(values) == 2:
+        return UniformTripLength(*values)
+    if kind == 'exp' and len(values) == 1:
+        return ExponentialTripLength(*values)
+    if kind == 'lognormal' and len(values) in (1, 2):
+        return LogNormalTripLength(*values)
+    raise ValueError("Unknown trip length distribution '{0}'.".format(spec))
@@ -1,5 +1,43 @@
 import json
 from datetime import datetime
+from functools import lru_cache
+
+# compact json of a travel request, filled by TravelRequest.json_fields() or RequestBatch
+COMPACT_JSON_TEMPLATE = ('{{"deviceId":{0},"requestId":{1},"issuance":{2},'
+                         '"origin":{{"latitude":{3!r},"longitude":{4!r}}},'
+                         '"destination":{{"latitude":{5!r},"longitude":{6!r}}},'
+                         '"timeOfDeparture":"{7}","purpose":{8},"transportationType":{9}}}')
+
+# human readable json of a travel request, identical to json.dumps(..., cls=ComplexEncoder, indent=4)
+PRETTY_JSON_TEMPLATE = ('{{\n'
+                        '    "deviceId": {0},\n'
+                        '    "requestId": {1},\n'
+                        '    "issuance": {2},\n'
+                        '    "origin": {{\n'
+                        '        "latitude": {3!r},\n'
+                        '        "longitude": {4!r}\n'
+                        '    }},\n'
+                        '    "destination": {{\n'
+                        '        "latitude": {5!r},\n'
+                        '        "longitude": {6!r}\n'
+                        '    }},\n'
+                        '    "timeOfDeparture": "{7}",\n'
+                        '    "purpose": {8},\n'
+                        '    "transportationType": {9}\n'
+                        '}}')
+
+
+def label_of(category):
+    """Return the plain value of a category, unwrapping objects like Purpose which define repr_json."""
+    if hasattr(category, 'repr_json'):
+        return category.repr_json()
+    return category
+
+
+@lru_cache(maxsize=256)
+def encode_label(label):
+    """Json-encode a (repeating) category label like a purpose once and reuse the result."""
+    return json.dumps(label)
 
 
 class ComplexEncoder(json.JSONEncoder):
@@ -12,36 +50,46 @@ class ComplexEncoder(json.JSONEncoder):
             return json.JSONEncoder.default(self, obj)
 
 
+def format_departure(departure):
+    """Format a datetime like '2020-01-02 03:04:05', the way departures appear in the json."""
+    return str(departure.replace(microsecond=0))
+
+
 class Coordinate:
     """Defines the format for coordinates."""
+    __slots__ = ('latitude', 'longitude')
 
     def __init__(self, latitude, longitude):
-        self.coordinate = {
-            'latitude': latitude,
-            'longitude': longitude
-        }
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def coordinate(self):
+        """The coordinate as a dict of latitude and longitude, built on demand."""
+        return {'latitude': self.latitude, 'longitude': self.longitude}
 
     def offset(self, d_latitude, d_longitude):
-        self.coordinate['latitude'] += d_latitude
-        self.coordinate['longitude'] += d_longitude
+        self.latitude += d_latitude
+        self.longitude += d_longitude
 
     def clone(self, offset_long=0, offset_lat=0):
-        return Coordinate(self.coordinate['latitude'] + offset_long, self.coordinate['longitude'] + offset_lat)
+        return Coordinate(self.latitude + offset_lat, self.longitude + offset_long)
 
     def to_tuple(self):
         """Turns Coordinates into tuples (latitude, longitutde) """
-        return [self.coordinate['latitude'], self.coordinate['longitude']]
+        return [self.latitude, self.longitude]
 
     def repr_json(self):
         """Creates a json representation of a Coordinate. Can be used recursively by """
-        return dict(latitude=self.coordinate['latitude'], longitude=self.coordinate['longitude'])
+        return dict(latitude=self.latitude, longitude=self.longitude)
 
     def to_json(self):
         """"""
-        return json.dumps(self.coordinate)
+        return json.dumps(self.repr_json())
 
 
 class Device:
+    __slots__ = ('deviceId',)
 
     def __init__(self, device_id):
         self.deviceId = int(device_id)
@@ -51,9 +99,10 @@ class Device:
 
 
 class TimeStamp:
+    __slots__ = ('departure', 'has_departure')
 
     def __init__(self, departure=datetime.now(), has_departure=True):
-        self.departure = str(departure.replace(microsecond=0))
+        self.departure = format_departure(departure)
         self.has_departure = has_departure
 
     def repr_json(self):
@@ -61,6 +110,7 @@ class TimeStamp:
 
 
 class Issuance:
+    __slots__ = ('departure',)
 
     def __init__(self, departure=datetime.now()):
         self.departure = str(departure.replace(second=0, microsecond=0))
@@ -70,6 +120,7 @@ class Issuance:
 
 
 class Purpose:
+    __slots__ = ('purpose',)
 
     def __init__(self, purpose):
         self.purpose = purpose
@@ -79,40 +130,72 @@ class Purpose:
 
 
 class TransportationType:
+    __slots__ = ('transportationType',)
 
     def __init__(self, type):
         self.transportationType = type
 
     def repr_json(self):
-        return self.purpose
+        return self.transportationType
 
 
 class TravelRequest:
+    """A single travel request, stored as plain values in slots instead of a dict of wrapper objects.
+
+    Wrappers like Device or Purpose are still accepted and unwrapped once, so only the two Coordinates remain
+    objects of their own. The json is the same as before."""
+    __slots__ = ('device_id', 'request_id', 'issuance', 'origin', 'destination', 'departure', 'purpose',
+                 'transportation_type')
 
     def __init__(self, device_id: Device, request_id, issuance: Issuance, source: Coordinate, destination: Coordinate,
                  timestamp: TimeStamp, purpose: Purpose, transportation_type: TransportationType):
-        self.travelRequest = {
-            'deviceId': device_id,
-            'requestId': request_id,
-            'issuance': issuance,
-            'origin': source,
-            'destination': destination,
-            'timeOfDeparture': timestamp,
-            'purpose': purpose,
-            'transportationType': transportation_type
+        self.device_id = label_of(device_id)
+        self.request_id = request_id
+        self.issuance = issuance
+        self.origin = source
+        self.destination = destination
+        self.departure = label_of(timestamp)
+        self.purpose = label_of(purpose)
+        self.transportation_type = label_of(transportation_type)
+
+    @property
+    def travelRequest(self):
+        """The fields as a dict keyed like the json, built on demand."""
+        return {
+            'deviceId': self.device_id,
+            'requestId': self.request_id,
+            'issuance': self.issuance,
+            'origin': self.origin,
+            'destination': self.destination,
+            'timeOfDeparture': self.departure,
+            'purpose': self.purpose,
+            'transportationType': self.transportation_type
         }
 
-    def to_json(self):
-        return json.dumps(self.repr_json(), cls=ComplexEncoder, indent=4)
+    def to_json(self, pretty=False):
+        """Serialize the request to compact json, or to indented json for humans if <pretty> is set."""
+        return (PRETTY_JSON_TEMPLATE if pretty else COMPACT_JSON_TEMPLATE).format(*self.json_fields())
+
+    def json_fields(self):
+        """Return the json-encoded fields in the order used by the json templates."""
+        return (self.device_id, int(self.request_id), int(self.issuance),
+                float(self.origin.latitude), float(self.origin.longitude),
+                float(self.destination.latitude), float(self.destination.longitude),
+                self.departure, encode_label(self.purpose), encode_label(self.transportation_type))
 
     def repr_json(self):
-        return dict(**self.travelRequest)
+        return self.travelRequest
 
     def to_string(self):
         return self.travelRequest
 
-    def to_numbered_line(self):
-        return str(self.travelRequest['requestId']) + "::" + self.to_json().replace('\r', '#*?').replace('\n', '#*!')
+    def to_numbered_line(self, payload=None):
+        """Create a single log line '<requestId>::<json>'. Pass the already serialized <payload> to reuse it."""
+        if payload is None:
+            payload = self.to_json()
+        if '\n' in payload or '\r' in payload:  # only pretty json contains line breaks
+            payload = payload.replace('\r', '#*?').replace('\n', '#*!')
+        return str(self.request_id) + "::" + payload
 
     def get_id(self):
-        return int(self.travelRequest['requestId'])
+        return int(self.request_id)
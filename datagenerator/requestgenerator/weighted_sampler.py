@@ -0,0 +1,55 @@
+"""
+Weighted random selection of indices shared by all pickers.
+"""
+import bisect
+import random
+import numpy as np
+
+
+class WeightedSampler:
+    """Draws indices 0..n-1 according to relative weights using a cumulative distribution computed once.
+
+    Single draws use a binary search on a cached list, batches use np.searchsorted, so a draw costs O(log n)
+    instead of a linear scan over all categories."""
+
+    def __init__(self, weights=None, size=None):
+        if weights is None:
+            weights = np.ones(size)
+
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError("Weights must be a non-empty one-dimensional sequence.")
+        if np.any(weights < 0) or not np.isfinite(weights).all():
+            raise ValueError("Weights must be finite and non-negative.")
+
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("At least one weight must be positive.")
+
+        self.size = len(weights)
+        self.probabilities = weights / total
+        self.uniform = bool(np.all(weights == weights[0]))
+
+        cdf = np.cumsum(weights) / total
+        cdf[-1] = 1.0  # guard against rounding so every draw in [0, 1) maps to a valid index
+        self.cdf = cdf
+        self.cdf_list = cdf.tolist()
+
+    def __len__(self):
+        return self.size
+
+    def pick(self):
+        """Draw a single index."""
+        if self.uniform:
+            return int(random.random() * self.size)
+        return bisect.bisect_left(self.cdf_list, random.random())
+
+    def pick_many(self, count):
+        """Draw <count> indices at once and return them as an array."""
+        if self.uniform:
+            return np.random.randint(0, self.size, count)
+        return self.pick_from_uniforms(np.random.uniform(size=count))
+
+    def pick_from_uniforms(self, uniforms):
+        """Map already drawn uniform numbers in [0, 1) to indices."""
+        return np.minimum(np.searchsorted(self.cdf, uniforms), self.size - 1)
@@ -1,3 +1,4 @@
+import os
 import pathlib
 
 
@@ -9,3 +10,9 @@ def get_project_root() -> pathlib.Path:
 def get_data_path() -> pathlib.Path:
     """Returns the project resource folder data."""
     return get_project_root().joinpath('data')
+
+
+def get_cache_path() -> pathlib.Path:
+    """Returns the folder for compiled data like seed caches, following XDG_CACHE_HOME."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home().joinpath('.cache')
+    return pathlib.Path(cache_home).joinpath('datagenerator')
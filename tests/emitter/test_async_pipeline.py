@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import paho.mqtt.client as mqtt
+from parameterized import parameterized
+from async_pipeline import AsyncPublisher, run_pipeline
+from local_broker import LocalBroker, topic_matches
+from log_writer import RequestLogWriter
+from log_index import LogReader
+from scheduler import RateScheduler, ConstantRate
+from router import Router, shard_of
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+from clock import SimulatedClock
+
+
+class TestAsyncPipeline(unittest.TestCase):
+    """End-to-end tests of the asynchronous pipeline against the local broker."""
+
+    def setUp(self):
+        coordinates = [[11.97, 57.70], [11.94, 57.72], [12.01, 57.68]]
+        self.creator = RequestCreator(IdTracker(), [42], CoordinatePicker(coordinates), PurposePicker(),
+                                      TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75]))
+        self.broker = LocalBroker(keep_messages=True)
+
+    def publish(self, count, qos=0, log_writer=None, rate_scheduler=None, batch_size=64):
+        async def scenario():
+            await self.broker.start()
+            publisher = AsyncPublisher(mqtt.Client('test-async'), qos=qos, max_pending=100)
+            try:
+                await publisher.connect('127.0.0.1', self.broker.port)
+                await run_pipeline(self.creator.create_batch, publisher, 'travel_requests', count, batch_size,
+                                   publishers=3, log_writer=log_writer, rate_scheduler=rate_scheduler)
+                await publisher.close()
+                await asyncio.sleep(0.05)  # let the broker read the last packets
+            finally:
+                await self.broker.stop()
+            return publisher
+
+        return asyncio.run(scenario())
+
+    @parameterized.expand([(0,), (1,), (2,)])
+    def test_all_requests_arrive(self, qos):
+        publisher = self.publish(1000, qos)
+
+        self.assertEqual(publisher.published, 1000)
+        self.assertEqual(publisher.acked, 1000)
+        self.assertEqual(self.broker.received['travel_requests'], 1000)
+        ids = sorted(json.loads(payload)['requestId'] for _, payload in self.broker.messages)
+        self.assertListEqual(ids, list(range(1, 1001)))
+
+    def test_published_requests_are_logged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'async.log')
+            with RequestLogWriter(filename) as log_writer:
+                self.publish(250, log_writer=log_writer, batch_size=10)
+            reader = LogReader(filename)
+            self.assertEqual(reader.count(), 250)
+            self.assertListEqual([request_id for request_id, _ in reader.iter_range()], list(range(1, 251)),
+                                 "Batches of several publisher tasks should be logged in order")
+
+    def test_rate_is_kept(self):
+        rate_scheduler = RateScheduler(ConstantRate(500))
+        rate_scheduler.start()
+        self.publish(200, rate_scheduler=rate_scheduler, batch_size=20)
+        self.assertGreaterEqual(rate_scheduler.deadlines.elapsed(), 0.39)
+
+    def test_simulation_ends_the_pipeline(self):
+        self.creator.clock = SimulatedClock(1577836800, 1577836800 + 3600, 10)
+        publisher = self.publish(None, batch_size=64)
+        self.assertEqual(publisher.published, 359)
+        issuances = sorted(json.loads(payload)['issuance'] for _, payload in self.broker.messages)
+        self.assertEqual((issuances[0], issuances[-1]), (1577836810, 1577840390))
+
+    def test_routes_to_several_brokers(self):
+        brokers = [LocalBroker(), LocalBroker()]
+        router = Router('travel/{transportation}', 2, 'transportation')
+
+        async def scenario():
+            publishers = []
+            for broker in brokers:
+                await broker.start()
+                publisher = AsyncPublisher(mqtt.Client('test-routed'), qos=1)
+                await publisher.connect('127.0.0.1', broker.port)
+                publishers.append(publisher)
+            await run_pipeline(self.creator.create_batch, publishers, router, 600, 50)
+            for publisher in publishers:
+                await publisher.close()
+            await asyncio.sleep(0.05)
+            for broker in brokers:
+                await broker.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(sum(broker.total for broker in brokers), 600)
+        for index, broker in enumerate(brokers):
+            for topic in broker.received:
+                self.assertEqual(shard_of(topic.split('/')[1], 2), index, "Each type should have its own broker")
+
+    def test_cancelled_pipeline_logs_what_was_published(self):
+        rate_scheduler = RateScheduler(ConstantRate(2000))
+        rate_scheduler.start()
+
+        async def scenario(log_writer):
+            await self.broker.start()
+            publisher = AsyncPublisher(mqtt.Client('test-cancel'), max_pending=100)
+            try:
+                await publisher.connect('127.0.0.1', self.broker.port)
+                pipeline = asyncio.ensure_future(run_pipeline(
+                    self.creator.create_batch, publisher, 'travel_requests', None, 100, publishers=2,
+                    log_writer=log_writer, rate_scheduler=rate_scheduler))
+                await asyncio.sleep(0.37)
+                pipeline.cancel()  # like a SIGINT in the middle of a batch
+                with self.assertRaises(asyncio.CancelledError):
+                    await pipeline
+                await publisher.close()
+                await asyncio.sleep(0.05)
+            finally:
+                await self.broker.stop()
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'cancelled.log')
+            with RequestLogWriter(filename) as log_writer:
+                asyncio.run(scenario(log_writer))
+            logged = [request_id for request_id, _ in LogReader(filename).iter_range()]
+        received = sorted(json.loads(payload)['requestId'] for _, payload in self.broker.messages)
+        self.assertGreater(len(received), 0)
+        self.assertListEqual(logged, received)
+
+    @parameterized.expand([(0,), (1,)])
+    def test_reconnects_after_losing_the_broker(self, qos):
+        restarted = LocalBroker()
+
+        async def scenario():
+            port = await self.broker.start()
+            publisher = AsyncPublisher(mqtt.Client('test-reconnect'), qos=qos, min_reconnect_delay=0.05)
+            await publisher.connect('127.0.0.1', port)
+            await publisher.publish('travel_requests', b'before')
+            await publisher.flush()
+            await asyncio.sleep(0.05)
+            await self.broker.stop()
+            await asyncio.sleep(0.1)  # the client notices and retries while no broker listens
+            await restarted.start(port=port)
+            for _ in range(100):
+                if publisher.client.is_connected():
+                    break
+                await asyncio.sleep(0.02)
+            await publisher.publish('travel_requests', b'after')
+            await publisher.close()
+            await asyncio.sleep(0.05)
+            await restarted.stop()
+            return publisher
+
+        publisher = asyncio.run(scenario())
+        self.assertEqual(self.broker.total, 1)
+        self.assertEqual(restarted.total, 1)
+        self.assertEqual(publisher.acked, 2)
+
+    @parameterized.expand([
+        ('travel_requests', 'travel_requests', True),
+        ('travel/+/gothenburg', 'travel/bus/gothenburg', True),
+        ('travel/#', 'travel/bus/gothenburg', True),
+        ('travel/+', 'travel/bus/gothenburg', False),
+        ('travel_requests', 'travel', False),
+    ])
+    def test_topic_matches(self, subscription, topic, expected):
+        self.assertEqual(topic_matches(subscription, topic), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
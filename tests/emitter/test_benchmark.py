@@ -0,0 +1,58 @@
+import copy
+import os
+import tempfile
+import unittest
+from benchmark import run_benchmarks, compare, save_results, load_results, FakeClient, STAGES
+from publisher import Publisher
+
+
+class TestBenchmark(unittest.TestCase):
+    """Unit tests for the offline benchmarks and the comparison with baselines."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.results = run_benchmarks(count=200, repeats=1)
+
+    def test_all_stages_are_measured(self):
+        self.assertListEqual(list(self.results['stages']), list(STAGES))
+        for name, result in self.results['stages'].items():
+            self.assertGreater(result['best_ns_per_op'], 0, name)
+            self.assertLessEqual(result['best_ns_per_op'], result['ns_per_op'], name)
+            self.assertIn('blocks_per_op', result)
+        # a request keeps its fields and coordinates allocated
+        self.assertGreater(self.results['stages']['create_request']['blocks_per_op'], 3)
+
+    def test_no_regression_against_itself(self):
+        self.assertListEqual(compare(self.results, self.results), [])
+
+    def test_regressions_are_flagged(self):
+        baseline = copy.deepcopy(self.results)
+        baseline['stages']['to_json']['best_ns_per_op'] /= 2
+        baseline['stages']['create_request']['blocks_per_op'] -= 2
+        del baseline['stages']['publish']  # stages missing in the baseline are skipped
+        regressions = compare(self.results, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('create_request: '))
+        self.assertIn('+100%', regressions[1])
+
+    def test_baseline_roundtrip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'baseline.json')
+            save_results(self.results, filename)
+            self.assertDictEqual(load_results(filename), self.results)
+
+    def test_unknown_stage(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks(['to_yaml'])
+
+    def test_fake_client_acknowledges(self):
+        client = FakeClient()
+        publisher = Publisher(client, qos=1)
+        self.assertTrue(publisher.publish('t', 'payload'))
+        self.assertEqual(publisher.acked, 1)
+        self.assertEqual(client.bytes, 7)
+        self.assertTrue(publisher.flush(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+from parameterized import parameterized
+from block_log import BlockLogWriter, BlockLogReader, open_log_reader, read_block_index, BLOCK_HEADER, COUNT
+from log_writer import RequestLogWriter, rotated_filename
+from async_pipeline import run_pipeline
+from benchmark import FakeAsyncPublisher
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+from clock import SimulatedClock
+
+
+class TestBlockLog(unittest.TestCase):
+    """Unit tests for the compressed block log and its reader."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "session.dglog")
+        self.creator = RequestCreator(IdTracker(), [42], CoordinatePicker([[11.97, 57.70], [11.94, 57.72]]),
+                                      PurposePicker(), TransportationTypePicker(["tram", "ferry", "bus"]),
+                                      clock=SimulatedClock(1577836800, interval=0.5))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def requests(self, count):
+        return [self.creator.create_random_request() for _ in range(count)]
+
+    def write_log(self, requests, block_size=100, pretty=False):
+        with BlockLogWriter(self.filename, block_size, pretty=pretty) as writer:
+            for request in requests:
+                writer.write_request(request)
+
+    @parameterized.expand([
+        ["compact", False],
+        ["pretty", True],
+    ])
+    def test_requests_are_read_as_published(self, name, pretty):
+        requests = self.requests(250)
+        self.write_log(requests, pretty=pretty)
+        reader = BlockLogReader(self.filename)
+
+        self.assertEqual(len(reader.blocks), 3)
+        self.assertEqual((reader.count(), reader.first_id(), reader.last_id()), (250, 1, 250))
+        self.assertListEqual(list(reader.iter_range()),
+                             [(request.get_id(), request.to_json(pretty)) for request in requests])
+        self.assertListEqual([request_id for request_id, _ in reader.iter_range(95, 105)], list(range(95, 106)))
+
+    def test_batch_rows_are_logged(self):
+        batch = self.creator.create_batch(50)
+        with BlockLogWriter(self.filename) as writer:
+            writer.write_batch(batch, [0, 3, 4, 49])
+        payloads = batch.to_json_list()
+        self.assertListEqual(list(BlockLogReader(self.filename).iter_range()),
+                             [(row + 1, payloads[row]) for row in (0, 3, 4, 49)])
+
+    def test_text_lines_are_converted(self):
+        requests = self.requests(20)
+        with BlockLogWriter(self.filename) as writer:
+            for request in requests:
+                writer.write(request.to_numbered_line(request.to_json(True)))
+        reader = BlockLogReader(self.filename)
+        self.assertEqual(reader.id_range_of_times(1577836800 + 2, 1577836800 + 3), (4, 7))
+        self.assertListEqual(list(reader.iter_range()),
+                             [(request.get_id(), request.to_json(True)) for request in requests])
+
+    def test_same_answers_as_text_log(self):
+        requests = self.requests(300)
+        self.write_log(requests, block_size=64)
+        text_filename = os.path.join(self.directory.name, "session.log")
+        with RequestLogWriter(text_filename) as writer:
+            for request in requests:
+                writer.write_request(request)
+        block_reader, text_reader = open_log_reader(self.filename), open_log_reader(text_filename)
+
+        self.assertIsInstance(block_reader, BlockLogReader)
+        self.assertNotIsInstance(text_reader, BlockLogReader)
+        for start_time, stop_time in [(1577836800 + 30, 1577836800 + 40), (None, 1577836800 + 5),
+                                      (1577836800 + 149, None), (1577837800, None)]:
+            self.assertEqual(block_reader.id_range_of_times(start_time, stop_time),
+                             text_reader.id_range_of_times(start_time, stop_time))
+        self.assertListEqual(list(block_reader.iter_range(60, 130)), list(text_reader.iter_range(60, 130)))
+        self.assertLess(os.path.getsize(self.filename) * 4, os.path.getsize(text_filename))
+
+    def test_cut_off_block_is_ignored(self):
+        self.write_log(self.requests(30), block_size=10)
+        with open(self.filename, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filename) - 5)
+        self.assertListEqual(read_block_index(self.filename)[:, COUNT].tolist(), [10, 10])
+        self.assertEqual(BlockLogReader(self.filename).last_id(), 20)
+
+    def test_appending_continues_the_log(self):
+        self.write_log(self.requests(10))
+        with BlockLogWriter(self.filename, append=True) as writer:
+            for request in self.requests(5):
+                writer.write_request(request)
+        self.assertListEqual([request_id for request_id, _ in BlockLogReader(self.filename).iter_range()],
+                             list(range(1, 16)))
+
+    def test_rotation(self):
+        with BlockLogWriter(self.filename, block_size=10, max_bytes=BLOCK_HEADER.size) as writer:
+            for request in self.requests(25):
+                writer.write_request(request)
+        self.assertListEqual([BlockLogReader(rotated_filename(self.filename, index)).first_id()
+                              for index in (1, 2, 3)], [1, 11, 21])
+        self.assertEqual(BlockLogReader(self.filename).count(), 0)
+
+    def test_not_a_block_log(self):
+        text_filename = os.path.join(self.directory.name, "session.log")
+        with open(text_filename, 'w') as f:
+            f.write('1::{}\n')
+        with self.assertRaises(ValueError):
+            BlockLogReader(text_filename)
+        with self.assertRaises(ValueError):
+            BlockLogWriter(text_filename, append=True)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            BlockLogWriter(self.filename, codec='lz4')
+
+    @unittest.skipUnless(importlib.util.find_spec('zstandard'), 'zstandard is not installed')
+    def test_zstd(self):
+        requests = self.requests(20)
+        with BlockLogWriter(self.filename, codec='zstd') as writer:
+            for request in requests:
+                writer.write_request(request)
+        self.assertListEqual([payload for _, payload in BlockLogReader(self.filename).iter_range()],
+                             [request.to_json() for request in requests])
+
+    def test_pipeline_logs_published_rows(self):
+        with BlockLogWriter(self.filename) as writer:
+            asyncio.run(run_pipeline(self.creator.create_batch, FakeAsyncPublisher(), 'travel_requests', 250, 10,
+                                     publishers=3, log_writer=writer))
+        self.assertListEqual([request_id for request_id, _ in BlockLogReader(self.filename).iter_range()],
+                             list(range(1, 251)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import argparse
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from parameterized import parameterized
+from exporter import export_requests, export_shard, open_writer, format_of, shard_filename, shard_count, \
+    CSV_COLUMNS, DEFAULT_EXPORT_BATCH
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker, \
+    SHIFTING_DISTANCE, DEFAULT_OFFSET_DAYS, DEFAULT_SHIFT_DAYS
+from clock import SimulatedClock
+
+COORDINATES = [[11.97, 57.70], [11.94, 57.72], [12.01, 57.68]]
+
+
+class TestExporter(unittest.TestCase):
+    """Unit tests for the bulk export of requests to files."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.seeds = os.path.join(self.directory.name, 'seeds.geojson')
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        with open(self.seeds, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': coordinate}}
+                for coordinate in COORDINATES]}, f)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def creator(self, clock):
+        return RequestCreator(IdTracker(), [42], CoordinatePicker(COORDINATES), PurposePicker(),
+                              TransportationTypePicker(["tram", "ferry", "bus"]), clock=clock)
+
+    def export(self, arguments, worker=0, workers=1):
+        return export_shard(arguments, worker, workers, cache_dir=self.cache_dir)
+
+    def arguments(self, output, **kwargs):
+        defaults = dict(output=output, count=None, format=None, simulate=None, until=None, interval=1.0, rate=None,
+                        batch=DEFAULT_EXPORT_BATCH, seed=1, first=1, ifile=self.seeds, device=42, limit=None,
+                        weights=None, trip_length=None, offset=SHIFTING_DISTANCE, days_offset=DEFAULT_OFFSET_DAYS,
+                        shift_days=DEFAULT_SHIFT_DAYS)
+        defaults.update(kwargs)
+        return argparse.Namespace(**defaults)
+
+    def test_jsonl_holds_the_payloads(self):
+        creator = self.creator(SimulatedClock(1577836800))
+        writer = open_writer(self.path('requests.jsonl'))
+        self.assertEqual(export_requests(creator.create_batch, writer, 250, batch_size=100), 250)
+        writer.close()
+
+        with open(self.path('requests.jsonl'), encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f]
+        self.assertListEqual([request['requestId'] for request in requests], list(range(1, 251)))
+        self.assertEqual(requests[-1]['issuance'], 1577836800 + 250)
+
+    def test_export_ends_with_the_simulation(self):
+        creator = self.creator(SimulatedClock(1577836800, 1577836800 + 60, interval=0.5))
+        sizes = []
+        writer = open_writer(self.path('requests.csv.gz'))
+        self.assertEqual(export_requests(creator.create_batch, writer, batch_size=50, on_written=sizes.append), 119)
+        writer.close()
+        self.assertListEqual(sizes, [50, 50, 19])
+
+        with gzip.open(self.path('requests.csv.gz'), 'rt', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertListEqual(rows[0], CSV_COLUMNS)
+        self.assertEqual(len(rows), 120)
+        self.assertEqual(rows[1][0], '42')
+        self.assertIn(rows[1][8], ['work', 'leisure', 'school', 'tourism'])
+
+    def test_shards_stripe_ids_and_clock(self):
+        output = self.path('requests.jsonl')
+        arguments = self.arguments(output, count=5, simulate=1577836800.0, interval=2.0)
+        self.assertListEqual([self.export(arguments, worker, 2) for worker in range(2)], [3, 2])
+
+        requests = []
+        for worker in range(2):
+            with open(shard_filename(output, worker), encoding='utf-8') as f:
+                requests += [json.loads(line) for line in f]
+        requests.sort(key=lambda request: request['requestId'])
+        self.assertListEqual([request['requestId'] for request in requests], [1, 2, 3, 4, 5])
+        self.assertListEqual([request['issuance'] - 1577836800 for request in requests], [2, 4, 6, 8, 10])
+
+    def test_seed_makes_exports_reproducible(self):
+        for name in ('a.csv', 'b.csv'):
+            self.export(self.arguments(self.path(name), count=20, simulate=1577836800.0))
+        with open(self.path('a.csv')) as a, open(self.path('b.csv')) as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_range_is_regenerated(self):
+        self.export(self.arguments(self.path('all.jsonl'), count=30, simulate=1577836800.0, batch=7))
+        self.export(self.arguments(self.path('range.jsonl'), count=10, simulate=1577836800.0, first=15))
+        with open(self.path('all.jsonl')) as all_requests, open(self.path('range.jsonl')) as range_requests:
+            self.assertListEqual(all_requests.readlines()[14:24], range_requests.readlines())
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+        self.export(self.arguments(self.path('requests.parquet'), count=30, simulate=1577836800.0, batch=8))
+        table = pyarrow.parquet.read_table(self.path('requests.parquet'))
+        self.assertEqual(table.num_rows, 30)
+        self.assertListEqual(table.column('requestId').to_pylist(), list(range(1, 31)))
+
+    @parameterized.expand([
+        ('requests.jsonl', 'jsonl'),
+        ('requests.CSV', 'csv'),
+        ('requests.csv.gz', 'csv'),
+        ('requests.parquet', 'parquet'),
+    ])
+    def test_format_of(self, filename, expected):
+        self.assertEqual(format_of(filename), expected)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            format_of('requests.xml')
+
+    def test_shard_filename(self):
+        self.assertEqual(shard_filename('out/requests.csv.gz', 3), 'out/requests.worker3.csv.gz')
+        self.assertEqual(shard_filename('requests.jsonl', 0), 'requests.worker0.jsonl')
+
+    def test_shard_count(self):
+        self.assertListEqual([shard_count(10, worker, 4) for worker in range(4)], [3, 3, 2, 2])
+        self.assertIsNone(shard_count(None, 0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import log_index
+from log_index import LogReader, build_index, index_filename, load_index, parse_numbered_line
+from log_writer import RequestLogWriter
+
+
+class TestLogIndex(unittest.TestCase):
+    """Unit tests for the offset index of request logs and the random access reader."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "session.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_log(self, first, last, stride=4):
+        with RequestLogWriter(self.filename, buffer_size=100, index_stride=stride) as writer:
+            for request_id in range(first, last + 1):
+                writer.write('{0}::{{"requestId":{0}}}'.format(request_id), request_id)
+
+    def test_range_is_read_through_index(self):
+        self.write_log(5, 104)
+        reader = LogReader(self.filename)
+
+        self.assertEqual(reader.first_id(), 5)
+        self.assertEqual(reader.last_id(), 104)
+        self.assertEqual(reader.count(), 100)
+        self.assertEqual(len(reader.entries), 25)
+        self.assertListEqual([request_id for request_id, _ in reader.iter_range(50, 57)], list(range(50, 58)))
+        self.assertListEqual(list(reader.iter_range(104, 200)), [(104, '{"requestId":104}')])
+
+    def test_index_is_built_for_old_logs(self):
+        with open(self.filename, "w") as f:
+            for request_id in range(1, 11):
+                f.write('{0}::{{#*!    "requestId": {0}#*!}}\n'.format(request_id))
+
+        self.assertFalse(os.path.exists(index_filename(self.filename)))
+        reader = LogReader(self.filename, stride=3)
+        self.assertTrue(os.path.exists(index_filename(self.filename)))
+        self.assertEqual(reader.count(), 10)
+        self.assertListEqual(list(reader.iter_range(7, 7)), [(7, '{\n    "requestId": 7\n}')])
+
+    def test_log_is_scanned_if_the_index_cant_be_written(self):
+        self.write_log(1, 30, stride=4)
+        os.remove(index_filename(self.filename))
+
+        # like a log in a read-only directory, where the sidecar can't be created
+        with mock.patch.object(log_index, 'LogIndexWriter', side_effect=PermissionError(13, 'Permission denied')):
+            with self.assertWarns(UserWarning):
+                reader = LogReader(self.filename, stride=4)
+        self.assertFalse(os.path.exists(index_filename(self.filename)))
+        self.assertEqual(reader.count(), 30)
+        self.assertEqual(reader.last_id(), 30)
+        self.assertListEqual([request_id for request_id, _ in reader.iter_range(9, 13)], list(range(9, 14)))
+
+        build_index(self.filename, 4)
+        self.assertListEqual(reader.entries.tolist(), load_index(self.filename)[1].tolist())
+
+    def test_appending_continues_index(self):
+        self.write_log(1, 10)
+        with RequestLogWriter(self.filename, append=True, index_stride=4) as writer:
+            writer.write('11::{}', 11)
+
+        reader = LogReader(self.filename)
+        self.assertEqual(reader.count(), 11)
+        self.assertEqual(build_index(self.filename, 4), 11)
+
+    def test_id_range_of_times(self):
+        with RequestLogWriter(self.filename, index_stride=3) as writer:
+            for request_id in range(1, 21):
+                writer.write('{0}::{{"issuance":{1}}}'.format(request_id, 1000 + request_id // 4), request_id)
+        reader = LogReader(self.filename)
+
+        self.assertTupleEqual(reader.id_range_of_times(1002, 1003), (8, 15))
+        self.assertTupleEqual(reader.id_range_of_times(1004, None), (16, 20))
+        self.assertTupleEqual(reader.id_range_of_times(None, 1000), (1, 3))
+        self.assertTupleEqual(reader.id_range_of_times(2000, None), (None, None))
+
+    def test_parse_numbered_line(self):
+        self.assertEqual(parse_numbered_line(b'12::{"a":"b::c"}\n'), (12, '{"a":"b::c"}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+import unittest
+from log_writer import RequestLogWriter, rotated_filename
+
+
+class TestRequestLogWriter(unittest.TestCase):
+    """Unit tests for the buffered, rotating request log writer."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "session.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, filename=None):
+        with open(filename or self.filename) as f:
+            return f.read().splitlines()
+
+    def test_lines_are_buffered_until_flush(self):
+        writer = RequestLogWriter(self.filename, buffer_size=1024, flush_interval=60)
+        writer.write("1::{}")
+        writer.write("2::{}")
+        self.assertListEqual(self.read(), [])
+
+        writer.close()
+        self.assertListEqual(self.read(), ["1::{}", "2::{}"])
+
+    def test_full_buffer_is_written(self):
+        with RequestLogWriter(self.filename, buffer_size=10, flush_interval=60) as writer:
+            writer.write("1::0123456789")
+            self.assertListEqual(self.read(), ["1::0123456789"])
+
+    def test_rotation_by_size(self):
+        rotated = []
+        with RequestLogWriter(self.filename, buffer_size=1, max_bytes=20) as writer:
+            writer.on_rotate.append(rotated.append)
+            for i in range(1, 6):
+                writer.write("{0}::0123456789".format(i))
+
+        self.assertListEqual(rotated, [rotated_filename(self.filename, 1), rotated_filename(self.filename, 2)])
+        self.assertListEqual(self.read(rotated[0]), ["1::0123456789", "2::0123456789"])
+        self.assertListEqual(self.read(rotated[1]), ["3::0123456789", "4::0123456789"])
+        self.assertListEqual(self.read(), ["5::0123456789"])
+
+    def test_background_thread_flushes(self):
+        writer = RequestLogWriter(self.filename, buffer_size=1024, flush_interval=0.01, background=True)
+        writer._flushed_at = time.monotonic() + 60  # make sure write() itself does not flush
+        writer.write("1::{}")
+        time.sleep(0.2)
+        self.assertListEqual(self.read(), ["1::{}"])
+        writer.close()
+        writer.close()
+
+    def test_close_waits_for_the_write_in_progress(self):
+        writer = RequestLogWriter(self.filename, buffer_size=1024, flush_interval=60)
+        writer.write("1::{}")
+        write, calls = writer._file.write, []
+
+        def interrupted_write(chunk):
+            writer.call_when_idle(lambda: calls.append(self.read()))  # like a signal arriving mid-write
+            write(chunk)
+
+        writer._file.write = interrupted_write
+        writer.flush()
+        self.assertListEqual(calls, [["1::{}"]])
+        writer.close()
+        self.assertListEqual(self.read(), ["1::{}"])
+
+    def test_close_waits_for_the_whole_step(self):
+        writer = RequestLogWriter(self.filename, buffer_size=1024, flush_interval=60)
+        calls = []
+
+        def stop():
+            writer.close()
+            calls.append(self.read())
+
+        with writer.writing():
+            writer.call_when_idle(stop)  # like a signal arriving between publishing and logging
+            self.assertListEqual(calls, [])
+            writer.write("1::{}", 1)
+        self.assertListEqual(calls, [["1::{}"]])
+
+    def test_call_when_idle_runs_at_once_outside_writes(self):
+        calls = []
+        with RequestLogWriter(self.filename) as writer:
+            writer.call_when_idle(lambda: calls.append(1))
+            self.assertListEqual(calls, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
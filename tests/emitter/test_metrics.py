@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+import urllib.request
+from parameterized import parameterized
+from metrics import Metrics, MetricsServer, Histogram, parse_address
+from async_pipeline import run_pipeline
+from benchmark import FakeAsyncPublisher
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.on_connect = None
+
+
+class TestMetrics(unittest.TestCase):
+    """Unit tests for the live metrics of the generator."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(0.001, 0.01, 0.1))
+        for value in (0.0005, 0.001, 0.005, 0.5):
+            histogram.observe(value)
+        histogram.observe_many(0.05, 2)
+        samples = dict(histogram.samples())
+        self.assertListEqual(list(samples.items())[:4], [
+            ('latency_seconds_bucket{le="0.001"}', 2), ('latency_seconds_bucket{le="0.01"}', 3),
+            ('latency_seconds_bucket{le="0.1"}', 5), ('latency_seconds_bucket{le="+Inf"}', 6)])
+        self.assertAlmostEqual(samples['latency_seconds_sum'], 0.6065)
+        self.assertEqual(samples['latency_seconds_count'], 6)
+
+    def test_quantile(self):
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(1.0, 2.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        histogram.observe_many(1.5, 4)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertAlmostEqual(histogram.quantile(1.0), 2.0)
+
+    def test_render_and_report(self):
+        metrics = Metrics()
+        metrics.observe_request(0.0, 2e-5, 3e-5, 4e-5)
+        publisher = FakeAsyncPublisher()
+        publisher.published = publisher.acked = 1
+        metrics.watch_publishers([publisher])
+
+        text = metrics.render()
+        self.assertIn('# TYPE datagenerator_requests_generated_total counter\n'
+                      'datagenerator_requests_generated_total 1\n', text)
+        self.assertIn('datagenerator_requests_acked_total 1\n', text)
+        self.assertIn('datagenerator_generation_seconds_bucket{le="2.5e-05"} 1\n', text)
+        self.assertTrue(text.endswith('datagenerator_target_rate 0\n'))
+
+        self.assertIsNone(metrics.report())
+        line = metrics.report(0)
+        self.assertTrue(line.startswith('Generated 1 ('))
+        self.assertIn('pending 0, reconnects 0, p99 ms: generate 0.0', line)
+
+    def test_reconnects_are_counted(self):
+        calls = []
+        client = FakeClient()
+        client.on_connect = lambda *args: calls.append(args[-1])
+        metrics = Metrics()
+        metrics.watch_client(client)
+        for rc in (0, 5, 0, 0):
+            client.on_connect(client, None, {}, rc)
+        self.assertEqual(metrics.reconnects.get(), 2)
+        self.assertListEqual(calls, [0, 5, 0, 0])
+
+    def test_server(self):
+        metrics = Metrics()
+        metrics.generated.inc(3)
+        server = MetricsServer(metrics, port=0).start()
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:{0}/metrics'.format(server.port)) as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+                self.assertIn('datagenerator_requests_generated_total 3\n', response.read().decode('utf-8'))
+        finally:
+            server.close()
+
+    def test_pipeline_metrics(self):
+        creator = RequestCreator(IdTracker(), [42], CoordinatePicker([[11.97, 57.70], [11.94, 57.72]]),
+                                 PurposePicker(), TransportationTypePicker(["tram", "ferry", "bus"]))
+        metrics = Metrics()
+        asyncio.run(run_pipeline(creator.create_batch, FakeAsyncPublisher(), 'travel_requests', 250, 100,
+                                 metrics=metrics))
+        self.assertEqual(metrics.generated.get(), 250)
+        self.assertEqual(metrics.acked.get(), 250)
+        self.assertEqual(metrics.generation.count, 250)
+        self.assertEqual(metrics.publish.count, 250)
+        self.assertEqual(metrics.queue_depth.get(), 1)  # only the end marker is left
+
+    @parameterized.expand([
+        ('9355', ('127.0.0.1', 9355)),
+        ('0.0.0.0:9100', ('0.0.0.0', 9100)),
+    ])
+    def test_parse_address(self, text, expected):
+        self.assertEqual(parse_address(text), expected)
+
+    @parameterized.expand(['metrics', 'localhost:70000'])
+    def test_invalid_address(self, text):
+        with self.assertRaises(ValueError):
+            parse_address(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import threading
+import unittest
+import paho.mqtt.client as mqtt
+from publisher import Publisher
+
+
+class FakeInfo:
+
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class FakeClient:
+    """Stand-in for a paho client which acknowledges messages only when asked to."""
+
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.rc = rc
+        self.on_publish = None
+        self.messages = []
+        self.loops_started = 0
+        self.max_inflight = None
+
+    def max_inflight_messages_set(self, inflight):
+        self.max_inflight = inflight
+
+    def loop_start(self):
+        self.loops_started += 1
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, payload, qos))
+        return FakeInfo(self.rc)
+
+    def ack(self, count=1):
+        for _ in range(count):
+            self.on_publish(self, None, len(self.messages))
+
+
+class TestPublisher(unittest.TestCase):
+    """Unit tests for the flow control of the publisher."""
+
+    def test_loop_is_started_once(self):
+        client = FakeClient()
+        publisher = Publisher(client, qos=1, max_inflight=7)
+        publisher.start()
+        publisher.start()
+        self.assertEqual(client.loops_started, 1)
+        self.assertEqual(client.max_inflight, 7)
+
+        self.assertTrue(publisher.publish("t", "a"))
+        self.assertListEqual(client.messages, [("t", "a", 1)])
+
+    def test_messages_are_shed_above_watermark(self):
+        client = FakeClient()
+        publisher = Publisher(client, max_pending=3, shed=True)
+        results = [publisher.publish("t", str(i)) for i in range(5)]
+        self.assertListEqual(results, [True, True, True, False, False])
+        self.assertEqual(publisher.dropped, 2)
+
+        client.ack(2)
+        self.assertTrue(publisher.publish("t", "5"))
+        self.assertEqual(publisher.pending(), 2)
+
+    def test_publish_blocks_until_acked(self):
+        client = FakeClient()
+        publisher = Publisher(client, max_pending=1)
+        publisher.publish("t", "0")
+
+        thread = threading.Thread(target=publisher.publish, args=("t", "1"))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive(), "Publishing should block while the queue is full")
+
+        client.ack()
+        thread.join(1.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(publisher.published, 2)
+
+    def test_failures_are_counted(self):
+        publisher = Publisher(FakeClient(mqtt.MQTT_ERR_NO_CONN), qos=0)
+        self.assertFalse(publisher.publish("t", "a"))
+        self.assertEqual(publisher.failed, 1)
+        self.assertEqual(publisher.pending(), 0)
+        self.assertTrue(publisher.flush(0.1))
+
+        queued = Publisher(FakeClient(mqtt.MQTT_ERR_NO_CONN), qos=1)
+        self.assertTrue(queued.publish("t", "a"), "QoS 1 messages are resent by paho after reconnecting")
+        self.assertFalse(queued.flush(0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from parameterized import parameterized
+from router import Router, parse_brokers, cell_of, shard_of
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+
+
+class TestRouter(unittest.TestCase):
+    """Unit tests for routing requests to topics and brokers."""
+
+    def setUp(self):
+        coordinates = [[11.97, 57.70], [11.94, 57.72], [12.31, 57.48]]
+        self.creator = RequestCreator(IdTracker(), [42, 43], CoordinatePicker(coordinates), PurposePicker(),
+                                      TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75]))
+
+    @parameterized.expand([
+        ('localhost', [('localhost', 1883)]),
+        ('a,b:1884', [('a', 1883), ('b', 1884)]),
+        (' a , b ', [('a', 1883), ('b', 1883)]),
+    ])
+    def test_parse_brokers(self, spec, expected):
+        self.assertListEqual(parse_brokers(spec), expected)
+
+    @parameterized.expand([('a,,b',), ('a:port',)])
+    def test_parse_invalid_brokers(self, spec):
+        with self.assertRaises(ValueError):
+            parse_brokers(spec)
+
+    @parameterized.expand([
+        ('travel/{country}', 'topic'),
+        ('travel/{cell}', 'origin'),
+    ])
+    def test_invalid_routes(self, topic, shard_by):
+        with self.assertRaises(ValueError):
+            Router(topic, 2, shard_by)
+
+    def test_cell_of(self):
+        self.assertEqual(cell_of(57.71, 11.97, 0.05), "2954_3839")
+        self.assertEqual(cell_of(-89.99, -179.99, 1.0), "0_0")
+
+    @parameterized.expand([('travel_requests',), ('travel/requests',)])
+    def test_static_route(self, topic):
+        router = Router(topic, 3)
+        expected = (shard_of(topic, 3), topic)
+        self.assertTrue(router.is_static())
+        self.assertTupleEqual(router.route(self.creator.create_random_request()), expected)
+        self.assertListEqual(router.route_batch(self.creator.create_batch(5)), [expected] * 5)
+
+    def test_topic_fields(self):
+        router = Router('travel/{transportation}/{purpose}/{device}/{cell}')
+        request = self.creator.create_random_request(0)
+        cell = cell_of(request.origin.latitude, request.origin.longitude)
+        expected = 'travel/{0}/{1}/{2}/{3}'.format(request.transportation_type, request.purpose, request.device_id,
+                                                   cell)
+        self.assertTupleEqual(router.route(request), (0, expected))
+
+    @parameterized.expand([('topic',), ('cell',), ('device',), ('transportation',)])
+    def test_batch_routes_like_requests(self, shard_by):
+        router = Router('travel/{cell}/{transportation}', 4, shard_by)
+        batch = self.creator.create_batch(300, uncertainty_distance=2000)
+        routes = router.route_batch(batch)
+
+        self.assertListEqual(routes, [router.route(request) for request in batch.to_requests()])
+        self.assertGreater(len({topic for _, topic in routes}), 3)
+        brokers_of_topics = {}
+        for broker, topic in routes:
+            brokers_of_topics.setdefault(topic, set()).add(broker)
+        if shard_by in ('topic', 'cell'):
+            self.assertTrue(all(len(brokers) == 1 for brokers in brokers_of_topics.values()),
+                            "A topic should always be sent to the same broker")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime
+from scheduler import DeadlineScheduler, RateScheduler, issuance_schedule, read_issuance, parse_rate_profile
+from parameterized import parameterized
+
+
+class FakeClock:
+    """Clock that only advances when the scheduler sleeps or work is simulated."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestScheduler(unittest.TestCase):
+    """Unit tests for deadline based timing."""
+
+    def test_work_time_does_not_drift(self):
+        clock = FakeClock()
+        scheduler = DeadlineScheduler(clock, clock.sleep)
+        scheduler.start()
+        for i in range(1, 101):
+            clock.now += 0.004  # work between two messages
+            scheduler.wait_until(i * 0.01)
+        self.assertAlmostEqual(scheduler.elapsed(), 1.0, delta=1e-9)
+        self.assertEqual(scheduler.max_lag, 0.0)
+
+    def test_lag_is_reported(self):
+        clock = FakeClock()
+        scheduler = DeadlineScheduler(clock, clock.sleep)
+        scheduler.start()
+        clock.now += 0.5
+        self.assertAlmostEqual(scheduler.wait_until(0.2), 0.3)
+        self.assertAlmostEqual(scheduler.max_lag, 0.3)
+
+    def test_issuance_schedule(self):
+        entries = [(1, '{"issuance":10}'), (2, '{"issuance":10}'), (3, '{\n    "issuance": 12\n}'),
+                   (4, '{"issuance":13}')]
+        self.assertListEqual([deadline for deadline, _, _ in issuance_schedule(entries)], [0.0, 0.5, 2.0, 3.0])
+        self.assertListEqual([deadline for deadline, _, _ in issuance_schedule(entries, 2)], [0.0, 0.25, 1.0, 1.5])
+        self.assertListEqual([deadline for deadline, _, _ in issuance_schedule(entries, 0)], [0.0] * 4)
+        self.assertListEqual([request_id for _, request_id, _ in issuance_schedule(entries)], [1, 2, 3, 4])
+
+    def test_missing_issuance(self):
+        with self.assertRaises(ValueError):
+            read_issuance('{"requestId": 3}')
+
+    def test_rate_is_hit_despite_work(self):
+        clock = FakeClock()
+        scheduler = RateScheduler(parse_rate_profile('100'), report_interval=1.0, clock=clock, sleep=clock.sleep)
+        scheduler.start()
+        while scheduler.deadlines.elapsed() < 2.0:
+            scheduler.wait_next()
+            clock.now += 0.004
+        self.assertEqual(scheduler.sent, 201)
+        achieved, target = scheduler.report()
+        self.assertAlmostEqual(achieved, 100, delta=1)
+        self.assertEqual(target, 100)
+
+    def test_backlog_is_dropped(self):
+        clock = FakeClock()
+        scheduler = RateScheduler(parse_rate_profile('100'), burst=10, clock=clock, sleep=clock.sleep)
+        scheduler.start()
+        scheduler.wait_next()
+        clock.now += 1.0  # stall for 100 messages
+        burst = 0
+        while scheduler.wait_next() > 0:
+            burst += 1
+        self.assertLessEqual(burst, 11)
+
+    def test_ramp_sends_area_under_profile(self):
+        clock = FakeClock()
+        scheduler = RateScheduler(parse_rate_profile('ramp:0:100:10'), clock=clock, sleep=clock.sleep)
+        scheduler.start()
+        while scheduler.deadlines.elapsed() < 10.0:
+            scheduler.wait_next()
+        self.assertAlmostEqual(scheduler.sent, 500, delta=10)
+
+    @parameterized.expand([
+        ["constant", "25.5", [(0, 25.5), (1000, 25.5)]],
+        ["step", "step:10@0,50@60,100@120", [(0, 10), (59.9, 10), (60, 50), (500, 100)]],
+        ["ramp", "ramp:10:200:100", [(0, 10), (50, 105), (100, 200), (1000, 200)]],
+        ["sine", "sine:100:80:86400", [(0, 20), (43200, 180)]],
+    ])
+    def test_parse_rate_profile(self, name, spec, expected):
+        profile = parse_rate_profile(spec, now=datetime(2020, 1, 1, 3, 0, 0))
+        for elapsed, rate in expected:
+            self.assertAlmostEqual(profile(elapsed), rate, delta=1e-9)
+
+    @parameterized.expand([
+        ["text", "fast"],
+        ["kind", "square:1:2"],
+        ["ramp", "ramp:1:2"],
+        ["negative", "-5"],
+        ["zero", "0"],
+        ["nan", "nan"],
+        ["infinite", "inf"],
+        ["stays_at_zero", "step:10@0,0@60"],
+        ["negative_late_step", "step:10@0,-5@2000"],
+        ["ramp_to_zero", "ramp:10:0:60"],
+        ["silent_sine", "sine:0:0"],
+        ["zero_period", "sine:100:80:0"],
+    ])
+    def test_invalid_rate_profile(self, name, spec):
+        with self.assertRaises(ValueError):
+            parse_rate_profile(spec)
+
+    def test_pause_is_skipped(self):
+        clock = FakeClock()
+        scheduler = RateScheduler(parse_rate_profile('step:10@0,0@1,10@3'), clock=clock, sleep=clock.sleep)
+        scheduler.start()
+        while scheduler.sent < 20:
+            scheduler.wait_next()
+        self.assertAlmostEqual(scheduler.deadlines.elapsed(), 3.9, delta=0.11)
+
+    def test_endless_pause_raises(self):
+        clock = FakeClock()
+        scheduler = RateScheduler(lambda elapsed: 0.0, clock=clock, sleep=clock.sleep)
+        scheduler.MAX_PAUSE = 10.0
+        with self.assertRaises(ValueError):
+            scheduler.wait_next()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import random
+import unittest
+import numpy as np
+from workers import seed_worker, worker_filename
+from overpass_handler import IdTracker
+
+
+class TestWorkers(unittest.TestCase):
+    """Unit tests for splitting the generator between worker processes."""
+
+    def draw(self, seed, worker, workers):
+        seed_worker(seed, worker, workers)
+        return random.random(), np.random.uniform()
+
+    def test_seeds_are_reproducible_and_distinct(self):
+        self.assertTupleEqual(self.draw(7, 1, 4), self.draw(7, 1, 4))
+        self.assertNotEqual(self.draw(7, 1, 4), self.draw(7, 2, 4))
+        self.assertNotEqual(self.draw(7, 1, 4), self.draw(8, 1, 4))
+        self.assertNotEqual(self.draw(None, 1, 4), self.draw(None, 1, 4))
+
+    def test_striped_ids_do_not_collide(self):
+        trackers = [IdTracker(worker + 1, 3) for worker in range(3)]
+        ids = [tracker.next() for tracker in trackers] + \
+              [request_id for tracker in trackers for request_id in tracker.next_many(5).tolist()]
+        self.assertListEqual(sorted(ids), list(range(1, 19)))
+        self.assertListEqual(trackers[1].next_many(3).tolist(), [20, 23, 26])
+
+    def test_worker_filename(self):
+        self.assertEqual(worker_filename("logs/1234.log", 2), "logs/1234.worker2.log")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import time
+import unittest
+from datetime import datetime
+import numpy as np
+from parameterized import parameterized
+from clock import SystemClock, SimulatedClock, DepartureFormatter
+from scheduler import RateScheduler, StepRate
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+
+START = 1577836800  # 2020-01-01 00:00:00 UTC
+
+
+class TestClock(unittest.TestCase):
+    """Unit tests for the time sources and the departure formatter."""
+
+    def setUp(self):
+        self.timezone = os.environ.get('TZ')
+
+    def tearDown(self):
+        if self.timezone is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.timezone
+        time.tzset()
+
+    def creator(self, clock=None):
+        return RequestCreator(IdTracker(), [42], CoordinatePicker([[11.97, 57.70], [11.94, 57.72]]), PurposePicker(),
+                              TransportationTypePicker(["tram", "ferry", "bus"]), clock=clock)
+
+    @parameterized.expand([('UTC',), ('Europe/Stockholm',), ('Asia/Kolkata',), ('America/St_Johns',),
+                           ('Africa/Monrovia',)])
+    def test_formatter_matches_datetime(self, timezone):
+        os.environ['TZ'] = timezone
+        time.tzset()
+        # a year around both transitions of daylight saving time, and the 1970s with a historic offset in Monrovia
+        seconds = np.concatenate([np.random.randint(START, START + 366 * 86400, 20000),
+                                  np.arange(1585443600 - 7200, 1585443600 + 7200, 7),
+                                  np.random.randint(0, 100000000, 2000)])
+        formatter = DepartureFormatter()
+        expected = [str(datetime.fromtimestamp(value)) for value in seconds.tolist()]
+        self.assertListEqual(formatter.format_many(seconds), expected)
+        self.assertListEqual([formatter.format(value) for value in seconds[:500].tolist()], expected[:500])
+
+    def test_system_clock_reads_once_per_batch(self):
+        before = int(time.time())
+        issuance = SystemClock().ticks(100)
+        self.assertTrue(before <= issuance <= time.time())
+        batch = self.creator().create_batch(100)
+        self.assertEqual(len(set(batch.issuance.tolist())), 1)
+        self.assertTrue(np.all(batch.departures <= batch.issuance))
+
+    def test_simulated_interval(self):
+        clock = SimulatedClock(START, START + 100, interval=10)
+        self.assertEqual(clock.tick(), START + 10)
+        np.testing.assert_array_equal(clock.ticks(5), START + np.arange(20, 70, 10))
+        np.testing.assert_array_equal(clock.ticks(5), [START + 70, START + 80, START + 90])
+        self.assertIsNone(clock.tick())
+        self.assertEqual(len(clock.ticks(5)), 0)
+
+    def test_simulated_rate(self):
+        clock = SimulatedClock(START, START + 30)
+        # 1 msg/s for ten seconds, then 10 msg/s
+        clock.pace(RateScheduler(StepRate([(0, 1), (10, 10)]), clock=clock.monotonic, sleep=clock.sleep))
+        issuances = clock.ticks(1000)
+        self.assertEqual(len(issuances), 10 + 200)
+        self.assertEqual(np.count_nonzero(issuances < START + 10), 10)
+
+    def test_invalid_simulations(self):
+        with self.assertRaises(ValueError):
+            SimulatedClock(START, START)
+        with self.assertRaises(ValueError):
+            SimulatedClock(START, interval=0)
+
+    def test_requests_follow_the_simulated_clock(self):
+        creator = self.creator(SimulatedClock(START, START + 3600 * 24, interval=60))
+        request = creator.create_random_request(max_offset_days=1, shift=0)
+        self.assertEqual(request.issuance, START + 60)
+        departure = datetime.strptime(request.departure, '%Y-%m-%d %H:%M:%S').timestamp()
+        self.assertTrue(START + 60 - 86400 <= departure <= START + 60)
+
+        batch = creator.create_batch(2000, max_offset_days=1)
+        self.assertEqual(len(batch), 24 * 60 - 2)
+        self.assertEqual(len(batch.to_json_list()), len(batch))
+        np.testing.assert_array_equal(np.diff(batch.issuance), 60)
+        self.assertTrue(np.all((batch.departures <= batch.issuance) & (batch.departures >= batch.issuance - 86400)))
+        self.assertIsNone(creator.create_random_request())
+        self.assertEqual(len(creator.create_batch(10)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
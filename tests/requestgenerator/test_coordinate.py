@@ -18,6 +18,12 @@ class TestCoordinate(unittest.TestCase):
         self.assertEqual(test_coord.coordinate['longitude'], expected_longitude)
         self.assertEqual(test_coord.coordinate['latitude'], expected_latitude)
 
+    def test_clone(self):
+        coordinate = Coordinate(57.7, 11.97)
+        clone = coordinate.clone(offset_long=0.5, offset_lat=-0.25)
+        self.assertEqual(clone.to_tuple(), [57.45, 12.47])
+        self.assertEqual(coordinate.to_tuple(), [57.7, 11.97])
+
 
 if __name__ == '__main__':
     unittest.main()
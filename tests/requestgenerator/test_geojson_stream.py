@@ -0,0 +1,107 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+from parameterized import parameterized
+from geojson_stream import iter_features, geometry_centroid
+from seed_cache import read_geojson_seeds
+from overpass_handler import BUS_FILE
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+class TestGeojsonStream(unittest.TestCase):
+    """Unit tests for streaming seeds out of GeoJSON files."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'features.geojson')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, collection, indent=None):
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump(collection, f, indent=indent)
+
+    @parameterized.expand([(7, None), (7, 2), (64, 4), (1 << 20, None)])
+    def test_iter_features_matches_json_load(self, chunk_size, indent):
+        features = [{"type": "Feature", "properties": {"name": "Stop å {0}".format(i), "ref": "A"},
+                     "geometry": {"type": "Point", "coordinates": [11.9 + i / 1000.0, 57.7 - i / 3000.0]}}
+                    for i in range(50)]
+        # other members before and after the features are skipped
+        self.write({"type": "FeatureCollection", "copyright": "ODbL, see \"features\": [", "bbox": [1, 2, 3, 4],
+                    "features": features, "timestamp": "2019-11-10T23:11:02Z"}, indent)
+        self.assertListEqual(list(iter_features(self.filename, chunk_size)), features)
+
+    def test_empty_and_invalid_collections(self):
+        self.write({"type": "FeatureCollection", "features": []})
+        self.assertListEqual(list(iter_features(self.filename)), [])
+
+        with open(self.filename, 'w') as f:
+            f.write('{"features": [{"type": "Feature", "geometry": ')
+        with self.assertRaises(ValueError):
+            list(iter_features(self.filename, 8))
+
+    @parameterized.expand([
+        ({"type": "Point", "coordinates": [11.5, 57.5, 20.0]}, (11.5, 57.5)),
+        ({"type": "LineString", "coordinates": [[11.0, 57.0], [12.0, 58.0]]}, (11.5, 57.5)),
+        ({"type": "MultiPoint", "coordinates": [[11.0, 57.0], [12.0, 57.0], [13.0, 57.0]]}, (12.0, 57.0)),
+        ({"type": "MultiLineString", "coordinates": [[[11.0, 57.0]], [[12.0, 58.0]]]}, (11.5, 57.5)),
+        ({"type": "Polygon", "coordinates": [square(11.0, 57.0, 0.002), square(11.0, 57.0, 0.001)]},
+         (11.001, 57.001)),
+        ({"type": "MultiPolygon", "coordinates": [[square(11.0, 57.0, 0.003)], [square(12.0, 57.0, 0.001)]]},
+         (11.0015 * 0.9 + 12.0005 * 0.1, 57.0015 * 0.9 + 57.0005 * 0.1)),
+        ({"type": "Polygon", "coordinates": [[[11.0, 57.0], [11.0, 57.0], [11.0, 57.0]]]}, (11.0, 57.0)),
+        ({"type": "GeometryCollection", "geometries": [{"type": "Point", "coordinates": [11.0, 57.0]},
+                                                       {"type": "Point", "coordinates": [12.0, 58.0]}]},
+         (11.5, 57.5)),
+    ])
+    def test_geometry_centroid(self, geometry, expected):
+        centroid = geometry_centroid(geometry)
+        self.assertAlmostEqual(centroid[0], expected[0], places=9)
+        self.assertAlmostEqual(centroid[1], expected[1], places=9)
+
+    @parameterized.expand([(None,), ({"type": "Point", "coordinates": []},), ({"type": "Polygon", "coordinates": []},)])
+    def test_empty_geometries(self, geometry):
+        self.assertIsNone(geometry_centroid(geometry))
+
+    def test_unknown_geometry(self):
+        with self.assertRaises(ValueError):
+            geometry_centroid({"type": "Circle", "coordinates": [1, 2]})
+
+    def test_read_bus_stops(self):
+        with open(BUS_FILE, encoding='utf-8') as f:
+            features = json.load(f)['features']
+        seeds = read_geojson_seeds(BUS_FILE, chunk_size=4096)
+        np.testing.assert_array_equal(seeds.coordinates, [feature['geometry']['coordinates'] for feature in features])
+        self.assertEqual(seeds.names[0], features[0]['properties']['name'])
+
+    def test_limit_is_a_uniform_sample(self):
+        features = [{"type": "Feature", "properties": {"name": str(i)},
+                     "geometry": {"type": "Point", "coordinates": [float(i), 0.0]}} for i in range(10)]
+        features.append({"type": "Feature", "properties": {}, "geometry": None})
+        self.write({"type": "FeatureCollection", "features": features})
+
+        random.seed(16)
+        counts = Counter()
+        for _ in range(2000):
+            seeds = read_geojson_seeds(self.filename, limit=3)
+            self.assertEqual(len(seeds), 3)
+            np.testing.assert_array_equal(seeds.coordinates[:, 0], [int(name) for name in seeds.names])
+            counts.update(seeds.names.tolist())
+        # every feature is kept with probability 3/10
+        self.assertEqual(len(counts), 10)
+        for count in counts.values():
+            self.assertAlmostEqual(count / 2000, 0.3, delta=0.05)
+
+        self.assertEqual(len(read_geojson_seeds(self.filename, limit=100)), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
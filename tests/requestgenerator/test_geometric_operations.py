@@ -1,5 +1,7 @@
 import math
 import unittest
+import numpy as np
+import geopy.distance
 import geometric_operations
 from travel_request import Coordinate
 from parameterized import parameterized
@@ -22,16 +24,31 @@ class TestGeometricOperations(unittest.TestCase):
                                delta=1e-10)
 
     @parameterized.expand([
-        ["gbg", Coordinate(11, 52), 500, 0.001, 1e-1]
+        ["gbg_north", 57.7, 11.97, 0.1, 500, 0.06],
+        ["gbg_east", 57.7, 11.97, math.pi / 2, 500, 0.06],
+        ["gbg_southwest", 57.7, 11.97, 5 / 4 * math.pi, 5000, 3.1],
+        ["equator_west", 0.5, -20, 3 / 2 * math.pi, 450, 0.06],
+        ["north_cape", 70, 25.8, 2.3, 500, 0.06],
     ])
-    def test_approximate_longitude(self, name, location, desired_x_dist, precision=0.001, delta=5e-1):
-
-        longitude_offset, error = geometric_operations.approximate_longitude(desired_x_dist, location)
-        self.assertLessEqual(error, precision, f"Error should be less than {precision}")
-
-        actual_x_dist = geometric_operations.calc_distance(location, location.clone(offset_long=longitude_offset)).m
-        self.assertAlmostEqual(desired_x_dist, actual_x_dist,
-                               msg="The actual distance and calculated distance should be about the same", delta=delta)
+    def test_shift_coordinates_matches_geodesic(self, name, lat, long, angle, distance, max_error):
+        expected = geopy.distance.geodesic(meters=distance).destination((lat, long), math.degrees(angle))
+        actual_lat, actual_long = geometric_operations.shift_coordinates(lat, long, angle, distance)
+
+        error = geopy.distance.geodesic((actual_lat, actual_long), (expected.latitude, expected.longitude)).m
+        self.assertLess(error, max_error, "Shift should stay within the documented error of the geodesic result")
+
+    def test_shift_coordinates_vectorized(self):
+        latitudes = np.array([57.7, 57.8, 12.1])
+        longitudes = np.array([11.9, 12.0, 50.3])
+        angles = np.array([0.3, 2.5, 4.2])
+        distances = np.array([10, 250, 499.9])
+
+        shifted_lat, shifted_long = geometric_operations.shift_coordinates(latitudes, longitudes, angles, distances)
+        for i in range(len(latitudes)):
+            single = geometric_operations.shift_coordinate(Coordinate(latitudes[i], longitudes[i]), angles[i],
+                                                           distances[i])
+            self.assertAlmostEqual(single.coordinate['latitude'], shifted_lat[i], delta=1e-12)
+            self.assertAlmostEqual(single.coordinate['longitude'], shifted_long[i], delta=1e-12)
 
 
 if __name__ == '__main__':
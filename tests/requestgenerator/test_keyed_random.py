@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+from parameterized import parameterized
+from keyed_random import KeyedRandom, DRAWS_PER_REQUEST, MAX_SPREAD
+from spatial_index import UniformTripLength, ExponentialTripLength, LogNormalTripLength
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, DestinationPicker, PurposePicker, \
+    TransportationTypePicker
+from clock import SimulatedClock
+
+COORDINATES = [[11.97, 57.70], [11.94, 57.72], [12.01, 57.68], [11.90, 57.75]]
+
+
+def create_creator(id_tracker, seed=7, start=1577836800, interval=1.0, destinations=False):
+    destination_picker = DestinationPicker(COORDINATES, ExponentialTripLength(3000)) if destinations else None
+    return RequestCreator(id_tracker, [42, 43], CoordinatePicker(COORDINATES), PurposePicker(),
+                          TransportationTypePicker(["tram", "ferry", "bus"]), destination_picker=destination_picker,
+                          clock=SimulatedClock(start, interval=interval), keyed_random=KeyedRandom(seed, 42))
+
+
+class TestKeyedRandom(unittest.TestCase):
+    """Unit tests for the random numbers keyed on the request id."""
+
+    @parameterized.expand([
+        ["consecutive", list(range(1, 101))],
+        ["striped", list(range(3, 400, 4))],
+        ["spread", [5, 10 ** 9, 17]],
+    ])
+    def test_any_order_gives_the_same_numbers(self, name, request_ids):
+        keyed = KeyedRandom(1, 42)
+        uniforms = keyed.uniforms(request_ids)
+        self.assertTupleEqual(uniforms.shape, (len(request_ids), DRAWS_PER_REQUEST))
+        np.testing.assert_array_equal(keyed.uniforms(request_ids[::-1]), uniforms[::-1])
+        np.testing.assert_array_equal(keyed.uniforms(request_ids[-1:]), uniforms[-1:])
+        self.assertTrue(np.all((uniforms >= 0) & (uniforms < 1)))
+
+    def test_far_ids_are_read_one_by_one(self):
+        keyed = KeyedRandom(1)
+        request_ids = [1, 2 * MAX_SPREAD + 10]
+        np.testing.assert_array_equal(keyed.uniforms(request_ids), np.concatenate(
+            [keyed.uniforms([request_id]) for request_id in request_ids]))
+
+    def test_keys_differ(self):
+        uniforms = KeyedRandom(1, 42).uniforms([1])
+        self.assertFalse(np.array_equal(uniforms, KeyedRandom(2, 42).uniforms([1])))
+        self.assertFalse(np.array_equal(uniforms, KeyedRandom(1, 43).uniforms([1])))
+
+    def test_negative_ids(self):
+        with self.assertRaises(ValueError):
+            KeyedRandom(1).uniforms([-1, 2])
+
+    @parameterized.expand([
+        ["independent", False],
+        ["paired", True],
+    ])
+    def test_single_requests_match_the_batch(self, name, destinations):
+        batch = create_creator(IdTracker(), destinations=destinations).create_batch(20).to_requests()
+        creator = create_creator(IdTracker(), destinations=destinations)
+        singles = [creator.create_random_request() for _ in range(20)]
+        self.assertListEqual([request.to_json() for request in singles], [request.to_json() for request in batch])
+
+    def test_workers_create_the_requests_of_a_single_process(self):
+        single = create_creator(IdTracker()).create_batch(12).to_requests()
+        striped = []
+        for worker in range(3):
+            creator = create_creator(IdTracker(worker + 1, 3), start=1577836800 + worker - 2, interval=3.0)
+            striped += creator.create_batch(4).to_requests()
+        striped.sort(key=lambda request: request.request_id)
+        self.assertListEqual([request.to_json() for request in striped], [request.to_json() for request in single])
+
+    def test_request_is_regenerated_from_its_id(self):
+        requests = create_creator(IdTracker()).create_batch(50).to_requests()
+        regenerated = create_creator(IdTracker(37), start=1577836800 + 36).create_batch(1).to_requests()[0]
+        self.assertEqual(regenerated.to_json(), requests[36].to_json())
+
+    def test_trip_lengths_from_uniforms(self):
+        uniforms = np.array([[0.0, 0.0], [0.5, 0.25], [0.75, 0.5]])
+        np.testing.assert_allclose(UniformTripLength(100, 300).from_uniforms(uniforms), [100, 200, 250])
+        np.testing.assert_allclose(ExponentialTripLength(1000).from_uniforms(uniforms),
+                                   [0, 1000 * np.log(2), 1000 * np.log(4)])
+        np.testing.assert_allclose(LogNormalTripLength(2000, 0.8).from_uniforms(uniforms),
+                                   [2000, 2000, 2000 * np.exp(-0.8 * np.sqrt(2 * np.log(4)))])
+
+
+if __name__ == '__main__':
+    unittest.main()
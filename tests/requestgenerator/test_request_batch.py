@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker
+
+
+class TestRequestBatch(unittest.TestCase):
+    """Unit tests for the columnar batch generation of travel requests."""
+
+    def setUp(self):
+        coordinates = [[11.97, 57.70], [11.94, 57.72], [12.01, 57.68]]
+        self.creator = RequestCreator(IdTracker(), [42, 43], CoordinatePicker(coordinates), PurposePicker(),
+                                      TransportationTypePicker(["tram", "ferry", "bus"], [0.2, 0.05, 0.75]))
+
+    def test_create_batch_fields(self):
+        batch = self.creator.create_batch(500, uncertainty_distance=300)
+
+        self.assertEqual(len(batch), 500)
+        np.testing.assert_array_equal(batch.request_ids, np.arange(1, 501))
+        self.assertTrue(set(batch.device_ids.tolist()) <= {42, 43})
+        self.assertTrue(np.all((batch.origin_latitudes > 57.6) & (batch.origin_latitudes < 57.8)))
+        self.assertTrue(np.all(batch.purposes < len(batch.purpose_labels)))
+        self.assertEqual(self.creator.id_tracker.next(), 501, "Batches should reserve their ids")
+
+    def test_json_matches_travel_requests(self):
+        batch = self.creator.create_batch(50)
+        requests = batch.to_requests()
+        self.assertListEqual(batch.to_json_list(), [request.to_json() for request in requests])
+        self.assertListEqual(batch.to_json_list(pretty=True), [request.to_json(pretty=True) for request in requests])
+        self.assertListEqual(batch.to_numbered_lines(), [request.to_numbered_line() for request in requests])
+
+
+if __name__ == '__main__':
+    unittest.main()
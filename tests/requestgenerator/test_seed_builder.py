@@ -0,0 +1,163 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import numpy as np
+from parameterized import parameterized
+from seed_builder import compile_query, query_tag_filters, tags_match, read_offline_features, build_seeds, \
+    QueryCache, QUERY_FILE
+from seed_cache import SeedCache
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="57.70" lon="11.97"><tag k="highway" v="bus_stop"/><tag k="name" v="Brunnsparken"/></node>
+  <node id="2" lat="57.72" lon="11.94"/>
+  <node id="3" lat="57.74" lon="11.96"/>
+  <node id="4" lat="58.50" lon="13.00"><tag k="highway" v="bus_stop"/><tag k="name" v="Far away"/></node>
+  <node id="5" lat="57.71" lon="11.98"><tag k="amenity" v="bench"/></node>
+  <way id="10"><nd ref="2"/><nd ref="3"/><tag k="highway" v="bus_stop"/><tag k="ref" v="B"/></way>
+  <relation id="20"><member type="node" ref="1" role=""/><tag k="highway" v="bus_stop"/></relation>
+</osm>
+"""
+
+OVERPASS_RESPONSE = {
+    "osm3s": {"timestamp_osm_base": "2019-11-10T23:11:02Z"},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 57.70, "lon": 11.97, "tags": {"highway": "bus_stop", "name": "Brunnsparken"}},
+        {"type": "way", "id": 10, "center": {"lat": 57.73, "lon": 11.95}, "nodes": [2, 3],
+         "tags": {"highway": "bus_stop", "ref": "B"}},
+        {"type": "node", "id": 2, "lat": 57.72, "lon": 11.94},
+    ]
+}
+
+
+class FakeOverpass(BaseHTTPRequestHandler):
+    queries = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        FakeOverpass.queries.append(urllib.parse.parse_qs(body)['data'][0])
+        payload = json.dumps(OVERPASS_RESPONSE).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSeedBuilder(unittest.TestCase):
+    """Unit tests for building seed files from Overpass queries and offline extracts."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, 'stops.geojson')
+        self.cache = QueryCache(os.path.join(self.directory.name, 'overpass'))
+        self.seed_cache = SeedCache(os.path.join(self.directory.name, 'seeds'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content, opener=open):
+        filename = os.path.join(self.directory.name, name)
+        with opener(filename, 'wt', encoding='utf-8') as f:
+            f.write(content)
+        return filename
+
+    def read_output(self):
+        with open(self.output, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_compile_shipped_query(self):
+        query = compile_query(QUERY_FILE.read_text(encoding='utf-8'), area='Malmö', date='2019-11-10T23:11:02Z')
+        self.assertTrue(query.startswith('[out:json][date:"2019-11-10T23:11:02Z"][timeout:25];'))
+        self.assertIn('area["name"="Malmö"]["boundary"="administrative"]->.searchArea;', query)
+        self.assertIn('out body center;', query)
+        self.assertNotIn('skel', query)
+        self.assertNotIn('{{', query)
+        self.assertNotIn('Göteborg', query)  # comments are removed too
+
+    def test_compile_bbox(self):
+        self.assertEqual(compile_query('node["amenity"="bench"]({{bbox}});\nout;', bbox=(57.6, 11.8, 57.8, 12.1)),
+                         '[out:json];\nnode["amenity"="bench"](57.6,11.8,57.8,12.1);\nout center;\n')
+        with self.assertRaises(ValueError):
+            compile_query('node({{bbox}});out;')
+        with self.assertRaises(ValueError):
+            compile_query('node({{center}});out;')
+
+    @parameterized.expand([
+        ({"highway": "bus_stop"}, True),
+        ({"highway": "bus_stop", "shelter": "no"}, False),
+        ({"public_transport": "platform", "bus": "yes"}, True),
+        ({"public_transport": "platform", "tram": "yes"}, False),
+        ({"railway": "tram_stop"}, True),
+        ({"amenity": "bench"}, False),
+    ])
+    def test_tag_filters(self, tags, expected):
+        query = ('(node["highway"="bus_stop"]["shelter"!="no"];way[public_transport=platform][bus];'
+                 'nwr["railway"~"^tram_"];);out;')
+        self.assertEqual(tags_match(tags, query_tag_filters(query)), expected)
+
+    @parameterized.expand([('extract.osm', open), ('extract.osm.gz', gzip.open)])
+    def test_osm_xml(self, name, opener):
+        filename = self.write(name, OSM_XML, opener)
+        query = compile_query(QUERY_FILE.read_text(encoding='utf-8'))
+        features = list(read_offline_features(filename, query_tag_filters(query), (57.0, 11.0, 58.0, 12.5)))
+
+        self.assertListEqual([feature['properties'] for feature in features],
+                             [{'@id': 'node/1', 'name': 'Brunnsparken'}, {'@id': 'way/10', 'ref': 'B'}])
+        np.testing.assert_allclose(features[1]['geometry']['coordinates'], [11.95, 57.73])
+
+    def test_offline_overpass_json(self):
+        filename = self.write('export.json', json.dumps(OVERPASS_RESPONSE))
+        count = build_seeds(self.output, input_file=filename, cache=self.cache, seed_cache=self.seed_cache)
+        self.assertEqual(count, 2)
+        self.assertListEqual([feature['geometry']['coordinates'] for feature in self.read_output()['features']],
+                             [[11.97, 57.70], [11.95, 57.73]])
+
+    def test_pbf_is_rejected(self):
+        with self.assertRaises(ValueError):
+            read_offline_features(os.path.join(self.directory.name, 'sweden.osm.pbf'))
+
+    def test_fetch_once_per_query_and_date(self):
+        server = HTTPServer(('127.0.0.1', 0), FakeOverpass)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        endpoint = 'http://127.0.0.1:{0}/api/interpreter'.format(server.server_port)
+        FakeOverpass.queries = []
+        try:
+            for _ in range(2):
+                count = build_seeds(self.output, area='Malmö', date='2019-11-10T23:11:02Z', endpoint=endpoint,
+                                    cache=self.cache, seed_cache=self.seed_cache)
+            build_seeds(self.output, area='Lund', endpoint=endpoint, cache=self.cache, seed_cache=self.seed_cache)
+            build_seeds(self.output, area='Lund', endpoint=endpoint, cache=self.cache, seed_cache=self.seed_cache,
+                        refresh=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(count, 2)
+        self.assertEqual(len(FakeOverpass.queries), 3)
+        self.assertIn('"Malmö"', FakeOverpass.queries[0])
+        collection = self.read_output()
+        self.assertEqual(collection['timestamp'], '2019-11-10T23:11:02Z')
+        self.assertEqual(collection['features'][0]['properties']['name'], 'Brunnsparken')
+
+    def test_undated_results_expire(self):
+        cached = self.cache.put('query', 'latest', {'type': 'FeatureCollection', 'features': []})
+        self.assertEqual(self.cache.get('query', 'latest'), cached)
+        os.utime(cached, (0, 0))
+        self.assertIsNone(self.cache.get('query', 'latest'))
+        self.cache.put('query', 'date:2019-11-10', {'type': 'FeatureCollection', 'features': []})
+        os.utime(self.cache.filename('query', 'date:2019-11-10'), (0, 0))
+        self.assertIsNotNone(self.cache.get('query', 'date:2019-11-10'))
+
+
+if __name__ == '__main__':
+    unittest.main()
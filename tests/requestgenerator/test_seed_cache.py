@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import seed_cache
+from seed_cache import SeedCache, Seeds, file_digest, read_geojson_seeds
+from overpass_handler import OverpassHandler
+
+
+def write_features(filename, coordinates):
+    features = [{"type": "Feature", "properties": {"name": "Stop {0}".format(i), "ref": chr(65 + i % 26)},
+                 "geometry": {"type": "Point", "coordinates": list(coordinate)}}
+                for i, coordinate in enumerate(coordinates)]
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+class TestSeedCache(unittest.TestCase):
+    """Unit tests for the compiled seed cache."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, 'stops.geojson')
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        self.coordinates = [[11.97, 57.70], [11.94, 57.72], [12.01, 57.68]]
+        write_features(self.source, self.coordinates)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_geojson_seeds(self):
+        seeds = read_geojson_seeds(self.source)
+        np.testing.assert_array_equal(seeds.coordinates, self.coordinates)
+        self.assertListEqual(seeds.names.tolist(), ["Stop 0", "Stop 1", "Stop 2"])
+        self.assertListEqual(seeds.refs.tolist(), ["A", "B", "C"])
+
+    def test_second_load_is_memory_mapped(self):
+        cache = SeedCache(self.cache_dir)
+        first = cache.load(self.source)
+        second = cache.load(self.source, labels=True)
+
+        self.assertIsInstance(second.coordinates, np.memmap)
+        np.testing.assert_array_equal(first.coordinates, self.coordinates)
+        np.testing.assert_array_equal(second.coordinates, self.coordinates)
+        self.assertEqual(second.names[1], "Stop 1")
+        with self.assertRaises(ValueError):
+            second.coordinates[0, 0] = 0  # shared pages are read-only
+
+    def test_labels_keep_their_length(self):
+        names = ["", "Brunnsparken", "Järntorget", "Stop"]
+        with open(self.source, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "properties": {"name": name}, "geometry": {"type": "Point", "coordinates": [i, i]}}
+                for i, name in enumerate(names)]}, f)
+        with mock.patch.object(seed_cache, 'SPOOL_SIZE', 3):  # compiled in several pieces
+            seeds = SeedCache(self.cache_dir).load(self.source, labels=True)
+
+        self.assertEqual(seeds.names.dtype, object)
+        self.assertListEqual(seeds.names.tolist(), names)
+        self.assertListEqual(seeds.refs.tolist(), [""] * 4)
+        np.testing.assert_array_equal(seeds.coordinates, [[i, i] for i in range(4)])
+        self.assertEqual(read_geojson_seeds(self.source).names.dtype, object)
+
+    def test_changed_source_is_compiled_again(self):
+        cache = SeedCache(self.cache_dir)
+        old_digest = cache.digest_of(self.source)
+        cache.load(self.source)
+
+        write_features(self.source, self.coordinates[:2])
+        os.utime(self.source, ns=(0, 0))  # make sure the modification time differs
+        seeds = cache.load(self.source)
+
+        self.assertNotEqual(cache.digest_of(self.source), old_digest)
+        self.assertEqual(cache.digest_of(self.source), file_digest(self.source))
+        self.assertEqual(len(seeds), 2)
+
+    def test_unwritable_cache_falls_back_to_parsing(self):
+        blocker = os.path.join(self.directory.name, 'blocker')
+        with open(blocker, 'w'):
+            pass
+        with self.assertWarns(UserWarning):
+            seeds = SeedCache(os.path.join(blocker, 'cache')).load(self.source)
+        np.testing.assert_array_equal(seeds.coordinates, self.coordinates)
+
+    def test_missing_source(self):
+        with self.assertRaises(OSError):
+            SeedCache(self.cache_dir).load(os.path.join(self.directory.name, 'missing.geojson'))
+
+    def test_sample(self):
+        seeds = Seeds(np.arange(20, dtype=float).reshape(10, 2), np.array(list("abcdefghij")))
+        limited = seeds.sample(4)
+        self.assertEqual(len(limited), 4)
+        self.assertEqual(len(set(limited.names.tolist())), 4)
+        np.testing.assert_array_equal(limited.coordinates[:, 0] / 2, [ord(n) - 97 for n in limited.names])
+        self.assertIs(seeds.sample(None), seeds)
+
+    def test_overpass_handler_uses_cache(self):
+        handler = OverpassHandler(self.source, cache_dir=self.cache_dir)
+        np.testing.assert_array_equal(handler.get_coordinates(), self.coordinates)
+        self.assertTrue(any(name.endswith('.coordinates.npy') for name in os.listdir(self.cache_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from parameterized import parameterized
+from seed_weights import DensityWeights, PropertyWeights, CsvWeights, parse_weights, compute_weights
+from seed_cache import SeedCache
+from overpass_handler import OverpassHandler, CoordinatePicker
+
+
+class TestSeedWeights(unittest.TestCase):
+    """Unit tests for weighting the seeds by their metadata."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, 'stops.geojson')
+        self.cache = SeedCache(os.path.join(self.directory.name, 'cache'))
+        # three stop positions at a hub and a lonely suburban stop, a feature without geometry in between
+        features = [
+            {"type": "Feature", "properties": {"name": "Centralstationen", "ref": "A", "tram": "yes",
+                                               "route_ref": "1;6;11", "boardings": "900"},
+             "geometry": {"type": "Point", "coordinates": [11.9730, 57.7090]}},
+            {"type": "Feature", "properties": {"name": "Centralstationen", "ref": "B", "boardings": "700"},
+             "geometry": {"type": "Point", "coordinates": [11.9734, 57.7092]}},
+            {"type": "Feature", "properties": {"name": "Broken"}, "geometry": None},
+            {"type": "Feature", "properties": {"name": "Nils Ericsonplatsen", "ref": "C", "route_ref": "16"},
+             "geometry": {"type": "Point", "coordinates": [11.9740, 57.7095]}},
+            {"type": "Feature", "properties": {"name": "Kobbegårdsvägen", "ref": "A", "boardings": "x"},
+             "geometry": {"type": "Point", "coordinates": [11.9000, 57.6500]}},
+        ]
+        with open(self.source, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        self.seeds = self.cache.load(self.source, labels=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_density(self):
+        np.testing.assert_array_equal(DensityWeights(200).compute(self.source, self.seeds), [3, 3, 3, 1])
+        np.testing.assert_array_equal(DensityWeights(40).compute(self.source, self.seeds), [2, 2, 1, 1])
+
+    @parameterized.expand([
+        ('property:boardings', [900, 700, 1, 1]),
+        ('property:route_ref:count', [3, 0, 1, 0]),
+        ('property:tram:yes=3', [3, 1, 1, 1]),
+        ('property:name:Centralstationen=5,*=0.5', [5, 5, 0.5, 0.5]),
+    ])
+    def test_properties(self, rule, expected):
+        np.testing.assert_array_equal(parse_weights(rule).compute(self.source, self.seeds), expected)
+
+    def test_csv(self):
+        filename = os.path.join(self.directory.name, 'boardings.csv')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("stop,boardings\nCentralstationen,1000\nC,250\n")
+        np.testing.assert_array_equal(CsvWeights(filename).compute(self.source, self.seeds), [1000, 1000, 250, 1])
+        np.testing.assert_array_equal(parse_weights('csv:{0}:0'.format(filename)).compute(self.source, self.seeds),
+                                      [1000, 1000, 250, 0])
+
+    @parameterized.expand([('density:0',), ('density:far',), ('property',), ('property:tram:yes',), ('csv',),
+                           ('weights.csv',)])
+    def test_invalid_rules(self, rule):
+        with self.assertRaises(ValueError):
+            parse_weights(rule)
+
+    def test_weights_are_multiplied_and_cached(self):
+        rules = [DensityWeights(200), PropertyWeights('tram', {'yes': 2.0})]
+        weights = compute_weights(self.source, self.seeds, rules, self.cache)
+        np.testing.assert_array_equal(weights, [6, 3, 3, 1])
+
+        cached = compute_weights(self.source, self.seeds, rules, self.cache)
+        self.assertIsInstance(cached, np.memmap)
+        np.testing.assert_array_equal(cached, weights)
+        # other rules are computed, not taken from the cache
+        np.testing.assert_array_equal(compute_weights(self.source, self.seeds, rules[:1], self.cache), [3, 3, 3, 1])
+
+    def test_picker_follows_weights(self):
+        rules = [PropertyWeights('name', {'Kobbegårdsvägen': 0.0, '*': 1.0})]
+        handler = OverpassHandler(self.source, cache_dir=self.cache.directory, weights=rules)
+        picker = CoordinatePicker(handler.get_coordinates(), handler.get_weights())
+        latitudes, _ = picker.pick_many_with_circular_uncertainty(1000, 0)
+        self.assertTrue(np.all(latitudes > 57.7))
+
+        limited = OverpassHandler(self.source, 2, cache_dir=self.cache.directory, weights=rules)
+        self.assertEqual(len(limited.get_weights()), 2)
+        self.assertEqual(limited.get_weights()[limited.seeds.names == 'Kobbegårdsvägen'].sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from parameterized import parameterized
+from geopy.distance import geodesic
+from spatial_index import SeedGrid, UniformTripLength, ExponentialTripLength, LogNormalTripLength, parse_trip_length
+from overpass_handler import RequestCreator, IdTracker, CoordinatePicker, PurposePicker, TransportationTypePicker, \
+    DestinationPicker
+
+
+class TestSpatialIndex(unittest.TestCase):
+    """Unit tests for the seed grid and locality-aware destinations."""
+
+    def setUp(self):
+        np.random.seed(14)
+        # clustered seeds around Gothenburg, like bus stops
+        centers = np.random.uniform([11.8, 57.6], [12.1, 57.8], (20, 2))
+        self.seeds = (centers[np.random.randint(0, 20, 2000)] + np.random.normal(0, 0.01, (2000, 2)))
+
+    def brute_force(self, grid, latitudes, longitudes):
+        queries = grid.project(latitudes, longitudes)
+        points = grid.project(self.seeds[:, 1], self.seeds[:, 0])
+        return np.argmin(((queries[:, None, :] - points[None, :, :]) ** 2).sum(axis=2), axis=1)
+
+    @parameterized.expand([(None,), (100,), (700,), (5000,)])
+    def test_nearest_matches_brute_force(self, cell_size):
+        grid = SeedGrid(self.seeds[:, 1], self.seeds[:, 0], cell_size)
+        # queries near seeds, between them and far outside the grid
+        queries = np.vstack([self.seeds[:500] + np.random.normal(0, 0.02, (500, 2)),
+                             np.random.uniform([11.0, 57.0], [13.0, 58.5], (500, 2))])
+
+        indices, distances = grid.nearest_many(queries[:, 1], queries[:, 0])
+        expected = self.brute_force(grid, queries[:, 1], queries[:, 0])
+        np.testing.assert_array_equal(indices, expected)
+        self.assertTrue(np.all(distances >= 0))
+
+    @parameterized.expand([(None, 300), (100, 300), (5000, 250), (None, 20000)])
+    def test_count_within_matches_brute_force(self, cell_size, radius):
+        grid = SeedGrid(self.seeds[:, 1], self.seeds[:, 0], cell_size)
+        queries = self.seeds[:300] + np.random.normal(0, 0.01, (300, 2))
+        counts = grid.count_within_many(queries[:, 1], queries[:, 0], radius)
+
+        points = grid.project(self.seeds[:, 1], self.seeds[:, 0])
+        distances = np.sqrt(((grid.project(queries[:, 1], queries[:, 0])[:, None, :] - points) ** 2).sum(axis=2))
+        np.testing.assert_array_equal(counts, (distances <= radius).sum(axis=1))
+
+    def test_distances_are_close_to_geodesic(self):
+        grid = SeedGrid(self.seeds[:, 1], self.seeds[:, 0])
+        index, distance = grid.nearest(57.75, 11.95)
+        seed = self.seeds[index]
+        self.assertAlmostEqual(distance, geodesic((57.75, 11.95), (seed[1], seed[0])).meters,
+                               delta=0.005 * distance + 0.5)
+
+    def test_nearest_of_seed_is_itself(self):
+        grid = SeedGrid(self.seeds[:, 1], self.seeds[:, 0])
+        indices, distances = grid.nearest_many(self.seeds[:100, 1], self.seeds[:100, 0])
+        np.testing.assert_allclose(distances, 0, atol=1e-6)
+        np.testing.assert_array_equal(self.seeds[indices], self.seeds[:100])
+
+    def test_empty_grid(self):
+        with self.assertRaises(ValueError):
+            SeedGrid([], [])
+
+    @parameterized.expand([
+        ('uniform:500:3000', UniformTripLength),
+        ('exp:1500', ExponentialTripLength),
+        ('lognormal:2000', LogNormalTripLength),
+        ('lognormal:2000:0.5', LogNormalTripLength),
+    ])
+    def test_parse_trip_length(self, spec, expected_type):
+        self.assertIsInstance(parse_trip_length(spec), expected_type)
+
+    @parameterized.expand([('uniform:500',), ('gamma:3',), ('exp:-1',), ('uniform:3000:500',), ('exp:x',)])
+    def test_parse_invalid_trip_length(self, spec):
+        with self.assertRaises(ValueError):
+            parse_trip_length(spec)
+
+    def test_destinations_follow_trip_lengths(self):
+        # a dense regular grid of seeds, so snapping hardly changes the distance
+        longitudes, latitudes = np.meshgrid(np.linspace(11.7, 12.2, 120), np.linspace(57.55, 57.85, 120))
+        seeds = np.column_stack((longitudes.ravel(), latitudes.ravel()))
+        picker = DestinationPicker(seeds, LogNormalTripLength(2000, 0.5))
+        creator = RequestCreator(IdTracker(), [1], CoordinatePicker([[11.95, 57.70]]), PurposePicker(),
+                                 TransportationTypePicker(["bus"]), destination_picker=picker)
+
+        batch = creator.create_batch(2000, uncertainty_distance=0)
+        origin = picker.grid.project(batch.origin_latitudes, batch.origin_longitudes)
+        destination = picker.grid.project(batch.destination_latitudes, batch.destination_longitudes)
+        lengths = np.sqrt(((destination - origin) ** 2).sum(axis=1))
+        self.assertAlmostEqual(np.median(lengths), 2000, delta=150)
+
+        request = creator.create_random_request(0)
+        self.assertLess(request.travelRequest['destination'].coordinate['latitude'], 57.85)
+
+
+if __name__ == '__main__':
+    unittest.main()
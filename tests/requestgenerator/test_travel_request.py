@@ -0,0 +1,56 @@
+import json
+import unittest
+from datetime import datetime
+from travel_request import TravelRequest, Coordinate, Device, TimeStamp, Purpose, TransportationType, ComplexEncoder
+
+
+class TestTravelRequest(unittest.TestCase):
+    """Unit tests for the serialization of travel requests."""
+
+    def setUp(self):
+        self.request = TravelRequest(Device(17), 4, 1577836800, Coordinate(57.70887, 11.97456),
+                                     Coordinate(57.6, 12.0), TimeStamp(datetime(2020, 1, 2, 3, 4, 5, 600)),
+                                     Purpose('work'), 'tram')
+        self.expected = {
+            'deviceId': 17,
+            'requestId': 4,
+            'issuance': 1577836800,
+            'origin': {'latitude': 57.70887, 'longitude': 11.97456},
+            'destination': {'latitude': 57.6, 'longitude': 12.0},
+            'timeOfDeparture': '2020-01-02 03:04:05',
+            'purpose': 'work',
+            'transportationType': 'tram'
+        }
+
+    def test_compact_json(self):
+        payload = self.request.to_json()
+        self.assertEqual(payload, json.dumps(self.expected, separators=(',', ':')))
+        self.assertNotIn('\n', payload)
+
+    def test_pretty_json(self):
+        self.assertEqual(self.request.to_json(pretty=True), json.dumps(self.expected, indent=4))
+
+    def test_pretty_json_matches_encoder(self):
+        self.assertEqual(self.request.to_json(pretty=True),
+                         json.dumps(self.request.repr_json(), cls=ComplexEncoder, indent=4))
+
+    def test_plain_values_and_wrappers_are_equal(self):
+        plain = TravelRequest(17, 4, 1577836800, Coordinate(57.70887, 11.97456), Coordinate(57.6, 12.0),
+                              '2020-01-02 03:04:05', 'work', TransportationType('tram'))
+        self.assertEqual(plain.to_json(), self.request.to_json())
+        self.assertEqual(plain.travelRequest['purpose'], 'work')
+        self.assertEqual(plain.travelRequest['origin'].coordinate, self.expected['origin'])
+
+    def test_no_instance_dicts(self):
+        for value in (self.request, self.request.origin, Device(1), Purpose('work'), TransportationType('bus'),
+                      TimeStamp(datetime(2020, 1, 1))):
+            self.assertFalse(hasattr(value, '__dict__'), type(value).__name__)
+
+    def test_numbered_line_reuses_payload(self):
+        self.assertEqual(self.request.to_numbered_line("{}"), "4::{}")
+        self.assertEqual(self.request.to_numbered_line(), "4::" + self.request.to_json())
+        self.assertNotIn('\n', self.request.to_numbered_line(self.request.to_json(pretty=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
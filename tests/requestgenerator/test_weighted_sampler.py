@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from weighted_sampler import WeightedSampler
+from parameterized import parameterized
+
+
+class TestWeightedSampler(unittest.TestCase):
+    """Unit tests for the shared weighted sampler."""
+
+    @parameterized.expand([
+        ["purposes", [5, 3, 1, 1]],
+        ["transportation_types", [0.2, 0.05, 0.75]],
+        ["uniform", [1, 1, 1, 1, 1, 1]],
+        ["with_zero_weight", [0, 2, 0, 6]],
+    ])
+    def test_frequencies_follow_weights(self, name, weights):
+        np.random.seed(4)
+        sampler = WeightedSampler(weights)
+
+        counts = np.bincount(sampler.pick_many(200000), minlength=len(weights))
+        expected = np.asarray(weights, dtype=float) / sum(weights)
+        np.testing.assert_allclose(counts / counts.sum(), expected, atol=5e-3)
+
+    def test_single_draws_stay_in_range(self):
+        sampler = WeightedSampler([0, 2, 0, 6])
+        picks = {sampler.pick() for _ in range(1000)}
+        self.assertSetEqual(picks, {1, 3})
+
+    def test_pick_from_uniforms_edges(self):
+        sampler = WeightedSampler([1, 1, 2])
+        np.testing.assert_array_equal(sampler.pick_from_uniforms([0.0, 0.25, 0.26, 0.5, 0.9999999]), [0, 0, 1, 1, 2])
+
+    @parameterized.expand([
+        ["empty", []],
+        ["negative", [1, -1]],
+        ["all_zero", [0, 0]],
+    ])
+    def test_invalid_weights(self, name, weights):
+        with self.assertRaises(ValueError):
+            WeightedSampler(weights)
+
+
+if __name__ == '__main__':
+    unittest.main()